@@ -0,0 +1,557 @@
+import os
+import struct
+from bisect import bisect_left, bisect_right
+from typing import List, Dict, Set, Tuple, Union, Callable, Iterable, Iterator
+
+from extendible_hashing import ReplacementPolicy, REPLACEMENT_POLICIES, read_at, write_at
+
+# The default size of a node in the node storage file, in bytes
+BPLUSTREE_NODE_SIZE: int = 4096
+
+# The node storage file starts with a header of BPLUSTREE_FILE_HEADER_SIZE bytes:
+#   magic, version, node size, root node ID, node count, first leaf ID, entry count
+BPLUSTREE_FILE_MAGIC: bytes = b"BPTX"
+BPLUSTREE_FILE_VERSION: int = 1
+BPLUSTREE_FILE_HEADER_FORMAT: str = "<4sHHIIIQ"
+BPLUSTREE_FILE_HEADER_SIZE: int = 64
+
+# Every node starts with a header: is leaf, entry count, next leaf ID (leaves only)
+BPLUSTREE_NODE_HEADER_STRUCT: struct.Struct = struct.Struct("<BHI")
+# The next leaf ID of the last leaf
+BPLUSTREE_NO_NODE: int = 0xFFFFFFFF
+
+# An entry is a (key, value) pair of unsigned 8B integers, a child pointer a 4B node ID
+BPLUSTREE_ENTRY_SIZE: int = 16
+BPLUSTREE_CHILD_SIZE: int = 4
+
+
+class BPlusTreeNode(object):
+    def __init__(self, node_id: int, is_leaf: bool, entries: List[Tuple[int, int]] = None, children: List[int] = None,
+                 next_leaf: int = BPLUSTREE_NO_NODE):
+        """BPlusTreeNode constructor.
+
+        A leaf holds sorted (key, value) entries and the ID of the next leaf.
+        An internal node holds sorted separator entries and one more child ID than separators:
+        the entries in the subtree of children[i] are at least entries[i - 1] and smaller than entries[i].
+
+        :param node_id: The (unique) ID of the node
+        :param is_leaf: Whether the node is a leaf
+        :param entries: The sorted (key, value) entries or separators
+        :param children: The child IDs of an internal node
+        :param next_leaf: The ID of the next leaf, for a leaf
+        """
+        self.node_id: int = node_id
+        self.is_leaf: bool = is_leaf
+        self.entries: List[Tuple[int, int]] = [] if entries is None else entries
+        self.children: List[int] = [] if children is None else children
+        self.next_leaf: int = next_leaf
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return f"BPlusTreeNode({self.node_id}, leaf={self.is_leaf}, entries={self.entries}, children={self.children})"
+
+    def pack_into(self, buffer: bytearray, offset: int) -> None:
+        """Write the node into a buffer.
+
+        :param buffer: The buffer to write into, large enough to hold the node size at *offset*
+        :param offset: The offset in the buffer to write the node at
+        """
+        count: int = len(self.entries)
+        BPLUSTREE_NODE_HEADER_STRUCT.pack_into(buffer, offset, int(self.is_leaf), count, self.next_leaf)
+        offset += BPLUSTREE_NODE_HEADER_STRUCT.size
+        struct.pack_into(f"<{2 * count}Q", buffer, offset, *[number for entry in self.entries for number in entry])
+        if not self.is_leaf:
+            struct.pack_into(f"<{count + 1}I", buffer, offset + count * BPLUSTREE_ENTRY_SIZE, *self.children)
+
+    @classmethod
+    def from_bytes(cls, node_id: int, byte_data: bytes) -> "BPlusTreeNode":
+        """Reconstruct a node that was written with BPlusTreeNode.pack_into.
+
+        :param node_id: The ID of the node
+        :param byte_data: The bytes of the node
+        :return: The node
+        """
+        is_leaf, count, next_leaf = BPLUSTREE_NODE_HEADER_STRUCT.unpack_from(byte_data, 0)
+        offset: int = BPLUSTREE_NODE_HEADER_STRUCT.size
+        numbers: Tuple[int, ...] = struct.unpack_from(f"<{2 * count}Q", byte_data, offset)
+        entries: List[Tuple[int, int]] = list(zip(numbers[0::2], numbers[1::2]))
+        children: List[int] = []
+        if not is_leaf:
+            children = list(struct.unpack_from(f"<{count + 1}I", byte_data, offset + count * BPLUSTREE_ENTRY_SIZE))
+        return cls(node_id, bool(is_leaf), entries, children, next_leaf)
+
+
+class NodeBufferPool(object):
+    """Keeps a limited amount of B+tree nodes in memory, like the BucketBufferPool of
+    the ExtendibleHashingIndex. Only dirty nodes are written to disk when they are
+    evicted or when the pool is flushed.
+
+    A node that is modified after it was evicted is taken into memory again by
+    NodeBufferPool.add, so the tree can keep using the nodes on a root-to-leaf path
+    during a single operation.
+    """
+    def __init__(self, capacity: int, policy: ReplacementPolicy, write_node: Callable[[BPlusTreeNode], None]):
+        """NodeBufferPool constructor.
+
+        :param capacity: The maximum amount of nodes in memory
+        :param policy: The replacement policy that selects the nodes to evict
+        :param write_node: The function used to write a node to disk
+        """
+        assert capacity >= 1, "A node buffer pool must be able to hold a node"
+        self.capacity: int = capacity
+        self.policy: ReplacementPolicy = policy
+        self.write_node: Callable[[BPlusTreeNode], None] = write_node
+
+        self.nodes: Dict[int, BPlusTreeNode] = dict()
+        self.dirty_node_ids: Set[int] = set()
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, node_id: int):
+        return node_id in self.nodes
+
+    def get(self, node_id: int) -> Union[BPlusTreeNode, None]:
+        """Get a node that is in memory, and record the access.
+
+        :param node_id: The ID of the node
+        :return: The node, None if it is not in memory
+        """
+        node: Union[BPlusTreeNode, None] = self.nodes.get(node_id)
+        if node is not None:
+            self.policy.access(node_id)
+        return node
+
+    def add(self, node: BPlusTreeNode, dirty: bool) -> None:
+        """Take a node into memory, evicting another node if the pool is full.
+        If the node is already in memory, only its access (and dirty bit) is recorded.
+
+        :param node: The node
+        :param dirty: Whether the node differs from its on-disk version
+        """
+        if node.node_id in self.nodes:
+            self.policy.access(node.node_id)
+        else:
+            if len(self.nodes) >= self.capacity:
+                self.evict(self.policy.victim())
+            self.policy.admit(node.node_id)
+        self.nodes[node.node_id] = node
+        if dirty:
+            self.dirty_node_ids.add(node.node_id)
+
+    def evict(self, node_id: int) -> None:
+        """Evict a node from memory, writing it to disk first if it is dirty.
+
+        :param node_id: The ID of the node to evict
+        """
+        node: BPlusTreeNode = self.nodes.pop(node_id)
+        self.policy.remove(node_id)
+        if node_id in self.dirty_node_ids:
+            self.dirty_node_ids.remove(node_id)
+            self.write_node(node)
+
+    def flush(self) -> None:
+        """Write all dirty nodes to disk, in node ID order. The nodes stay in memory."""
+        for node_id in sorted(self.dirty_node_ids):
+            self.write_node(self.nodes[node_id])
+        self.dirty_node_ids.clear()
+
+
+class BPlusTree(object):
+    def __init__(self, filename: str, node_size: int = BPLUSTREE_NODE_SIZE, nodes_max_in_memory: int = 64,
+                 replacement_policy: Union[str, Callable[[int], ReplacementPolicy]] = "lru"):
+        """BPlusTree constructor, for an empty tree.
+        The tree maps unsigned 8B integer keys to unsigned 8B integer values. A key may occur
+        with several values (duplicate keys), the entries are ordered by (key, value).
+        The nodes are stored in a file with fixed-size node slots and kept in memory by a
+        NodeBufferPool. The tree keeps the file open until BPlusTree.close() is called.
+        An existing file with the same name is truncated.
+
+        Deletes do not rebalance the tree: a leaf may become empty, but stays in the tree.
+
+        :param filename: The file to store the nodes in
+        :param node_size: The size of a node in bytes
+        :param nodes_max_in_memory: The maximum amount of nodes kept in memory
+        :param replacement_policy: The buffer pool replacement policy, either a name
+            in REPLACEMENT_POLICIES or a ReplacementPolicy subclass
+        """
+        self.filename: str = filename
+        self.node_size: int = node_size
+        self.leaf_capacity: int = (node_size - BPLUSTREE_NODE_HEADER_STRUCT.size) // BPLUSTREE_ENTRY_SIZE
+        self.internal_capacity: int = (node_size - BPLUSTREE_NODE_HEADER_STRUCT.size - BPLUSTREE_CHILD_SIZE) // (BPLUSTREE_ENTRY_SIZE + BPLUSTREE_CHILD_SIZE)
+        assert self.leaf_capacity >= 2 and self.internal_capacity >= 2, f"A node size of {node_size}B is too small"
+
+        self.file: Union[int, None] = os.open(filename, os.O_RDWR | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+        self.nodes_max_in_memory: int = nodes_max_in_memory
+        if isinstance(replacement_policy, str):
+            replacement_policy = REPLACEMENT_POLICIES[replacement_policy]
+        self.replacement_policy: Callable[[int], ReplacementPolicy] = replacement_policy
+        self.node_pool: NodeBufferPool = NodeBufferPool(nodes_max_in_memory, replacement_policy(nodes_max_in_memory), self.write_node)
+
+        self.node_count: int = 0
+        self.entry_count: int = 0
+        root: BPlusTreeNode = self.create_node(is_leaf=True)
+        self.root_id: int = root.node_id
+        self.first_leaf_id: int = root.node_id
+        self.write_metadata()
+
+    @classmethod
+    def open(cls, filename: str, nodes_max_in_memory: int = 64,
+             replacement_policy: Union[str, Callable[[int], ReplacementPolicy]] = "lru") -> "BPlusTree":
+        """Reopen a tree from an existing node storage file, as it was at its last flush.
+        Only the header is read, the nodes are loaded when they are first needed.
+
+        :param filename: The node storage file of the tree
+        :param nodes_max_in_memory: The maximum amount of nodes kept in memory
+        :param replacement_policy: The buffer pool replacement policy
+        :return: The tree
+        """
+        tree: BPlusTree = cls.__new__(cls)
+        tree.filename = filename
+        tree.file = os.open(filename, os.O_RDWR | getattr(os, "O_BINARY", 0))
+        header: bytes = read_at(tree.file, struct.calcsize(BPLUSTREE_FILE_HEADER_FORMAT), 0)
+        magic, version, node_size, root_id, node_count, first_leaf_id, entry_count = struct.unpack(BPLUSTREE_FILE_HEADER_FORMAT, header)
+        assert magic == BPLUSTREE_FILE_MAGIC, f"'{filename}' is not a B+tree node storage file"
+        assert version == BPLUSTREE_FILE_VERSION, f"Unsupported B+tree file version {version}, expected {BPLUSTREE_FILE_VERSION}"
+
+        tree.node_size = node_size
+        tree.leaf_capacity = (node_size - BPLUSTREE_NODE_HEADER_STRUCT.size) // BPLUSTREE_ENTRY_SIZE
+        tree.internal_capacity = (node_size - BPLUSTREE_NODE_HEADER_STRUCT.size - BPLUSTREE_CHILD_SIZE) // (BPLUSTREE_ENTRY_SIZE + BPLUSTREE_CHILD_SIZE)
+        tree.nodes_max_in_memory = nodes_max_in_memory
+        if isinstance(replacement_policy, str):
+            replacement_policy = REPLACEMENT_POLICIES[replacement_policy]
+        tree.replacement_policy = replacement_policy
+        tree.node_pool = NodeBufferPool(nodes_max_in_memory, replacement_policy(nodes_max_in_memory), tree.write_node)
+        tree.node_count = node_count
+        tree.entry_count = entry_count
+        tree.root_id = root_id
+        tree.first_leaf_id = first_leaf_id
+        return tree
+
+    def __len__(self):
+        return self.entry_count
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        return self.range()
+
+    def get_node_offset(self, node_id: int) -> int:
+        return BPLUSTREE_FILE_HEADER_SIZE + node_id * self.node_size
+
+    def create_node(self, is_leaf: bool) -> BPlusTreeNode:
+        """Create a new, empty node at the end of the node storage file.
+
+        :param is_leaf: Whether the node is a leaf
+        :return: The node, in memory and dirty
+        """
+        node: BPlusTreeNode = BPlusTreeNode(self.node_count, is_leaf)
+        self.node_count += 1
+        self.node_pool.add(node, dirty=True)
+        return node
+
+    def get_node(self, node_id: int) -> BPlusTreeNode:
+        """Get a node, reading it from the node storage file if it is not in memory.
+
+        :param node_id: The ID of the node
+        :return: The node
+        """
+        node: Union[BPlusTreeNode, None] = self.node_pool.get(node_id)
+        if node is None:
+            node = BPlusTreeNode.from_bytes(node_id, read_at(self.file, self.node_size, self.get_node_offset(node_id)))
+            self.node_pool.add(node, dirty=False)
+        return node
+
+    def write_node(self, node: BPlusTreeNode) -> None:
+        buffer: bytearray = bytearray(self.node_size)
+        node.pack_into(buffer, 0)
+        write_at(self.file, bytes(buffer), self.get_node_offset(node.node_id))
+
+    def write_metadata(self) -> None:
+        """Write the header to the node storage file."""
+        header: bytes = struct.pack(BPLUSTREE_FILE_HEADER_FORMAT, BPLUSTREE_FILE_MAGIC, BPLUSTREE_FILE_VERSION, self.node_size,
+                                    self.root_id, self.node_count, self.first_leaf_id, self.entry_count)
+        write_at(self.file, header.ljust(BPLUSTREE_FILE_HEADER_SIZE, b"\0"), 0)
+
+    def find_path(self, entry: Tuple[int, int]) -> List[BPlusTreeNode]:
+        """Find the nodes from the root to the leaf that contains (or would contain) an entry.
+
+        :param entry: The (key, value) entry
+        :return: The nodes on the path, the root first and the leaf last
+        """
+        path: List[BPlusTreeNode] = [self.get_node(self.root_id)]
+        while not path[-1].is_leaf:
+            node: BPlusTreeNode = path[-1]
+            path.append(self.get_node(node.children[bisect_right(node.entries, entry)]))
+        return path
+
+    def insert(self, key: int, value: int) -> bool:
+        """Insert a (key, value) entry, splitting full nodes on the way back up.
+
+        :param key: The key
+        :param value: The value
+        :return: True if the entry was inserted, False if it was already present
+        """
+        entry: Tuple[int, int] = (key, value)
+        path: List[BPlusTreeNode] = self.find_path(entry)
+        leaf: BPlusTreeNode = path[-1]
+        position: int = bisect_left(leaf.entries, entry)
+        if position < len(leaf.entries) and leaf.entries[position] == entry:
+            return False
+        leaf.entries.insert(position, entry)
+        self.node_pool.add(leaf, dirty=True)
+        self.entry_count += 1
+
+        # split the nodes on the path that became too large, from the leaf up
+        for depth in range(len(path) - 1, -1, -1):
+            node: BPlusTreeNode = path[depth]
+            if len(node.entries) <= (self.leaf_capacity if node.is_leaf else self.internal_capacity):
+                break
+            separator, sibling = self.split(node)
+            if depth == 0:
+                root: BPlusTreeNode = self.create_node(is_leaf=False)
+                root.entries = [separator]
+                root.children = [node.node_id, sibling.node_id]
+                self.root_id = root.node_id
+            else:
+                parent: BPlusTreeNode = path[depth - 1]
+                child_position: int = parent.children.index(node.node_id)
+                parent.entries.insert(child_position, separator)
+                parent.children.insert(child_position + 1, sibling.node_id)
+                self.node_pool.add(parent, dirty=True)
+        return True
+
+    def split(self, node: BPlusTreeNode) -> Tuple[Tuple[int, int], BPlusTreeNode]:
+        """Move the upper half of a node to a new sibling node.
+
+        :param node: The node to split
+        :return: (the separator to insert in the parent, the new sibling)
+        """
+        # shrink the node before the sibling is created, as that may evict the node
+        middle: int = len(node.entries) // 2
+        if node.is_leaf:
+            upper_entries: List[Tuple[int, int]] = node.entries[middle:]
+            node.entries = node.entries[:middle]
+            sibling: BPlusTreeNode = self.create_node(is_leaf=True)
+            sibling.entries = upper_entries
+            sibling.next_leaf = node.next_leaf
+            node.next_leaf = sibling.node_id
+            separator: Tuple[int, int] = sibling.entries[0]
+        else:
+            # the middle separator moves up to the parent
+            separator = node.entries[middle]
+            upper_entries = node.entries[middle + 1:]
+            upper_children: List[int] = node.children[middle + 1:]
+            node.entries = node.entries[:middle]
+            node.children = node.children[:middle + 1]
+            sibling = self.create_node(is_leaf=False)
+            sibling.entries = upper_entries
+            sibling.children = upper_children
+        self.node_pool.add(node, dirty=True)
+        return separator, sibling
+
+    def delete(self, key: int, value: int) -> bool:
+        """Delete a (key, value) entry.
+
+        :param key: The key
+        :param value: The value
+        :return: True if the entry was deleted, False if it was not present
+        """
+        entry: Tuple[int, int] = (key, value)
+        leaf: BPlusTreeNode = self.find_path(entry)[-1]
+        position: int = bisect_left(leaf.entries, entry)
+        if position == len(leaf.entries) or leaf.entries[position] != entry:
+            return False
+        del leaf.entries[position]
+        self.node_pool.add(leaf, dirty=True)
+        self.entry_count -= 1
+        return True
+
+    def range(self, low: int = None, high: int = None) -> Iterator[Tuple[int, int]]:
+        """Iterate over the entries with a key between *low* and *high*, in (key, value) order.
+        The tree must not be modified during the iteration.
+
+        :param low: The smallest key, inclusive, None for no lower bound
+        :param high: The largest key, inclusive, None for no upper bound
+        :return: Generator of (key, value) entries
+        """
+        if low is None:
+            leaf: BPlusTreeNode = self.get_node(self.first_leaf_id)
+            position: int = 0
+        else:
+            leaf = self.find_path((low, 0))[-1]
+            position = bisect_left(leaf.entries, (low, 0))
+
+        while True:
+            for entry in leaf.entries[position:]:
+                if high is not None and entry[0] > high:
+                    return
+                yield entry
+            if leaf.next_leaf == BPLUSTREE_NO_NODE:
+                return
+            leaf = self.get_node(leaf.next_leaf)
+            position = 0
+
+    def get(self, key: int) -> List[int]:
+        """Get all values of a key.
+
+        :param key: The key
+        :return: The values, in increasing order
+        """
+        return [value for entry_key, value in self.range(key, key)]
+
+    def bulk_load(self, entries: Iterable[Tuple[int, int]], fill_factor: float = 1.0) -> None:
+        """Replace the contents of the tree by the given (key, value) entries, which must be sorted
+        by (key, value). The leaves are filled up to *fill_factor* and written sequentially, after
+        which every level of internal nodes is built on top of the previous one.
+
+        :param entries: The sorted (key, value) entries, duplicate entries are stored once
+        :param fill_factor: The fraction of every node to fill, leaving room for later inserts
+        """
+        assert 0 < fill_factor <= 1, "The fill factor must be in (0, 1]"
+        leaf_fill: int = max(1, int(self.leaf_capacity * fill_factor))
+        internal_fill: int = max(2, int(self.internal_capacity * fill_factor))
+
+        # drop the current nodes
+        self.node_pool = NodeBufferPool(self.nodes_max_in_memory, self.replacement_policy(self.nodes_max_in_memory), self.write_node)
+        os.ftruncate(self.file, BPLUSTREE_FILE_HEADER_SIZE)
+        self.node_count = 0
+        self.entry_count = 0
+
+        # write the nodes in ID order, in chunks
+        chunk: bytearray = bytearray()
+        chunk_offset: int = self.get_node_offset(0)
+
+        def append_node(node: BPlusTreeNode) -> None:
+            nonlocal chunk, chunk_offset
+            chunk += bytes(self.node_size)
+            node.pack_into(chunk, len(chunk) - self.node_size)
+            if len(chunk) >= (1 << 22):
+                write_at(self.file, bytes(chunk), chunk_offset)
+                chunk_offset += len(chunk)
+                chunk = bytearray()
+
+        # the leaves: (smallest entry, node ID) of every node of the level that was built last
+        level: List[Tuple[Tuple[int, int], int]] = []
+        leaf_entries: List[Tuple[int, int]] = []
+        previous: Union[Tuple[int, int], None] = None
+
+        def append_leaf(is_last: bool) -> None:
+            leaf: BPlusTreeNode = BPlusTreeNode(self.node_count, True, leaf_entries,
+                                                next_leaf=BPLUSTREE_NO_NODE if is_last else self.node_count + 1)
+            self.node_count += 1
+            level.append((leaf_entries[0] if leaf_entries else (0, 0), leaf.node_id))
+            append_node(leaf)
+
+        for entry in entries:
+            entry = (int(entry[0]), int(entry[1]))
+            if entry == previous:
+                continue
+            assert previous is None or entry > previous, f"The entries must be sorted, {entry} follows {previous}"
+            previous = entry
+            if len(leaf_entries) == leaf_fill:
+                append_leaf(is_last=False)
+                leaf_entries = []
+            leaf_entries.append(entry)
+            self.entry_count += 1
+        append_leaf(is_last=True)
+        self.first_leaf_id = 0
+
+        # the internal levels, dividing the nodes of a level evenly over as few parents as possible
+        while len(level) > 1:
+            parent_count: int = -(-len(level) // (internal_fill + 1))
+            bounds: List[int] = [len(level) * i // parent_count for i in range(parent_count + 1)]
+            parent_level: List[Tuple[Tuple[int, int], int]] = []
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                children: List[Tuple[Tuple[int, int], int]] = level[start: end]
+                node: BPlusTreeNode = BPlusTreeNode(self.node_count, False, [child[0] for child in children[1:]],
+                                                    [child[1] for child in children])
+                self.node_count += 1
+                append_node(node)
+                parent_level.append((children[0][0], node.node_id))
+            level = parent_level
+        self.root_id = level[0][1]
+
+        write_at(self.file, bytes(chunk), chunk_offset)
+        self.write_metadata()
+
+    def flush(self) -> None:
+        """Write all modified in-memory nodes and the header to the node storage file."""
+        self.node_pool.flush()
+        self.write_metadata()
+
+    def sync(self) -> None:
+        """Flush the tree and force the node storage file to disk."""
+        self.flush()
+        os.fsync(self.file)
+
+    def close(self) -> None:
+        """Flush the tree and close its node storage file. The tree
+        can no longer be used afterwards.
+        """
+        if self.file is None:
+            return
+        self.flush()
+        os.close(self.file)
+        self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def is_valid(self) -> bool:
+        """Check the structure of the tree: sorted nodes, separators that bound their
+        subtrees, leaves at the same depth, a complete leaf chain and a correct entry count.
+
+        :return: True if the tree is valid
+        """
+        leaves: List[int] = []
+
+        def check(node_id: int, low: Union[Tuple[int, int], None], high: Union[Tuple[int, int], None], depth: int) -> int:
+            node: BPlusTreeNode = self.get_node(node_id)
+            if node.entries != sorted(node.entries):
+                return -1
+            if any((low is not None and entry < low) or (high is not None and entry >= high) for entry in node.entries):
+                return -1
+            if node.is_leaf:
+                leaves.append(node_id)
+                return depth
+            if len(node.children) != len(node.entries) + 1:
+                return -1
+            bounds: List[Union[Tuple[int, int], None]] = [low] + node.entries + [high]
+            depths: Set[int] = {check(child, bounds[i], bounds[i + 1], depth + 1) for i, child in enumerate(node.children)}
+            return depths.pop() if len(depths) == 1 else -1
+
+        if check(self.root_id, None, None, 0) < 0:
+            return False
+        chain: List[int] = []
+        leaf_id: int = self.first_leaf_id
+        while leaf_id != BPLUSTREE_NO_NODE:
+            chain.append(leaf_id)
+            leaf_id = self.get_node(leaf_id).next_leaf
+        return chain == leaves and sum(1 for entry in self.range()) == self.entry_count
+
+
+if __name__ == '__main__':
+    import random
+
+    tree: BPlusTree = BPlusTree("bplustree_test.dat", node_size=128, nodes_max_in_memory=4)
+    expected: Set[Tuple[int, int]] = set()
+    for i in range(2000):
+        key, value = random.randint(0, 100), random.randint(0, 1000)
+        if random.random() < 0.7:
+            tree.insert(key, value)
+            expected.add((key, value))
+        else:
+            tree.delete(key, value)
+            expected.discard((key, value))
+    print("valid:", tree.is_valid(), "entries:", len(tree))
+    print("range [10, 12]:", list(tree.range(10, 12)) == sorted(entry for entry in expected if 10 <= entry[0] <= 12))
+
+    tree.bulk_load(sorted(expected), fill_factor=0.7)
+    tree.close()
+    tree = BPlusTree.open("bplustree_test.dat", nodes_max_in_memory=4)
+    print("reopened valid:", tree.is_valid(), "entries:", list(tree) == sorted(expected))
+    tree.close()
@@ -1,10 +1,21 @@
-# import bplustree
-
+import numpy as np
 import pandas as pd
 from IPython.display import display
-from extendible_hashing import ExtendibleHashingIndex, BucketValue
-from typing import Union
+from extendible_hashing import ExtendibleHashingIndex, BucketValue, read_at, write_at, hash_function_string_key
+from free_space_map import FreeSpaceMap
+from zone_map import ZoneMaps
+from bplustree import BPlusTree
+from wal import WriteAheadLog
+from typing import Union, List, Dict, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 import copy
+import functools
+import hashlib
+import mmap
+import os
+import struct
+import threading
 
 df = pd.DataFrame(
     columns=['id', 'name', 'email', 'phone', 'company', 'street', 'street_number', 'zipcode', 'country_dct',
@@ -32,6 +43,44 @@ TUPLE_CTR_SIZE: int = 2
 # meaning that all tuples may be 1B and will still
 # be addressable with an offset.
 OFFSET_SIZE: int = 2
+# How create_var_length_user and update_var_length_user choose the page for a tuple,
+# "first-fit" or "best-fit" (see FreeSpaceMap)
+PAGE_PLACEMENT_POLICY: str = "first-fit"
+# The fraction of a page that save_users_to_binary_var_length and vacuum_var_length_db fill with tuples,
+# the rest is left free so that updated tuples can grow in place
+PAGE_FILL_FACTOR: float = 1.0
+# The amount of memory the page buffer pool may use for pages, in bytes
+PAGE_BUFFER_POOL_MEMORY: int = 1024 * 1024
+# The amount of bytes a page scan reads from the database file at once, rounded down to whole pages
+SCAN_READ_SIZE: int = 4 * 1024 * 1024
+# The amount of threads that read_var_length_users_concurrently reads pages with at the same time
+READ_THREAD_COUNT: int = 16
+# The amount of worker processes that load_users_from_binary_var_length_parallel decodes pages with
+SCAN_PROCESS_COUNT: int = os.cpu_count() or 1
+# The columns of which the minimum and maximum are kept per page, to skip pages in scan_users_where_var_length
+ZONE_MAP_COLUMNS = ['id', 'birthdate_ts', 'zipcode', 'country_dct']
+# The columns that have a B+tree secondary index, for range queries with read_var_length_users_in_range
+SECONDARY_INDEX_COLUMNS = ['birthdate_ts', 'zipcode', 'country_dct']
+# Whether creating or updating a user fails when another user already has the same email
+EMAIL_INDEX_UNIQUE: bool = False
+# An email_index value: user id, user count (only kept at position 0), check hash of the key, flags
+EMAIL_INDEX_VALUE_STRUCT: struct.Struct = struct.Struct("<IIQB")
+# The flags of an email_index entry: another key with the same hash was stored after this entry (see
+# set_email_index_entry), and the entry is a deleted entry that is kept for such a key
+EMAIL_INDEX_PROBED_PAST: int = 1
+EMAIL_INDEX_DELETED: int = 2
+# The amount of CRUD operations of which the write-ahead log records are forced to disk together,
+# with a single fsync (group commit). By default every operation is durable before it returns, and only
+# threads that commit at the same time share an fsync. A higher value is an opt-in for relaxed durability:
+# up to WAL_GROUP_COMMIT_SIZE - 1 of the last operations can be lost in a crash, unless
+# commit_var_length_db is called.
+WAL_GROUP_COMMIT_SIZE: int = 1
+# A write-ahead log record is a series of entries: a page delta (kind, page number, offset in the page,
+# size, followed by the new bytes) or the truncation of the database file (kind, page count)
+WAL_PAGE_DELTA: int = 1
+WAL_PAGE_DELTA_STRUCT: struct.Struct = struct.Struct("<BQII")
+WAL_TRUNCATE: int = 2
+WAL_TRUNCATE_STRUCT: struct.Struct = struct.Struct("<BQ")
 
 # An index for the user's ids in the form of a Hashtable.
 # The mapping is as follows:
@@ -41,8 +90,38 @@ OFFSET_SIZE: int = 2
 # user tuple is stored padded to 8B and the slot_address
 # padded to 8B, which is the offset within the page to
 # the slot corresponding to the user tuple.
-user_index: ExtendibleHashingIndex = ExtendibleHashingIndex()
-remaining_page_mem_index = dict()
+# None until a database file is saved or opened, so that importing this module creates no files.
+user_index: Union[ExtendibleHashingIndex, None] = None
+# The amount of free bytes per page number, indexed so that a page with
+# enough free space is found in O(log pages).
+remaining_page_mem_index: FreeSpaceMap = FreeSpaceMap(PAGE_PLACEMENT_POLICY)
+# The minimum and maximum of the ZONE_MAP_COLUMNS per page number.
+page_zone_maps: ZoneMaps = ZoneMaps(ZONE_MAP_COLUMNS)
+# A B+tree per column in SECONDARY_INDEX_COLUMNS, with the entries
+#       (column value, user_ID)
+# so that the users with a column value in a range are found without a scan.
+secondary_indexes: Dict[str, BPlusTree] = dict()
+# A hash index on the email column, see get_email_index_key. The mapping is as follows:
+#       (email, position) : bytearray(user_ID | user count | check hash | flags)
+# where the users with the same email are stored at positions 0, 1, ...
+# and the user count (of that email) is only kept at position 0.
+# Keys are stored by their 8B hash, the check hash tells keys with the same hash apart (see find_email_index_entry).
+# The user_ID is the locator of the user tuple, its page and slot are found with the user_index.
+# None if the database file has no email index yet.
+email_index: Union[ExtendibleHashingIndex, None] = None
+# The thread pool of read_var_length_users_concurrently, created when first used and shut down
+# with the page buffer pool (see close_page_buffer_pool). None if there is none.
+read_thread_pool: Union[ThreadPoolExecutor, None] = None
+# The amount of threads of the read_thread_pool
+read_thread_pool_size: int = 0
+# The log of the page changes made by the CRUD functions since the last checkpoint (see flush_var_length_db),
+# which open_var_length_db replays after a crash. None if no database file was saved or opened yet.
+write_ahead_log: Union[WriteAheadLog, None] = None
+# Held by the functions that use the page buffer pool, the indexes or the write_ahead_log, see locked_operation
+database_lock: threading.RLock = threading.RLock()
+# Per thread: how deeply locked_operation calls are nested (depth) and the LSN of the last record that
+# the outermost operation appended to the write_ahead_log (lsn), which it commits after releasing the lock
+operation_state: threading.local = threading.local()
 
 
 def encode_var_string(s):
@@ -86,6 +165,173 @@ def encode_user_var_length(user, is_new_user=False):
       int_list.extend(encode_var_string(user[5]))
       return bytearray(int_list)
 
+# The fixed-width integer fields at the start of an encoded user, see encode_user_var_length
+USER_FIXED_FIELDS_DTYPE: np.dtype = np.dtype([('id', '<u4'), ('street_number', '<u2'), ('zipcode', '<u4'),
+                                              ('birthdate_ts', '<u4'), ('country_dct', 'u1')])
+# The variable-length string fields that follow them, in order
+USER_STRING_FIELDS = ['name', 'email', 'phone', 'company', 'street']
+
+
+def encode_users_var_length(df):
+    """
+    Columnar version of encode_user_var_length: encode all users of a dataframe at once,
+    column by column, instead of row by row.
+
+    :param df: pandas dataframe with the user columns (see new_user_columns)
+    :return: (fixed_fields, string_fields, tuple_sizes) where
+        fixed_fields is a (users x 15) uint8 array with the encoded integer fields of every user,
+        string_fields is a list with for every column in USER_STRING_FIELDS a (data, lengths) pair,
+            data being the concatenated ascii bytes of the column as an uint8 array
+            and lengths the length of every string,
+        tuple_sizes is the size in bytes of every encoded user
+    """
+    user_count: int = len(df)
+
+    fixed_fields = np.zeros(user_count, dtype=USER_FIXED_FIELDS_DTYPE)
+    for column in USER_FIXED_FIELDS_DTYPE.names:
+        values = df[column].to_numpy().astype(np.int64)
+        max_value: int = np.iinfo(USER_FIXED_FIELDS_DTYPE[column]).max
+        assert user_count == 0 or (values.min() >= 0 and values.max() <= max_value), f"Column '{column}' does not fit in {USER_FIXED_FIELDS_DTYPE[column].itemsize}B"
+        fixed_fields[column] = values
+
+    tuple_sizes = np.full(user_count, USER_FIXED_FIELDS_DTYPE.itemsize + len(USER_STRING_FIELDS), dtype=np.int64)
+    string_fields = []
+    for column in USER_STRING_FIELDS:
+        values = df[column].to_numpy()
+        data = np.frombuffer("".join(values).encode('ascii'), dtype=np.uint8)
+        lengths = np.fromiter(map(len, values), dtype=np.int64, count=user_count)
+        assert user_count == 0 or lengths.max() < 256, f"Column '{column}' contains a string longer than 255 characters"
+        string_fields.append((data, lengths))
+        tuple_sizes += lengths
+
+    return fixed_fields.view(np.uint8).reshape(user_count, USER_FIXED_FIELDS_DTYPE.itemsize), string_fields, tuple_sizes
+
+
+def get_tuple_offsets_var_length(page_data):
+    """
+    Get the offset of every tuple stored in a series of pages, in slot order.
+    The tombstones of removed tuples (see Page.remove_tuple) are skipped.
+
+    :param page_data: uint8 numpy array with the bytes of one or more whole pages
+    :return: numpy array with the offset of every tuple within *page_data*
+    """
+    return get_tuple_locations_var_length(page_data)[0]
+
+
+def get_tuple_locations_var_length(page_data):
+    """
+    Get the offset of every tuple stored in a series of pages and the offset of its slot, in slot order.
+    The tombstones of removed tuples (see Page.remove_tuple) are skipped.
+
+    :param page_data: uint8 numpy array with the bytes of one or more whole pages
+    :return: (tuple offsets, slot offsets) numpy arrays, with offsets within *page_data*
+    """
+    # the page and the slot address of every tuple
+    page_bases = np.arange(len(page_data) // PAGE_SIZE) * PAGE_SIZE
+    tuple_counts = gather_little_endian(page_data, page_bases, TUPLE_CTR_SIZE)
+    tuple_pages = np.repeat(page_bases, tuple_counts)
+    first_tuples = np.concatenate(([0], np.cumsum(tuple_counts)[:-1]))
+    slot_numbers = np.arange(len(tuple_pages)) - np.repeat(first_tuples, tuple_counts)
+    slot_offsets = tuple_pages + TUPLE_CTR_SIZE + slot_numbers * OFFSET_SIZE
+    tuple_addresses = gather_little_endian(page_data, slot_offsets, OFFSET_SIZE)
+
+    # a tuple ends where the tuple of the previous slot starts, a tombstone is empty
+    tuple_ends = np.concatenate(([PAGE_SIZE], tuple_addresses[:-1]))
+    tuple_ends[slot_numbers == 0] = PAGE_SIZE
+    is_tuple = tuple_addresses < tuple_ends
+    return tuple_pages[is_tuple] + tuple_addresses[is_tuple], slot_offsets[is_tuple]
+
+
+def decode_fixed_fields_var_length(page_data, tuple_offsets):
+    """
+    Decode the fixed-width integer fields of the tuples at *tuple_offsets* at once.
+
+    :param page_data: uint8 numpy array with the bytes of one or more whole pages
+    :param tuple_offsets: numpy array with the offsets of the tuples within *page_data*
+    :return: numpy array of USER_FIXED_FIELDS_DTYPE
+    """
+    fixed_fields = page_data[tuple_offsets[:, None] + np.arange(USER_FIXED_FIELDS_DTYPE.itemsize)]
+    return fixed_fields.view(USER_FIXED_FIELDS_DTYPE).reshape(len(tuple_offsets))
+
+
+def compute_zone_maps_var_length(page_data):
+    """
+    Compute the zone map of every page in a series of pages: the minimum and maximum of the ZONE_MAP_COLUMNS.
+
+    :param page_data: uint8 numpy array with the bytes of one or more whole pages
+    :return: (mins, maxs) numpy arrays of pages x ZONE_MAP_COLUMNS, a page without tuples
+        has ZoneMaps.EMPTY_MIN and ZoneMaps.EMPTY_MAX as its minimum and maximum
+    """
+    page_count: int = len(page_data) // PAGE_SIZE
+    tuple_offsets = get_tuple_offsets_var_length(page_data)
+    fixed_fields = decode_fixed_fields_var_length(page_data, tuple_offsets)
+
+    mins = np.full((page_count, len(ZONE_MAP_COLUMNS)), ZoneMaps.EMPTY_MIN, dtype=np.int64)
+    maxs = np.full((page_count, len(ZONE_MAP_COLUMNS)), ZoneMaps.EMPTY_MAX, dtype=np.int64)
+    # the tuples are ordered by page, so reduce every page's run of tuples
+    tuple_counts = np.bincount(tuple_offsets // PAGE_SIZE, minlength=page_count)
+    non_empty_pages = tuple_counts > 0
+    if len(tuple_offsets) > 0:
+        first_tuples = np.concatenate(([0], np.cumsum(tuple_counts[non_empty_pages])[:-1]))
+        for idx, column in enumerate(ZONE_MAP_COLUMNS):
+            values = fixed_fields[column].astype(np.int64)
+            mins[non_empty_pages, idx] = np.minimum.reduceat(values, first_tuples)
+            maxs[non_empty_pages, idx] = np.maximum.reduceat(values, first_tuples)
+    return mins, maxs
+
+
+def get_fixed_field_values(tuple_bytes, columns) -> List[int]:
+    """
+    Get the values of some fixed-width integer fields of an encoded user tuple.
+
+    :param tuple_bytes: The encoded user, see encode_user_var_length
+    :param columns: The columns to get, e.g. ZONE_MAP_COLUMNS
+    :return: The value of every column in *columns*
+    """
+    fixed_fields = np.frombuffer(bytes(tuple_bytes[:USER_FIXED_FIELDS_DTYPE.itemsize]), dtype=USER_FIXED_FIELDS_DTYPE)[0]
+    return [int(fixed_fields[column]) for column in columns]
+
+
+def decode_users_var_length(page_data, columns=None):
+    """
+    Columnar version of decode_user_var_length: decode all users stored in a series of pages at once.
+    The integer fields are gathered for all tuples at once from their slot offsets, and only the
+    string fields in *columns* are decoded.
+
+    :param page_data: uint8 numpy array with the bytes of one or more whole pages
+    :param columns: The columns to decode (see new_user_columns), defaults to all columns
+    :return: pandas dataframe with the requested columns, in the order of *columns*
+    """
+    columns = new_user_columns if columns is None else list(columns)
+    for column in columns:
+        assert column in new_user_columns, f"Unknown column '{column}', expected one of {new_user_columns}"
+
+    tuple_offsets = get_tuple_offsets_var_length(page_data)
+
+    users = dict()
+    fixed_columns = [column for column in USER_FIXED_FIELDS_DTYPE.names if column in columns]
+    if fixed_columns:
+        fixed_fields = decode_fixed_fields_var_length(page_data, tuple_offsets)
+        for column in fixed_columns:
+            users[column] = fixed_fields[column].astype(np.int64)
+
+    # the string fields are stored one after the other, so walk through them
+    # until the last requested one
+    string_columns = [column for column in USER_STRING_FIELDS if column in columns]
+    field_offsets = tuple_offsets + USER_FIXED_FIELDS_DTYPE.itemsize
+    for column in USER_STRING_FIELDS[:USER_STRING_FIELDS.index(string_columns[-1]) + 1] if string_columns else []:
+        lengths = page_data[field_offsets].astype(np.int64)
+        if column in string_columns:
+            data_ends = np.concatenate(([0], np.cumsum(lengths)))
+            character_offsets = np.repeat(field_offsets + 1 - data_ends[:-1], lengths) + np.arange(data_ends[-1])
+            data: str = page_data[character_offsets].tobytes().decode('ascii')
+            data_ends = data_ends.tolist()
+            users[column] = [data[data_ends[i]: data_ends[i + 1]] for i in range(len(lengths))]
+        field_offsets = field_offsets + 1 + lengths
+
+    return pd.DataFrame({column: users[column] for column in columns}, columns=columns, index=pd.RangeIndex(len(tuple_offsets)))
+
+
 def decode_user_var_length(byte_array):
     '''
     decode variable-length tuple representing user (see encode_user_var_length)
@@ -117,6 +363,8 @@ class Page:
         """
         Initialize an empty page. A page has the following structure as a bytearray:
         [page_size offset_ptr1 offset_ptr2 ... tuple_2 tuple_1]
+        The tuples are stored in slot order, so a tuple ends where the tuple of the previous slot starts.
+        The slot of a removed tuple stays as a tombstone: an empty tuple, see Page.remove_tuple.
 
         :param page_size: The size of the page in bytes
         :param tuple_ctr_size: The size of the page's tuple counter in bytes
@@ -135,6 +383,16 @@ class Page:
         # Tuples grow from back to front in the page
         self.tuples_data_base_address: int = self.page_size
 
+        # Buffer pool bookkeeping (see PageBufferPool)
+        # Whether the page differs from its on-disk version
+        self.is_dirty: bool = False
+        # The amount of users of the page, a pinned page is never evicted
+        self.pin_count: int = 0
+        # The (start, end) byte ranges that changed since the changes were last logged (see Page.pop_changes)
+        self.changed_ranges: List[Tuple[int, int]] = []
+        # The LSN of the write-ahead log record with the last logged change
+        self.lsn: int = 0
+
     @property
     def slot_array(self) -> bytearray:
         """Extract the slot array from the page. The slot
@@ -160,6 +418,7 @@ class Page:
     @property
     def tuple_count(self) -> int:
         """Extract the current tuple count from the page bytes.
+        This is the amount of slots, including the tombstones of removed tuples.
 
         :return: The up-to-date tuple count as an int
         """
@@ -237,118 +496,248 @@ class Page:
         tuple_address_bytes: bytearray = self.bytearray[slot_address: slot_address + self.slot_size]
         return int.from_bytes(tuple_address_bytes, byteorder='little')
 
-    def append_tuple(self, tuple_bytes: bytearray) -> int:
+    def get_tuple_size(self, slot_address: int) -> int:
+        """Get the size of the tuple stored at the specified slot address.
+        A tuple ends where the tuple of the previous slot starts.
+
+        :param slot_address: A valid slot address
+        :return: The tuple size in bytes
         """
-        Append a tuple to the page. Requires the page to have enough free space.
+        tuple_address: int = self.get_tuple_address(slot_address)
+        # Start of slot array
+        if slot_address == self.tuple_ctr_size:
+            return self.page_size - tuple_address
+        # Not start of slot array
+        return self.get_tuple_address(slot_address - self.slot_size) - tuple_address
+
+    def get_tuple(self, slot_address: int) -> bytearray:
+        """Get the bytes of the tuple stored at the specified slot address.
 
-        :param tuple_bytes: The tuple bytes to append to the page
-        :return: The address of the newly stored tuple as an offset within this page
+        :param slot_address: A valid slot address
+        :return: The tuple bytes
         """
-        assert self.data_fits(tuple_bytes), f"Page is full, cannot write tuple bytes: {tuple_bytes}"
+        tuple_address: int = self.get_tuple_address(slot_address)
+        return self.bytearray[tuple_address: tuple_address + self.get_tuple_size(slot_address)]
 
-        # Setup
-        init_tuple_count: int = self.tuple_count
+    def get_slot_contents(self):
+        """Get a numpy view on the slot array, with the tuple address of every slot.
+        Writing to the view writes to the page.
 
-        # write user to page
-        prev_tuples_base_address = self.tuples_data_base_address
+        :return: numpy array with a tuple address per slot
+        """
+        return np.frombuffer(self.bytearray, dtype=f'<u{self.slot_size}', count=self.tuple_count, offset=self.tuple_ctr_size)
+
+    def get_free_slot_address(self) -> Union[int, None]:
+        """Find the first slot of a removed tuple (a tombstone), see Page.remove_tuple.
+
+        :return: The slot address, None if the page has no tombstones
+        """
+        tuple_addresses = self.get_slot_contents()
+        # a tombstone is an empty tuple: it starts where the tuple of the previous slot starts
+        tuple_ends = np.concatenate(([self.page_size], tuple_addresses[:-1]))
+        tombstones = np.flatnonzero(tuple_addresses == tuple_ends)
+        if len(tombstones) == 0:
+            return None
+        return self.tuple_ctr_size + int(tombstones[0]) * self.slot_size
+
+    def insert_tuple(self, tuple_bytes: bytearray) -> int:
+        """
+        Store a tuple in the page. Requires the page to have enough free space.
+        The slot of a removed tuple is reused if there is one, otherwise a slot is added.
+        Because the tuples are stored in slot order, the tuples of the later slots are
+        shifted to make room for a tuple in a reused slot. The slot addresses of the other
+        tuples stay the same, so the user_index does not change.
+
+        :param tuple_bytes: The tuple bytes to store in the page
+        :return: The slot address of the newly stored tuple as an offset within this page
+        """
+        assert self.data_fits(tuple_bytes), f"Page is full, cannot write tuple bytes: {tuple_bytes}"
+
+        new_slot_address: Union[int, None] = self.get_free_slot_address()
+        if new_slot_address is None:
+            # add a slot for the tuple, right below the other tuples
+            new_slot_address = self.tuple_ctr_size + self.tuple_count * self.slot_size
+            self.set_tuple_count(self.tuple_count + 1)
+            self.get_slot_contents()[-1] = self.tuples_data_base_address
+
+        # move the tuples of the later slots to the front, to make room below the tombstone
+        slot_index: int = (new_slot_address - self.tuple_ctr_size) // self.slot_size
+        tuple_end: int = self.get_tuple_address(new_slot_address)
+        tuple_address: int = tuple_end - len(tuple_bytes)
+        prev_tuples_base_address: int = self.tuples_data_base_address
         self.tuples_data_base_address -= len(tuple_bytes)
-        self.bytearray[self.tuples_data_base_address: prev_tuples_base_address] = tuple_bytes
+        self.bytearray[self.tuples_data_base_address: tuple_address] = self.bytearray[prev_tuples_base_address: tuple_end]
+        self.bytearray[tuple_address: tuple_end] = tuple_bytes
 
-        # write offset to page
-        new_slot_address = self.tuple_ctr_size + init_tuple_count * self.slot_size
-        self.bytearray[new_slot_address: new_slot_address + self.slot_size] =\
-            self.tuples_data_base_address.to_bytes(self.slot_size, 'little')
-        self.set_tuple_count(init_tuple_count + 1)
+        tuple_addresses = self.get_slot_contents()
+        tuple_addresses[slot_index + 1:] -= len(tuple_bytes)
+        tuple_addresses[slot_index] = tuple_address
+        self.mark_changed(0, self.tuple_ctr_size + self.tuple_count * self.slot_size)
+        self.mark_changed(self.tuples_data_base_address, tuple_end)
+        self.is_dirty = True
 
         return new_slot_address
 
-    def remove_tuple(self, user_id: int, page_number: int, del_user_slot_address: int) -> None:
-        """Remove the tuple corresponding to the *del_user_slot_address* slot from the page.
-        Also updates the user_index and remaining_page_mem_index indexes.
-
-        :param user_id:
-        :param page_number: The index of the page
-        :param del_user_slot_address: The slot address corresponding to the tuple to remove
+    def replace_tuple(self, slot_address: int, tuple_bytes: bytearray) -> None:
         """
-        from typing import List
+        Overwrite the tuple at a slot with a tuple of the same or another size, keeping its slot.
+        A tuple of the same size is written in place. Otherwise, the tuples of the later slots are
+        shifted by the difference in size, which requires the page to have enough free space when
+        the tuple grows. The slot addresses stay the same, so the user_index does not change.
 
-        initial_tuple_count: int = self.tuple_count
-        last_tuple_address: int = self.get_tuple_address(self.get_slot_address(-1))
-        del_user_address: int = self.get_tuple_address(del_user_slot_address)
-        del_tuple_size: int = 0
+        :param slot_address: A valid slot address, not of a tombstone
+        :param tuple_bytes: The new tuple bytes
+        """
+        old_tuple_address: int = self.get_tuple_address(slot_address)
+        old_tuple_size: int = self.get_tuple_size(slot_address)
+        assert old_tuple_size > 0, f"The slot at address {slot_address} is a tombstone"
+        growth: int = len(tuple_bytes) - old_tuple_size
+        assert growth <= self.unused_memory_size, f"Page is full, cannot grow the tuple at slot address {slot_address} by {growth}B"
+
+        if growth != 0:
+            # the tuple still ends at the same address, the tuples of the later slots make room or fill the gap
+            prev_tuples_base_address: int = self.tuples_data_base_address
+            self.tuples_data_base_address -= growth
+            self.bytearray[self.tuples_data_base_address: old_tuple_address - growth] = self.bytearray[prev_tuples_base_address: old_tuple_address]
+            slot_index: int = (slot_address - self.tuple_ctr_size) // self.slot_size
+            tuple_addresses = self.get_slot_contents()
+            if growth > 0:
+                tuple_addresses[slot_index:] -= growth
+            else:
+                tuple_addresses[slot_index:] += -growth
+            self.mark_changed(0, self.tuple_ctr_size + self.tuple_count * self.slot_size)
+            self.mark_changed(min(prev_tuples_base_address, self.tuples_data_base_address), max(old_tuple_address, old_tuple_address - growth))
+        tuple_address: int = old_tuple_address - growth
+        self.bytearray[tuple_address: tuple_address + len(tuple_bytes)] = tuple_bytes
+        self.mark_changed(tuple_address, tuple_address + len(tuple_bytes))
+        self.is_dirty = True
+
+    def delete_tuple(self, slot_address: int) -> None:
+        """Delete the tuple at a slot from the page, without updating any index.
+        The tuples of the later slots are shifted to fill the gap, so the free space stays
+        contiguous, but the slot itself stays as a tombstone (an empty tuple) until it is
+        reused by Page.insert_tuple. Tombstones at the end of the slot array are removed.
+
+        :param slot_address: A valid slot address, not of a tombstone
+        """
+        slot_index: int = (slot_address - self.tuple_ctr_size) // self.slot_size
+        del_user_address: int = self.get_tuple_address(slot_address)
+        del_tuple_size: int = self.get_tuple_size(slot_address)
+        assert del_tuple_size > 0, f"The slot at address {slot_address} is a tombstone"
 
-        # Start of slot array
-        if del_user_slot_address == TUPLE_CTR_SIZE:
-            del_tuple_size = self.page_size - del_user_address
-        # Not start of slot array
-        else:
-            prev_slot_address: int = del_user_slot_address - self.slot_size
-            prev_tuple_address: int = self.get_tuple_address(prev_slot_address)
-            del_tuple_size = prev_tuple_address - del_user_address
-
-        to_move_tuples_amount: int = initial_tuple_count - (
-                (del_user_slot_address - self.tuple_ctr_size) // self.slot_size + 1)
-        next_slot_address: int = del_user_slot_address + self.slot_size
-        updated_slot_contents_list: List[int] = []
-
-        # update slot array contents/values in page
-        for to_move_slot_address in range(next_slot_address, next_slot_address + to_move_tuples_amount * self.slot_size,
-                                          self.slot_size):
-            original_slot_contents: int = self.get_tuple_address(to_move_slot_address)
-            updated_slot_contents: int = original_slot_contents + del_tuple_size
-            updated_slot_contents_list.append(updated_slot_contents)
-
-            updated_slot_contents_bytes: bytes = updated_slot_contents.to_bytes(self.slot_size, byteorder='little')
-            self.bytearray[to_move_slot_address - self.slot_size: to_move_slot_address] = updated_slot_contents_bytes
-
-        user_data = self.bytearray[last_tuple_address: del_user_address]
-
-        # The differences between slot contents, meaning they are the tuple lengths
-        tuple_lengths: List[int] = [
-            updated_slot_contents_list[idx] - updated_slot_contents_list[idx + 1]
-            for idx in range(0, len(updated_slot_contents_list) - 1)
-        ]
-        # The loop iterates from the leftmost tuple in the user_data,
-        # but the leftmost slot in the updated_slot_contents_list corresponds
-        # to the rightmost tuple in user data, so reverse tuple_lengths.
-        # Add random last value so that every offset is iterated on
-        tuple_lengths = tuple_lengths[::-1] + [0]
-        # The new/updated slot addresses corresponding to the moved/shifted tuples.
-        updated_slot_addresses: List[int] = \
-            [
-                slot_address - self.slot_size
-                for slot_address in
-                range(del_user_slot_address + to_move_tuples_amount * self.slot_size, del_user_slot_address,
-                      -self.slot_size)
-            ]
-
-        progress: int = 0
-        for idx, updated_slot_address in enumerate(updated_slot_addresses):
-            tuple_len: int = tuple_lengths[idx]
-            user_id_size: int = 4
-            user_id_bytes: bytes = user_data[progress: progress + user_id_size]
-            progress += tuple_len
-
-            user_id_int: int = int.from_bytes(user_id_bytes, 'little')
-            # Slot addresses may be shorter than the space allocated to them in the index
-            padded_updated_slot_address: bytes = updated_slot_address.to_bytes(8, byteorder='little')
-            user_index.insert_keyval(user_id_int, page_number.to_bytes(8, byteorder='little') + padded_updated_slot_address)
-            # user_index[user_id_int] = page_number.to_bytes(8, byteorder='little') + padded_updated_slot_address
-
-        # Shift tuples to eliminate fragmentation due to single tuple delete
-        data_shift_address: int = last_tuple_address + del_tuple_size
-        self.bytearray[data_shift_address: data_shift_address + len(user_data)] = user_data
+        # Shift the tuples of the later slots to eliminate fragmentation due to the delete
+        prev_tuples_base_address: int = self.tuples_data_base_address
         self.tuples_data_base_address += del_tuple_size
+        self.bytearray[self.tuples_data_base_address: del_user_address + del_tuple_size] = self.bytearray[prev_tuples_base_address: del_user_address]
+        tuple_addresses = self.get_slot_contents()
+        tuple_addresses[slot_index:] += del_tuple_size
+        self.mark_changed(0, self.tuple_ctr_size + self.tuple_count * self.slot_size)
+        self.mark_changed(prev_tuples_base_address, del_user_address + del_tuple_size)
+
+        # Tombstones at the end of the slot array are no longer needed
+        tuple_count: int = self.tuple_count
+        while tuple_count > 0 and self.get_tuple_size(self.tuple_ctr_size + (tuple_count - 1) * self.slot_size) == 0:
+            tuple_count -= 1
+            self.set_tuple_count(tuple_count)
+        self.is_dirty = True
+
+    def rewrite_tuples(self, replaced_tuples: Dict[int, bytes], new_tuples: List[bytes] = ()) -> List[int]:
+        """
+        Make several changes to the page at once, so that the tuples are compacted only once: replace the
+        tuples of some slots, where an empty tuple removes the tuple (see Page.delete_tuple), and store new
+        tuples, in the slots of removed tuples first (see Page.insert_tuple). Requires the page to have
+        enough free space for the result. The other tuples keep their slot addresses.
+
+        :param replaced_tuples: slot address -> new tuple bytes, for valid slot addresses
+        :param new_tuples: The tuple bytes to store in new slots
+        :return: The slot address of every new tuple
+        """
+        # the bytes of every slot, a tuple ends where the tuple of the previous slot starts
+        tuple_addresses: List[int] = self.get_slot_contents().tolist()
+        tuple_ends: List[int] = [self.page_size] + tuple_addresses[:-1]
+        tuples: List[bytes] = [bytes(self.bytearray[start: end]) for start, end in zip(tuple_addresses, tuple_ends)]
+        for slot_address, tuple_bytes in replaced_tuples.items():
+            assert self.is_valid_slot_address(slot_address), f"Invalid slot address {slot_address}"
+            tuples[(slot_address - self.tuple_ctr_size) // self.slot_size] = tuple_bytes
+
+        free_slot_indexes = iter([slot_index for slot_index, tuple_bytes in enumerate(tuples) if len(tuple_bytes) == 0])
+        new_slot_indexes: List[int] = []
+        for tuple_bytes in new_tuples:
+            slot_index: Union[int, None] = next(free_slot_indexes, None)
+            if slot_index is None:
+                slot_index = len(tuples)
+                tuples.append(tuple_bytes)
+            else:
+                tuples[slot_index] = tuple_bytes
+            new_slot_indexes.append(slot_index)
+        # Tombstones at the end of the slot array are no longer needed
+        while tuples and len(tuples[-1]) == 0:
+            tuples.pop()
+
+        tuples_data: bytes = b"".join(reversed(tuples))
+        new_tuples_data_base_address: int = self.page_size - len(tuples_data)
+        assert self.tuple_ctr_size + len(tuples) * self.slot_size <= new_tuples_data_base_address, "Page is full, cannot rewrite the tuples"
+        self.mark_changed(0, self.tuple_ctr_size + max(self.tuple_count, len(tuples)) * self.slot_size)
+        self.mark_changed(min(self.tuples_data_base_address, new_tuples_data_base_address), self.page_size)
+
+        self.bytearray[new_tuples_data_base_address:] = tuples_data
+        self.tuples_data_base_address = new_tuples_data_base_address
+        self.set_tuple_count(len(tuples))
+        self.get_slot_contents()[:] = self.page_size - np.cumsum([len(tuple_bytes) for tuple_bytes in tuples], dtype=np.int64)
+        self.is_dirty = True
+        return [self.tuple_ctr_size + slot_index * self.slot_size for slot_index in new_slot_indexes]
+
+    def mark_changed(self, start: int, end: int) -> None:
+        """Note that the bytes from *start* up to *end* changed, so that they are logged (see log_page_changes).
+
+        :param start: The address of the first changed byte
+        :param end: The address after the last changed byte
+        """
+        if start < end:
+            self.changed_ranges.append((start, end))
+
+    def pop_changes(self) -> List[Tuple[int, bytes]]:
+        """Get the bytes that changed since the last call, with overlapping ranges merged.
 
-        # Update tuple counter
-        self.set_tuple_count(initial_tuple_count - 1)
+        :return: (address, bytes) of every changed range, in address order
+        """
+        merged_ranges: List[List[int]] = []
+        for start, end in sorted(self.changed_ranges):
+            if merged_ranges and start <= merged_ranges[-1][1]:
+                merged_ranges[-1][1] = max(merged_ranges[-1][1], end)
+            else:
+                merged_ranges.append([start, end])
+        self.changed_ranges = []
+        return [(start, bytes(self.bytearray[start: end])) for start, end in merged_ranges]
+
+    def remove_tuple(self, user_id: int, page_number: int, del_user_slot_address: int) -> None:
+        """Remove the tuple corresponding to the *del_user_slot_address* slot from the page,
+        see Page.delete_tuple. The other tuples keep their slot addresses, so only the entry
+        of the removed user changes in the user_index.
+        Also updates the user_index, remaining_page_mem_index and page_zone_maps indexes.
+
+        :param user_id: The id of the user stored in the tuple
+        :param page_number: The index of the page
+        :param del_user_slot_address: The slot address corresponding to the tuple to remove
+        """
+        self.delete_tuple(del_user_slot_address)
 
         # update user index
         user_index.delete(user_id)
         # del user_index[user_id]
 
-        freed_memory: int = self.slot_size + del_tuple_size
-        remaining_page_mem_index[page_number] = remaining_page_mem_index.get(page_number, 0) + freed_memory
+        remaining_page_mem_index[page_number] = self.unused_memory_size
+        # the removed tuple may have been the minimum or maximum of the page
+        page_zone_maps.set_page(page_number, *self.get_zone_map())
+
+    def get_zone_map(self):
+        """
+        Compute the zone map of the page, see compute_zone_maps_var_length.
+
+        :return: (mins, maxs) of the ZONE_MAP_COLUMNS
+        """
+        mins, maxs = compute_zone_maps_var_length(np.frombuffer(self.bytearray, dtype=np.uint8))
+        return mins[0], maxs[0]
 
     def data_fits(self, tuple_data: bytearray) -> bool:
         """
@@ -362,114 +751,1332 @@ class Page:
         # All page space after the offset has been allocated to tuples.
         # == free space in page
         free_page_space: int = self.tuples_data_base_address - (self.tuple_ctr_size + allocated_offsetptr_space)
-        # Adding a tuple requires space for the tuple and an offset ptr
+        # Adding a tuple requires space for the tuple and an offset ptr, unless it reuses the slot of a removed tuple
         required_tuple_space: int = len(tuple_data) + self.slot_size
-        return free_page_space >= required_tuple_space
+        if free_page_space >= required_tuple_space:
+            return True
+        return free_page_space >= len(tuple_data) and self.get_free_slot_address() is not None
 
 
 def create_empty_page() -> Page:
     return Page(PAGE_SIZE, TUPLE_CTR_SIZE, OFFSET_SIZE)
 
 
-def save_users_to_binary_var_length(filename, df):
+class PageBufferPool:
+    def __init__(self, db_filename: str, memory_budget: int = None):
+        """
+        Keeps the most recently used pages of a database file in memory, within a memory budget.
+        A page is pinned while it is used and is never evicted while pinned. Modified (dirty)
+        pages are only written back when they are evicted or when the pool is flushed, so a
+        burst of changes to the same page costs a single write. A page is only written after
+        the write-ahead log records of its changes are on disk (see log_page_changes).
+
+        The pool keeps the database file open until PageBufferPool.close() is called.
+
+        :param db_filename: The file name of the database file
+        :param memory_budget: The maximum amount of page bytes in memory, defaults to PAGE_BUFFER_POOL_MEMORY
+        """
+        self.db_filename: str = db_filename
+        self.page_size: int = PAGE_SIZE
+        memory_budget = PAGE_BUFFER_POOL_MEMORY if memory_budget is None else memory_budget
+        # an update may need both its old and its new page at the same time
+        self.capacity: int = max(2, memory_budget // self.page_size)
+
+        self.file: Union[int, None] = os.open(db_filename, os.O_RDWR | getattr(os, "O_BINARY", 0))
+        # Includes the pages that were created but have not been written to the file yet
+        self.page_count: int = os.fstat(self.file).st_size // self.page_size
+        # page number -> Page, from least to most recently used
+        self.pages: OrderedDict = OrderedDict()
+
+    def __len__(self):
+        return len(self.pages)
+
+    def __contains__(self, page_number: int):
+        return page_number in self.pages
+
+    def pin(self, page_number: int) -> Page:
+        """
+        Get a page, reading it from the database file if it is not in memory.
+        The page stays in memory until it is unpinned again (see PageBufferPool.unpin).
+
+        :param page_number: The index of the page
+        :return: The page
+        """
+        assert 0 <= page_number < self.page_count, f"Page {page_number} does not exist, there are {self.page_count} pages"
+
+        page: Union[Page, None] = self.pages.get(page_number)
+        if page is None:
+            self.make_room()
+            page = create_empty_page()
+            page.load_bytes(bytearray(read_at(self.file, self.page_size, page_number * self.page_size)))
+            self.pages[page_number] = page
+        else:
+            self.pages.move_to_end(page_number)
+
+        page.pin_count += 1
+        return page
+
+    def unpin(self, page_number: int) -> None:
+        """
+        Release a page that was pinned with PageBufferPool.pin.
+
+        :param page_number: The index of the page
+        """
+        page: Page = self.pages[page_number]
+        assert page.pin_count > 0, f"Page {page_number} is not pinned"
+        page.pin_count -= 1
+
+    def new_page(self) -> int:
+        """
+        Append an empty page to the database file. The page is only written
+        to the file when it is evicted or when the pool is flushed.
+
+        :return: The index of the new page
+        """
+        self.make_room()
+        page: Page = create_empty_page()
+        page.is_dirty = True
+        page_number: int = self.page_count
+        self.pages[page_number] = page
+        self.page_count += 1
+        return page_number
+
+    def truncate(self, page_count: int) -> None:
+        """
+        Cut off the pages from *page_count* on, both in memory and in the database file.
+
+        :param page_count: The amount of pages to keep
+        """
+        for page_number in [page_number for page_number in self.pages if page_number >= page_count]:
+            assert self.pages[page_number].pin_count == 0, f"Cannot truncate page {page_number}, it is pinned"
+            del self.pages[page_number]
+        self.page_count = min(self.page_count, page_count)
+        os.ftruncate(self.file, self.page_count * self.page_size)
+
+    def make_room(self) -> None:
+        """
+        Evict the least recently used unpinned pages until there is room for one more page.
+        """
+        while len(self.pages) >= self.capacity:
+            victim: Union[int, None] = None
+            for page_number, page in self.pages.items():
+                if page.pin_count == 0:
+                    victim = page_number
+                    break
+            assert victim is not None, "All pages in the buffer pool are pinned, cannot evict a page"
+            self.evict(victim)
+
+    def evict(self, page_number: int) -> None:
+        """
+        Remove an unpinned page from memory, writing it to the database file first if it is dirty.
+
+        :param page_number: The index of the page
+        """
+        page: Page = self.pages[page_number]
+        assert page.pin_count == 0, f"Cannot evict page {page_number}, it is pinned"
+        self.write_page(page_number, page)
+        del self.pages[page_number]
+
+    def write_page(self, page_number: int, page: Page) -> None:
+        """
+        Write a page to the database file if it is dirty. A page is only written after the write_ahead_log
+        record of its last change is durable (write-ahead rule): if page.lsn is newer than the durable LSN
+        of the log, the log is committed up to page.lsn first, so that a crash never leaves a change in the
+        database file that cannot be found in the log.
+
+        :param page_number: The index of the page
+        :param page: The page to write
+        """
+        if page.is_dirty:
+            wal: Union[WriteAheadLog, None] = get_write_ahead_log(self.db_filename)
+            if wal is not None and page.lsn > wal.durable_lsn:
+                wal.commit(page.lsn)
+            write_at(self.file, page.bytearray, page_number * self.page_size)
+            page.is_dirty = False
+
+    def flush(self) -> None:
+        """
+        Write all dirty pages to the database file, in page order. The pages stay in memory.
+        """
+        for page_number in sorted(self.pages):
+            self.write_page(page_number, self.pages[page_number])
+
+    def sync(self) -> None:
+        """
+        Flush the pool and force the database file to disk.
+        """
+        self.flush()
+        os.fsync(self.file)
+
+    def close(self, flush: bool = True) -> None:
+        """
+        Close the database file. The pool can no longer be used afterwards.
+
+        :param flush: Whether to write the dirty pages first, False drops them
+        """
+        if self.file is None:
+            return
+        if flush:
+            self.flush()
+        self.pages.clear()
+        os.close(self.file)
+        self.file = None
+
+
+# The page buffer pool of the database file that was used last
+page_buffer_pool: Union[PageBufferPool, None] = None
+
+
+def get_page_buffer_pool(db_filename: str) -> PageBufferPool:
+    """
+    Get the page buffer pool of a database file. The pool of the previously used
+    database file is flushed and closed first.
+
+    :param db_filename: The file name of the database file
+    :return: The page buffer pool
+    """
+    global page_buffer_pool
+
+    if page_buffer_pool is not None and page_buffer_pool.db_filename == db_filename and page_buffer_pool.page_size == PAGE_SIZE:
+        return page_buffer_pool
+    close_page_buffer_pool()
+    page_buffer_pool = PageBufferPool(db_filename)
+    return page_buffer_pool
+
+
+def close_page_buffer_pool(flush: bool = True) -> None:
+    """
+    Close the current page buffer pool, if there is one.
+
+    :param flush: Whether to write the dirty pages to the database file first
+    """
+    global page_buffer_pool
+
+    close_read_thread_pool()
+    if page_buffer_pool is not None:
+        page_buffer_pool.close(flush)
+        page_buffer_pool = None
+
+
+def get_read_thread_pool(thread_count: int) -> ThreadPoolExecutor:
+    """
+    Get the read_thread_pool, create it if there is none yet or if it has a different amount of threads.
+
+    :param thread_count: The amount of threads of the thread pool
+    :return: The read_thread_pool
+    """
+    global read_thread_pool, read_thread_pool_size
+
+    if read_thread_pool is None or read_thread_pool_size != thread_count:
+        close_read_thread_pool()
+        read_thread_pool = ThreadPoolExecutor(max_workers=thread_count, thread_name_prefix="page-reader")
+        read_thread_pool_size = thread_count
+    return read_thread_pool
+
+
+def close_read_thread_pool() -> None:
+    """
+    Shut down the read_thread_pool, if there is one, after its pending reads are done.
+    """
+    global read_thread_pool
+
+    if read_thread_pool is not None:
+        read_thread_pool.shutdown(wait=True)
+        read_thread_pool = None
+
+
+def get_page_fill_capacity(fill_factor: float = None) -> int:
+    """
+    Get the amount of bytes of a page that may be filled with tuples and slots.
+
+    :param fill_factor: The fraction of the page to fill, defaults to PAGE_FILL_FACTOR
+    :return: The amount of bytes
+    """
+    fill_factor = PAGE_FILL_FACTOR if fill_factor is None else fill_factor
+    assert 0 < fill_factor <= 1, f"Invalid fill factor {fill_factor}, expected a fraction of a page"
+    return int((PAGE_SIZE - TUPLE_CTR_SIZE) * fill_factor)
+
+
+def assign_tuples_to_pages(tuple_sizes, fill_factor: float = None):
+    """
+    Divide tuples over pages in order, filling every page the same way as appending
+    the tuples one by one with Page.insert_tuple would, up to the fill factor.
+    A page always gets at least one tuple.
+
+    :param tuple_sizes: numpy array with the size in bytes of every tuple
+    :param fill_factor: The fraction of every page to fill, defaults to PAGE_FILL_FACTOR
+    :return: numpy array with the index of the first tuple of every page, followed by the amount of tuples
+    """
+    # every tuple needs a slot as well
+    slot_ends = np.cumsum(tuple_sizes + OFFSET_SIZE)
+    page_capacity: int = get_page_fill_capacity(fill_factor)
+    page_bounds = [0]
+    while page_bounds[-1] < len(slot_ends):
+        first_tuple: int = page_bounds[-1]
+        assert tuple_sizes[first_tuple] + OFFSET_SIZE <= PAGE_SIZE - TUPLE_CTR_SIZE, f"Tuple {first_tuple} of {int(tuple_sizes[first_tuple])}B does not fit in a page"
+        used_before: int = int(slot_ends[first_tuple - 1]) if first_tuple > 0 else 0
+        end: int = int(np.searchsorted(slot_ends, used_before + page_capacity, side='right'))
+        page_bounds.append(max(end, first_tuple + 1))
+    return np.array(page_bounds, dtype=np.int64)
+
+
+def scatter_little_endian(buffer, positions, values, size: int) -> None:
+    """
+    Write integers as little endian bytes into a uint8 numpy array.
+
+    :param buffer: The uint8 numpy array to write into
+    :param positions: numpy array with the position of every integer in the buffer
+    :param values: numpy array with the integers
+    :param size: The amount of bytes per integer
+    """
+    for byte in range(size):
+        buffer[positions + byte] = (values >> (8 * byte)) & 0xFF
+
+
+def gather_little_endian(buffer, positions, size: int):
+    """
+    Read little endian integers from a uint8 numpy array, the inverse of scatter_little_endian.
+
+    :param buffer: The uint8 numpy array to read from
+    :param positions: numpy array with the position of every integer in the buffer
+    :param size: The amount of bytes per integer
+    :return: numpy array with the integers
+    """
+    values = np.zeros(len(positions), dtype=np.int64)
+    for byte in range(size):
+        values |= buffer[positions + byte].astype(np.int64) << (8 * byte)
+    return values
+
+
+def close_user_index() -> None:
+    """
+    Flush and close the user_index.
+    """
+    global user_index
+
+    if user_index is not None:
+        user_index.close()
+        user_index = None
+
+
+def get_user_index_filename(db_filename: str) -> str:
+    """
+    Get the name of the bucket storage file of the user_index belonging to a database file.
+
+    :param db_filename: The file name of the database file
+    :return: The file name of the index's bucket storage file
+    """
+    return db_filename + ".buckets"
+
+
+def get_zone_maps_filename(db_filename: str) -> str:
+    """
+    Get the name of the file the page_zone_maps of a database file are saved to.
+
+    :param db_filename: The file name of the database file
+    :return: The file name of the zone maps file
+    """
+    return db_filename + ".zones"
+
+
+def get_secondary_index_filename(db_filename: str, column: str) -> str:
+    """
+    Get the name of the node storage file of the secondary index on a column of a database file.
+
+    :param db_filename: The file name of the database file
+    :param column: The indexed column, see SECONDARY_INDEX_COLUMNS
+    :return: The file name of the index's node storage file
+    """
+    return db_filename + "." + column + ".bptree"
+
+
+def close_secondary_indexes() -> None:
+    """
+    Flush and close the secondary indexes.
+    """
+    for secondary_index in secondary_indexes.values():
+        secondary_index.close()
+    secondary_indexes.clear()
+
+
+def build_secondary_indexes(db_filename: str, user_ids, column_values) -> None:
+    """
+    Create the secondary indexes of a database file from scratch.
+
+    :param db_filename: The file name of the database file
+    :param user_ids: numpy array with the id of every user
+    :param column_values: For every column in SECONDARY_INDEX_COLUMNS, a numpy array with the value of every user
+    """
+    close_secondary_indexes()
+    for column, values in zip(SECONDARY_INDEX_COLUMNS, column_values):
+        secondary_index: BPlusTree = BPlusTree(get_secondary_index_filename(db_filename, column))
+        order = np.lexsort((user_ids, values))
+        secondary_index.bulk_load(zip(values[order].tolist(), user_ids[order].tolist()))
+        secondary_indexes[column] = secondary_index
+
+
+def update_secondary_indexes(user_id: int, old_tuple_bytes, new_tuple_bytes) -> None:
+    """
+    Keep the secondary indexes consistent with a created, deleted or updated user.
+
+    :param user_id: The id of the user
+    :param old_tuple_bytes: The encoded user before the change, None for a created user
+    :param new_tuple_bytes: The encoded user after the change, None for a deleted user
+    """
+    old_values = [None] * len(SECONDARY_INDEX_COLUMNS) if old_tuple_bytes is None else get_fixed_field_values(old_tuple_bytes, SECONDARY_INDEX_COLUMNS)
+    new_values = [None] * len(SECONDARY_INDEX_COLUMNS) if new_tuple_bytes is None else get_fixed_field_values(new_tuple_bytes, SECONDARY_INDEX_COLUMNS)
+    for column, old_value, new_value in zip(SECONDARY_INDEX_COLUMNS, old_values, new_values):
+        if old_value == new_value or column not in secondary_indexes:
+            continue
+        if old_value is not None:
+            secondary_indexes[column].delete(old_value, user_id)
+        if new_value is not None:
+            secondary_indexes[column].insert(new_value, user_id)
+
+
+def get_email_index_filename(db_filename: str) -> str:
+    """
+    Get the name of the bucket storage file of the email_index belonging to a database file.
+
+    :param db_filename: The file name of the database file
+    :return: The file name of the index's bucket storage file
+    """
+    return db_filename + ".email.buckets"
+
+
+def get_email_index_key(email: str, position: int) -> str:
+    """
+    Get the email_index key of the user at a position among the users with the same email.
+
+    :param email: The email of the user
+    :param position: The position of the user, 0 for the first user with the email
+    :return: The key, hashed with hash_function_string_key by the index
+    """
+    # an email never contains a NUL character, so the keys of different emails differ
+    return email if position == 0 else email + "\0" + str(position)
+
+
+def get_email_index_check(key: str) -> int:
+    """
+    Get the check hash of an email_index key, which is independent of the hash the key is stored by,
+    so that two keys with the same hash_function_string_key hash are told apart.
+
+    :param key: The email_index key, see get_email_index_key
+    :return: The check hash as an int of at most 64 bits
+    """
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8, person=b"email-check").digest(), 'little')
+
+
+def get_email_index_probe_key(key: str, probe: int) -> str:
+    """
+    Get the key under which an email_index key is stored after *probe* other keys with the same hash.
+
+    :param key: The email_index key, see get_email_index_key
+    :param probe: The amount of entries of other keys that were probed past
+    :return: The key to store the entry under
+    """
+    return key if probe == 0 else key + "\1" + str(probe)
+
+
+def find_email_index_entry(key: str) -> Tuple[int, Union[Tuple[int, int, int, int], None]]:
+    """
+    Find the entry of an email_index key. When the entry that a key is stored under belongs to another
+    key with the same hash (its check hash differs), the key is looked up under its next probe key,
+    for as long as the entries are marked EMAIL_INDEX_PROBED_PAST.
+
+    :param key: The email_index key, see get_email_index_key
+    :return: (probe, (user id, user count, check hash, flags)) of the entry, or (probe, None) if there is none
+    """
+    check: int = get_email_index_check(key)
+    probe: int = 0
+    while True:
+        found: Union[BucketValue, None] = email_index.get(get_email_index_probe_key(key, probe))
+        if found is None:
+            return probe, None
+        entry: Tuple[int, int, int, int] = EMAIL_INDEX_VALUE_STRUCT.unpack(found.value)
+        if entry[2] == check and not entry[3] & EMAIL_INDEX_DELETED:
+            return probe, entry
+        if not entry[3] & EMAIL_INDEX_PROBED_PAST:
+            return probe, None
+        probe += 1
+
+
+def set_email_index_entry(key: str, user_id: int, user_count: int) -> None:
+    """
+    Store the entry of an email_index key, replacing its current entry if it has one. Otherwise the entry
+    is stored under the first probe key that is free or deleted, and the entries of the other keys that
+    are probed past are marked EMAIL_INDEX_PROBED_PAST.
+
+    :param key: The email_index key, see get_email_index_key
+    :param user_id: The id of the user
+    :param user_count: The amount of users with the email, only kept at position 0
+    """
+    check: int = get_email_index_check(key)
+    probe, entry = find_email_index_entry(key)
+    if entry is not None:
+        email_index.insert_keyval(get_email_index_probe_key(key, probe), EMAIL_INDEX_VALUE_STRUCT.pack(user_id, user_count, check, entry[3]))
+        return
+
+    probe = 0
+    while True:
+        probe_key: str = get_email_index_probe_key(key, probe)
+        found: Union[BucketValue, None] = email_index.get(probe_key)
+        if found is None:
+            email_index.insert_keyval(probe_key, EMAIL_INDEX_VALUE_STRUCT.pack(user_id, user_count, check, 0))
+            return
+        other: Tuple[int, int, int, int] = EMAIL_INDEX_VALUE_STRUCT.unpack(found.value)
+        if other[3] & EMAIL_INDEX_DELETED:
+            email_index.insert_keyval(probe_key, EMAIL_INDEX_VALUE_STRUCT.pack(user_id, user_count, check, EMAIL_INDEX_PROBED_PAST))
+            return
+        if not other[3] & EMAIL_INDEX_PROBED_PAST:
+            email_index.insert_keyval(probe_key, EMAIL_INDEX_VALUE_STRUCT.pack(*other[:3], other[3] | EMAIL_INDEX_PROBED_PAST))
+        probe += 1
+
+
+def delete_email_index_entry(key: str) -> None:
+    """
+    Delete the entry of an email_index key, if it has one. An entry that other keys were
+    probed past is kept as a deleted entry, so that those keys are still found.
+
+    :param key: The email_index key, see get_email_index_key
+    """
+    probe, entry = find_email_index_entry(key)
+    if entry is None:
+        return
+    if entry[3] & EMAIL_INDEX_PROBED_PAST:
+        email_index.insert_keyval(get_email_index_probe_key(key, probe),
+                                  EMAIL_INDEX_VALUE_STRUCT.pack(0, 0, 0, EMAIL_INDEX_PROBED_PAST | EMAIL_INDEX_DELETED))
+    else:
+        email_index.delete(get_email_index_probe_key(key, probe))
+
+
+def close_email_index() -> None:
+    """
+    Flush and close the email_index.
+    """
+    global email_index
+
+    if email_index is not None:
+        email_index.close()
+        email_index = None
+
+
+def build_email_index(db_filename: str, user_ids, emails) -> None:
+    """
+    Create the email_index of a database file from scratch.
+
+    :param db_filename: The file name of the database file
+    :param user_ids: numpy array with the id of every user
+    :param emails: pandas series with the email of every user
+    """
+    global email_index
+
+    close_email_index()
+    email_index = ExtendibleHashingIndex(bucketsDataFileName=get_email_index_filename(db_filename), keySize=8,
+                                         valueSize=EMAIL_INDEX_VALUE_STRUCT.size, hashFunction=hash_function_string_key)
+    emails = pd.Series(emails).reset_index(drop=True)
+    positions = emails.groupby(emails, sort=False).cumcount().to_numpy()
+    user_counts = emails.groupby(emails, sort=False).transform('size').to_numpy()
+    assert not EMAIL_INDEX_UNIQUE or (positions == 0).all(), "email is not unique"
+
+    # key hash -> [user id, user count, check hash, flags], keys with the same hash are probed like in set_email_index_entry
+    entries: Dict[int, List[int]] = dict()
+    for key, user_id, user_count in zip(map(get_email_index_key, emails.tolist(), positions.tolist()),
+                                        np.asarray(user_ids).tolist(), np.where(positions == 0, user_counts, 0).tolist()):
+        probe: int = 0
+        key_hash: int = hash_function_string_key(key)
+        while key_hash in entries:
+            entries[key_hash][3] |= EMAIL_INDEX_PROBED_PAST
+            probe += 1
+            key_hash = hash_function_string_key(get_email_index_probe_key(key, probe))
+        entries[key_hash] = [user_id, user_count, get_email_index_check(key), 0]
+    email_index.bulk_load(((key_hash, EMAIL_INDEX_VALUE_STRUCT.pack(*entry)) for key_hash, entry in entries.items()),
+                          hash_function=lambda key_hash: key_hash)
+
+
+def get_email_user_ids(email: str) -> List[int]:
+    """
+    Get the ids of the users with an email from the email_index. The keys of an email are told
+    apart from other keys with the same hash by their check hash, see find_email_index_entry.
+
+    :param email: The email to look up
+    :return: The user ids, in the order of their positions in the email_index
+    """
+    _, first = find_email_index_entry(get_email_index_key(email, 0))
+    if first is None:
+        return []
+    user_ids: List[int] = [first[0]]
+    keys: List[str] = [get_email_index_key(email, position) for position in range(1, first[1])]
+    # the entries are looked up under their own keys at once, only the keys with the same hash as another key are probed
+    for key, found in zip(keys, email_index.get_many(keys)):
+        entry = None if found is None else EMAIL_INDEX_VALUE_STRUCT.unpack(found.value)
+        if entry is None or entry[2] != get_email_index_check(key) or entry[3] & EMAIL_INDEX_DELETED:
+            _, entry = find_email_index_entry(key)
+        assert entry is not None, f"The email index is missing users of email '{email}'"
+        user_ids.append(entry[0])
+    return user_ids
+
+
+def set_email_user(email: str, position: int, user_id: int, user_count: int = 0) -> None:
+    """
+    Store the user at a position among the users with the same email in the email_index.
+
+    :param email: The email of the user
+    :param position: The position of the user
+    :param user_id: The id of the user
+    :param user_count: The amount of users with the email, only kept at position 0
+    """
+    set_email_index_entry(get_email_index_key(email, position), user_id, user_count)
+
+
+def add_to_email_index(email: str, user_id: int) -> None:
+    """
+    Add a created or updated user to the email_index, if there is one.
+
+    :param email: The email of the user
+    :param user_id: The id of the user
+    """
+    if email_index is None:
+        return
+    # only the entry at position 0 is read, it holds the first user and the amount of users
+    _, first = find_email_index_entry(get_email_index_key(email, 0))
+    if first is None:
+        set_email_user(email, 0, user_id, 1)
+        return
+    first_user_id, user_count = first[0], first[1]
+    set_email_user(email, user_count, user_id)
+    set_email_user(email, 0, first_user_id, user_count + 1)
+
+
+def remove_from_email_index(email: str, user_id: int) -> None:
+    """
+    Remove a deleted or updated user from the email_index, if there is one.
+    The user at the last position takes the position of the removed user.
+    A user that is not in the email_index is ignored.
+
+    :param email: The email of the user
+    :param user_id: The id of the user
+    """
+    if email_index is None:
+        return
+    user_ids: List[int] = get_email_user_ids(email)
+    if user_id not in user_ids:
+        return
+    position: int = user_ids.index(user_id)
+    user_ids[position] = user_ids[-1]
+    user_ids.pop()
+    delete_email_index_entry(get_email_index_key(email, len(user_ids)))
+    if 0 < position < len(user_ids):
+        set_email_user(email, position, user_ids[position])
+    if user_ids:
+        set_email_user(email, 0, user_ids[0], len(user_ids))
+
+
+def check_email_unique(db_filename: str, email: str, user_id: int) -> None:
+    """
+    If EMAIL_INDEX_UNIQUE is set, check that no user other than *user_id* has the email.
+
+    :param db_filename: The file name of the database file
+    :param email: The email of a created or updated user
+    :param user_id: The id of the created or updated user
+    """
+    if not EMAIL_INDEX_UNIQUE or email_index is None:
+        return
+    other_user_ids = [other_user_id for other_user_id in get_email_user_ids(email) if other_user_id != user_id]
+    for user in read_var_length_users(db_filename, other_user_ids):
+        assert user is None or user[IDX_EMAIL] != email, f"email '{email}' is already used by user {user[IDX_ID]}"
+
+
+def get_free_space_map_filename(db_filename: str) -> str:
+    """
+    Get the name of the file the remaining_page_mem_index of a database file is saved to.
+
+    :param db_filename: The file name of the database file
+    :return: The file name of the free space map file
+    """
+    return db_filename + ".fsm"
+
+
+def get_wal_filename(db_filename: str) -> str:
+    """
+    Get the name of the write-ahead log file belonging to a database file.
+
+    :param db_filename: The file name of the database file
+    :return: The file name of the write-ahead log
+    """
+    return db_filename + ".wal"
+
+
+def get_write_ahead_log(db_filename: str) -> Union[WriteAheadLog, None]:
+    """
+    Get the write_ahead_log if it belongs to a database file.
+
+    :param db_filename: The file name of the database file
+    :return: The write-ahead log, None if the database file was not saved or opened last
+    """
+    if write_ahead_log is not None and write_ahead_log.filename == get_wal_filename(db_filename):
+        return write_ahead_log
+    return None
+
+
+def close_write_ahead_log() -> None:
+    """
+    Commit the buffered records of the write_ahead_log and close it, without emptying it.
+    """
+    global write_ahead_log
+
+    if write_ahead_log is not None:
+        write_ahead_log.close()
+        write_ahead_log = None
+
+
+def sync_file(filename: str) -> None:
+    """
+    Force a file that was written with a regular file object to disk.
+
+    :param filename: The file to sync
+    """
+    fd: int = os.open(filename, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def locked_operation(function):
+    """
+    Decorator for the functions that use the page buffer pool, the indexes or the write_ahead_log, which
+    makes them safe to call from several threads: the function runs while it holds the database_lock.
+    The write-ahead log record that the function appended is committed after the lock is released, so
+    that threads that commit at the same time wait for a single fsync together (see WriteAheadLog.commit).
+
+    :param function: The function to decorate
+    :return: The decorated function
+    """
+    @functools.wraps(function)
+    def locked_function(*args, **kwargs):
+        with database_lock:
+            operation_state.depth = getattr(operation_state, "depth", 0) + 1
+            try:
+                result = function(*args, **kwargs)
+            finally:
+                operation_state.depth -= 1
+                lsn: int = 0
+                if operation_state.depth == 0:
+                    lsn, operation_state.lsn = getattr(operation_state, "lsn", 0), 0
+                wal: Union[WriteAheadLog, None] = write_ahead_log
+        if lsn > 0 and wal is not None:
+            commit_logged_operation(wal, lsn)
+        return result
+
+    return locked_function
+
+
+def commit_logged_operation(wal: WriteAheadLog, lsn: int) -> None:
+    """
+    Commit the write-ahead log up to the record of an operation, or leave it buffered if WAL_GROUP_COMMIT_SIZE
+    is raised and fewer records are buffered.
+
+    :param wal: The write-ahead log
+    :param lsn: The LSN of the record of the operation
+    """
+    if WAL_GROUP_COMMIT_SIZE <= 1 or wal.pending_count >= WAL_GROUP_COMMIT_SIZE:
+        wal.commit(lsn)
+
+
+def begin_logged_operation(db_filename: str) -> None:
+    """
+    Call before the first change of a CRUD operation. The first change after a checkpoint is preceded
+    by an empty record that is forced to disk right away, so that open_var_length_db notices a crash
+    even when it happened before the page changes were logged, while the index files may already have
+    been written (the indexes are rebuilt from the pages when the log is replayed).
+
+    :param db_filename: The file name of the database file
+    """
+    wal: Union[WriteAheadLog, None] = get_write_ahead_log(db_filename)
+    if wal is not None and wal.is_empty:
+        wal.commit(wal.append(b""))
+
+
+def log_page_changes(db_filename: str, pages: Dict[int, Page]) -> None:
+    """
+    Append the changes of a CRUD operation to the write_ahead_log, as a single record with the changed
+    bytes of every page (see Page.pop_changes), so that the operation is replayed completely or not at all.
+    The pages must still be pinned, so that they cannot be written before their changes are logged.
+    The record is committed before the operation returns, unless WAL_GROUP_COMMIT_SIZE is raised. Within
+    a locked_operation, that happens after the database_lock is released, see commit_logged_operation.
+
+    :param db_filename: The file name of the database file
+    :param pages: page number -> Page, of the pages that the operation changed
+    """
+    wal: Union[WriteAheadLog, None] = get_write_ahead_log(db_filename)
+    if wal is None:
+        for page in pages.values():
+            page.changed_ranges = []
+        return
+
+    entries: List[bytes] = []
+    for page_number, page in pages.items():
+        for address, data in page.pop_changes():
+            entries.append(WAL_PAGE_DELTA_STRUCT.pack(WAL_PAGE_DELTA, page_number, address, len(data)))
+            entries.append(data)
+    if not entries:
+        return
+
+    lsn: int = wal.append(b"".join(entries))
+    for page in pages.values():
+        page.lsn = lsn
+    if getattr(operation_state, "depth", 0) > 0:
+        operation_state.lsn = lsn
+    else:
+        commit_logged_operation(wal, lsn)
+
+
+def log_truncate(db_filename: str, page_count: int) -> None:
+    """
+    Log that the database file is cut off after *page_count* pages, and commit the log, so that the moved
+    tuples of the cut off pages are logged on disk before the pages are removed from the file.
+
+    :param db_filename: The file name of the database file
+    :param page_count: The amount of pages that are kept
+    """
+    wal: Union[WriteAheadLog, None] = get_write_ahead_log(db_filename)
+    if wal is not None:
+        wal.commit(wal.append(WAL_TRUNCATE_STRUCT.pack(WAL_TRUNCATE, page_count)))
+
+
+def replay_write_ahead_log(db_filename: str) -> int:
+    """
+    Redo the changes in the write_ahead_log on the database file, for recovery after a crash.
+    The records hold the new bytes of the changes, so replaying a change that already reached
+    the database file has no effect.
+
+    :param db_filename: The file name of the database file
+    :return: The amount of replayed records
+    """
+    wal: WriteAheadLog = get_write_ahead_log(db_filename)
+    record_count: int = 0
+    db_file: int = os.open(db_filename, os.O_RDWR | getattr(os, "O_BINARY", 0))
+    try:
+        for lsn, payload in wal.records():
+            position: int = 0
+            while position < len(payload):
+                if payload[position] == WAL_PAGE_DELTA:
+                    kind, page_number, address, size = WAL_PAGE_DELTA_STRUCT.unpack_from(payload, position)
+                    position += WAL_PAGE_DELTA_STRUCT.size
+                    write_at(db_file, payload[position: position + size], page_number * PAGE_SIZE + address)
+                    position += size
+                else:
+                    kind, page_count = WAL_TRUNCATE_STRUCT.unpack_from(payload, position)
+                    assert kind == WAL_TRUNCATE, f"Unknown write-ahead log entry kind {kind} in record {lsn}"
+                    position += WAL_TRUNCATE_STRUCT.size
+                    os.ftruncate(db_file, page_count * PAGE_SIZE)
+            record_count += 1
+
+        # a new page is only logged up to its last change, the rest of it is empty
+        file_size: int = os.fstat(db_file).st_size
+        if file_size % PAGE_SIZE != 0:
+            os.ftruncate(db_file, file_size + PAGE_SIZE - file_size % PAGE_SIZE)
+        os.fsync(db_file)
+    finally:
+        os.close(db_file)
+    return record_count
+
+
+def build_user_index(db_filename: str) -> None:
+    """
+    Rebuild the user_index from the slots of the pages of a database file.
+
+    :param db_filename: The file name of the database file
+    """
+    global user_index
+
+    close_user_index()
+    user_index = ExtendibleHashingIndex(bucketsDataFileName=get_user_index_filename(db_filename))
+    user_ids, tuple_locations = [], []
+    for first_page, page_data in scan_pages_var_length(db_filename):
+        tuple_offsets, slot_offsets = get_tuple_locations_var_length(page_data)
+        user_ids.append(decode_fixed_fields_var_length(page_data, tuple_offsets)['id'].astype(np.int64))
+        locations = np.zeros(len(slot_offsets), dtype=[('page', '<u8'), ('slot', '<u8')])
+        locations['page'] = first_page + slot_offsets // PAGE_SIZE
+        locations['slot'] = slot_offsets % PAGE_SIZE
+        tuple_locations.append(locations)
+
+    tuple_locations_bytes: bytes = b"".join(locations.tobytes() for locations in tuple_locations)
+    user_index.bulk_load(zip(np.concatenate(user_ids or [np.zeros(0, dtype=np.int64)]).tolist(),
+                             (tuple_locations_bytes[i: i + 16] for i in range(0, len(tuple_locations_bytes), 16))))
+
+
+@locked_operation
+def save_users_to_binary_var_length(filename, df, fill_factor: float = None):
     """
     saves users to fixed-length pages (our file is split up into blocks of fixed length (= pages), in this case 8192 bytes that each can contain a certain number of users)
     we also make a bplustree with key = user id and value = page number and offset of the user in that page to be able to quickly find a user by id
     file layout: [page1 page2 ... page_N]
     page layout: [N offset_t1 offset_t2... offset_tN offset_tN+1 t1 t2 ... tN]
+    The pages are built column by column with numpy instead of row by row, see encode_users_var_length.
 
     :param filename: binary file to save
     :param df: pandas dataframe contains all users
+    :param fill_factor: The fraction of every page to fill, defaults to PAGE_FILL_FACTOR
     :return:
     """
-    from typing import List
+    global user_index, write_ahead_log
+
+    # rebuild the index from scratch, next to the database file
+    close_user_index()
+    user_index = ExtendibleHashingIndex(bucketsDataFileName=get_user_index_filename(filename))
+    remaining_page_mem_index.clear()
+    page_zone_maps.clear()
+    build_secondary_indexes(filename, df['id'].to_numpy().astype(np.int64),
+                            [df[column].to_numpy().astype(np.int64) for column in SECONDARY_INDEX_COLUMNS])
+    build_email_index(filename, df['id'].to_numpy().astype(np.int64), df['email'])
+    # the cached pages of an overwritten file are no longer valid, and so are its logged changes
+    close_page_buffer_pool(flush=page_buffer_pool is not None and page_buffer_pool.db_filename != filename)
+    close_write_ahead_log()
+    if os.path.exists(get_wal_filename(filename)):
+        os.remove(get_wal_filename(filename))
+
+    # encode all users column by column and divide them over the pages
+    fixed_fields, string_fields, tuple_sizes = encode_users_var_length(df)
+    user_count: int = len(tuple_sizes)
+    page_bounds = assign_tuples_to_pages(tuple_sizes, fill_factor)
+    tuples_per_page = np.diff(page_bounds)
+    # an empty database still has one (empty) page
+    page_count: int = max(1, len(tuples_per_page))
+
+    # the location of every tuple: its page, its slot address and its tuple address within the page
+    page_numbers = np.repeat(np.arange(len(tuples_per_page)), tuples_per_page)
+    first_tuples = page_bounds[:-1][page_numbers]
+    slot_addresses = TUPLE_CTR_SIZE + (np.arange(user_count) - first_tuples) * OFFSET_SIZE
+    # tuples grow from back to front, so a tuple starts where all tuples of the page up to and including it end
+    tuple_ends = np.concatenate(([0], np.cumsum(tuple_sizes)))
+    tuple_addresses = PAGE_SIZE - (tuple_ends[1:] - tuple_ends[first_tuples])
+
+    # add key = user id, value = page number and offset of user in that page to the index
+    tuple_locations = np.zeros(user_count, dtype=[('page', '<u8'), ('slot', '<u8')])
+    tuple_locations['page'] = page_numbers
+    tuple_locations['slot'] = slot_addresses
+    tuple_locations_bytes: bytes = tuple_locations.tobytes()
+    user_index.bulk_load(zip(df['id'].to_numpy().astype(np.int64).tolist(),
+                             (tuple_locations_bytes[i: i + 16] for i in range(0, len(tuple_locations_bytes), 16))))
 
-    # create pages
-    pages: List[Page] = []
-    page: Page = create_empty_page()
-    pages.append(page)
-
-    for index, row in df.iterrows():
-        user = encode_user_var_length(row)
+    # note how much free space there is left per page
+    slot_ends = np.concatenate(([0], np.cumsum(tuple_sizes + OFFSET_SIZE)))
+    free_page_space = PAGE_SIZE - TUPLE_CTR_SIZE - (slot_ends[page_bounds[1:]] - slot_ends[page_bounds[:-1]])
+    for idx, free_bytes in enumerate(free_page_space.tolist() or [PAGE_SIZE - TUPLE_CTR_SIZE]):
+        remaining_page_mem_index[idx] = free_bytes
+
+    # assemble and write the pages in chunks of about 4MB
+    string_data_ends = [np.concatenate(([0], np.cumsum(lengths))) for data, lengths in string_fields]
+    pages_per_chunk: int = max(1, (1 << 22) // PAGE_SIZE)
+    with open(filename, "wb") as f:
+        for first_page in range(0, page_count, pages_per_chunk):
+            last_page: int = min(page_count, first_page + pages_per_chunk)
+            chunk = np.zeros((last_page - first_page) * PAGE_SIZE, dtype=np.uint8)
+            chunk_base: int = first_page * PAGE_SIZE
+            first_tuple: int = int(page_bounds[min(first_page, len(page_bounds) - 1)])
+            last_tuple: int = int(page_bounds[min(last_page, len(page_bounds) - 1)])
+            chunk_page_numbers = page_numbers[first_tuple: last_tuple]
+
+            # tuple counters and slot arrays
+            chunk_tuple_counts = tuples_per_page[first_page: last_page]
+            scatter_little_endian(chunk, np.arange(len(chunk_tuple_counts)) * PAGE_SIZE, chunk_tuple_counts, TUPLE_CTR_SIZE)
+            scatter_little_endian(chunk, chunk_page_numbers * PAGE_SIZE - chunk_base + slot_addresses[first_tuple: last_tuple],
+                                  tuple_addresses[first_tuple: last_tuple], OFFSET_SIZE)
+
+            # tuples: the integer fields, then every string field as its length followed by its characters
+            tuple_offsets = chunk_page_numbers * PAGE_SIZE - chunk_base + tuple_addresses[first_tuple: last_tuple]
+            chunk[tuple_offsets[:, None] + np.arange(fixed_fields.shape[1])] = fixed_fields[first_tuple: last_tuple]
+            field_offsets = tuple_offsets + fixed_fields.shape[1]
+            for (data, lengths), data_ends in zip(string_fields, string_data_ends):
+                chunk_lengths = lengths[first_tuple: last_tuple]
+                chunk[field_offsets] = chunk_lengths
+                chunk_data_ends = data_ends[first_tuple: last_tuple + 1] - data_ends[first_tuple]
+                # the destination of every character: the start of its string plus its position in the string
+                character_offsets = np.repeat(field_offsets + 1 - chunk_data_ends[:-1], chunk_lengths) + np.arange(chunk_data_ends[-1])
+                chunk[character_offsets] = data[data_ends[first_tuple]: data_ends[last_tuple]]
+                field_offsets = field_offsets + 1 + chunk_lengths
+
+            f.write(chunk)
+            mins, maxs = compute_zone_maps_var_length(chunk)
+            for idx in range(len(mins)):
+                page_zone_maps.set_page(first_page + idx, mins[idx], maxs[idx])
+
+    # persist the indexes, so that open_var_length_db can reopen them
+    write_ahead_log = WriteAheadLog(get_wal_filename(filename))
+    flush_var_length_db(filename)
+
+
+@locked_operation
+def flush_var_length_db(db_filename: str) -> None:
+    """
+    Checkpoint a database file: write the dirty pages in the page buffer pool back to the file,
+    and persist its user_index, remaining_page_mem_index, page_zone_maps, secondary_indexes
+    and email_index, so that open_var_length_db can restore them. Once all of these are forced
+    to disk, the write_ahead_log is emptied.
 
-        if not page.data_fits(user):
-            page: Page = create_empty_page()
-            pages.append(page)
+    :param db_filename: The file name of the database file
+    """
+    wal: Union[WriteAheadLog, None] = get_write_ahead_log(db_filename)
+    if wal is not None:
+        wal.commit()
+    if page_buffer_pool is not None and page_buffer_pool.db_filename == db_filename:
+        page_buffer_pool.sync()
+    else:
+        sync_file(db_filename)
+    if user_index is not None:
+        user_index.sync()
+    remaining_page_mem_index.save(get_free_space_map_filename(db_filename))
+    sync_file(get_free_space_map_filename(db_filename))
+    page_zone_maps.save(get_zone_maps_filename(db_filename))
+    sync_file(get_zone_maps_filename(db_filename))
+    for secondary_index in secondary_indexes.values():
+        secondary_index.sync()
+    if email_index is not None:
+        email_index.sync()
+    if wal is not None:
+        wal.reset()
+
+
+def commit_var_length_db(db_filename: str) -> None:
+    """
+    Force the write-ahead log records of all CRUD operations on a database file to disk, so that they
+    survive a crash, without a checkpoint. See WAL_GROUP_COMMIT_SIZE.
 
-        # write user to page
-        new_offset_address: int = page.append_tuple(user)
+    :param db_filename: The file name of the database file
+    """
+    wal: Union[WriteAheadLog, None] = get_write_ahead_log(db_filename)
+    if wal is not None:
+        wal.commit()
 
-        # add key = user id, value = page number and offset of user in that page to bplustree
-        user_index.insert_keyval(row['id'], (len(pages) - 1).to_bytes(8, byteorder='little') + new_offset_address.to_bytes(8, byteorder='little'))
-        # user_index[row['id']] = (len(pages) - 1).to_bytes(8, byteorder='little') + new_offset_address.to_bytes(8, byteorder='little')
 
-    # note how much free space there is left per page
-    for idx, p in enumerate(pages):
-        allocated_offsetptr_space: int = p.tuple_count * p.slot_size
-        free_page_space: int = p.tuples_data_base_address - (p.tuple_ctr_size + allocated_offsetptr_space)
-        remaining_page_mem_index[idx] = free_page_space
+@locked_operation
+def close_var_length_db(db_filename: str) -> None:
+    """
+    Checkpoint a database file (see flush_var_length_db) and close it: the page buffer pool, the
+    write_ahead_log and all indexes. Because the write-ahead log is empty afterwards, open_var_length_db
+    reopens the indexes from their files. A database file that was changed and not checkpointed
+    before the program ends is recovered instead, which rebuilds all indexes from the pages.
 
-    with open(filename, "wb") as f:
-        # write pages to file
-        for page in pages:
-            f.write(page.bytearray)
+    :param db_filename: The file name of the database file
+    """
+    flush_var_length_db(db_filename)
+    close_page_buffer_pool()
+    close_write_ahead_log()
+    close_user_index()
+    close_secondary_indexes()
+    close_email_index()
 
-    f.close()
 
+@locked_operation
+def open_var_length_db(db_filename: str) -> None:
+    """
+    Reopen a database file that was saved before, without rebuilding its user_index.
+    The index is mapped back in from its bucket storage file (see get_user_index_filename),
+    and the remaining_page_mem_index is loaded from its file (see get_free_space_map_filename),
+    or restored from the page headers if that file does not exist.
+    The page_zone_maps are loaded from their file (see get_zone_maps_filename), or recomputed
+    with a scan of the pages if that file does not exist. The same goes for the secondary_indexes
+    (see get_secondary_index_filename) and the email_index (see get_email_index_filename).
+
+    If the write-ahead log (see get_wal_filename) is not empty, the database was not checkpointed
+    after its last changes, for instance because of a crash. The logged page changes are then replayed
+    (see replay_write_ahead_log) and all indexes are rebuilt from the pages, after which the database
+    is checkpointed.
 
-def load_users_from_binary_var_length(filename):
+    :param db_filename: The file name of the database file
+    """
+    global user_index, remaining_page_mem_index, page_zone_maps, email_index, write_ahead_log
+
+    close_page_buffer_pool()
+    close_write_ahead_log()
+    close_user_index()
+    close_secondary_indexes()
+    close_email_index()
+
+    write_ahead_log = WriteAheadLog(get_wal_filename(db_filename))
+    is_recovery: bool = not write_ahead_log.is_empty
+    if is_recovery:
+        replay_write_ahead_log(db_filename)
+        # the index files may be older or newer than the pages
+        index_filenames: List[str] = [get_user_index_filename(db_filename), get_free_space_map_filename(db_filename),
+                                      get_zone_maps_filename(db_filename), get_email_index_filename(db_filename)]
+        index_filenames += [get_secondary_index_filename(db_filename, column) for column in SECONDARY_INDEX_COLUMNS]
+        for filename in index_filenames:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    if os.path.exists(get_user_index_filename(db_filename)):
+        user_index = ExtendibleHashingIndex.open(get_user_index_filename(db_filename))
+    else:
+        build_user_index(db_filename)
+    page_count: int = os.path.getsize(db_filename) // PAGE_SIZE
+
+    if os.path.exists(get_free_space_map_filename(db_filename)):
+        remaining_page_mem_index = FreeSpaceMap.load(get_free_space_map_filename(db_filename), PAGE_PLACEMENT_POLICY)
+    else:
+        remaining_page_mem_index.clear()
+        with open(db_filename, "rb") as f:
+            for page_number in range(page_count):
+                f.seek(page_number * PAGE_SIZE)
+                tuple_count: int = int.from_bytes(f.read(TUPLE_CTR_SIZE), 'little')
+                tuples_data_base_address: int = PAGE_SIZE
+                if tuple_count > 0:
+                    # the last slot refers to the tuple at the lowest address
+                    f.seek(page_number * PAGE_SIZE + TUPLE_CTR_SIZE + (tuple_count - 1) * OFFSET_SIZE)
+                    tuples_data_base_address = int.from_bytes(f.read(OFFSET_SIZE), 'little')
+                remaining_page_mem_index[page_number] = tuples_data_base_address - TUPLE_CTR_SIZE - tuple_count * OFFSET_SIZE
+
+    zone_maps: Union[ZoneMaps, None] = None
+    if os.path.exists(get_zone_maps_filename(db_filename)):
+        zone_maps = ZoneMaps.load(get_zone_maps_filename(db_filename), ZONE_MAP_COLUMNS)
+    if zone_maps is None or len(zone_maps) != page_count:
+        zone_maps = ZoneMaps(ZONE_MAP_COLUMNS)
+        for first_page, page_data in scan_pages_var_length(db_filename):
+            mins, maxs = compute_zone_maps_var_length(page_data)
+            for idx in range(len(mins)):
+                zone_maps.set_page(first_page + idx, mins[idx], maxs[idx])
+    page_zone_maps = zone_maps
+
+    if all(os.path.exists(get_secondary_index_filename(db_filename, column)) for column in SECONDARY_INDEX_COLUMNS):
+        for column in SECONDARY_INDEX_COLUMNS:
+            secondary_indexes[column] = BPlusTree.open(get_secondary_index_filename(db_filename, column))
+    else:
+        users = load_users_from_binary_var_length(db_filename, ['id'] + SECONDARY_INDEX_COLUMNS)
+        build_secondary_indexes(db_filename, users['id'].to_numpy(), [users[column].to_numpy() for column in SECONDARY_INDEX_COLUMNS])
+
+    if os.path.exists(get_email_index_filename(db_filename)):
+        email_index = ExtendibleHashingIndex.open(get_email_index_filename(db_filename), hashFunction=hash_function_string_key)
+    if email_index is not None and email_index.valueSize != EMAIL_INDEX_VALUE_STRUCT.size:
+        # an email index without check hashes, from before they were added
+        close_email_index()
+    if email_index is None:
+        users = load_users_from_binary_var_length(db_filename, ['id', 'email'])
+        build_email_index(db_filename, users['id'].to_numpy(), users['email'])
+
+    if is_recovery:
+        flush_var_length_db(db_filename)
+
+
+@locked_operation
+def load_users_from_binary_var_length(filename, columns=None):
     """
     load users from pages
     page layout: [N offset_t1 offset_t2... offset_tN offset_tN+1 tN ...t2 t1]
+    The users are decoded column by column, see decode_users_var_length.
 
     :param filename: binary file to load
+    :param columns: The columns to load (see new_user_columns), defaults to all columns
     :return: pandas dataframe contains all users
     """
+    # the file must contain the pages that are only modified in the page buffer pool
+    if page_buffer_pool is not None and page_buffer_pool.db_filename == filename:
+        page_buffer_pool.flush()
 
     # extract users
-    users = []
     with open(filename, "rb") as f:
-        # iterate over pages
-        page = f.read(PAGE_SIZE)
-        while page:
-            # get number of users in page
-            nr_users_in_page = int.from_bytes(page[0:TUPLE_CTR_SIZE], 'little')
-
-            # iterate over users
-            for i in range(nr_users_in_page):
-                # get offset of user
-                offset_offset = TUPLE_CTR_SIZE + i*OFFSET_SIZE
-                offset = int.from_bytes(page[offset_offset:offset_offset + OFFSET_SIZE], 'little')
-
-                user_size = 0
-                if i == 0:
-                    user_size = PAGE_SIZE - offset
-                else:
-                    prev_offset = int.from_bytes(page[offset_offset - OFFSET_SIZE:offset_offset], 'little')
-                    user_size = prev_offset - offset
+        page_data = np.frombuffer(f.read(), dtype=np.uint8)
+
+    return decode_users_var_length(page_data[:len(page_data) - len(page_data) % PAGE_SIZE], columns)
 
-                # get user
-                user = page[offset:offset + user_size]
-                # decode user
-                users.append(decode_user_var_length(user))
 
-            # read next page
-            page = f.read(PAGE_SIZE)
+def init_scan_worker(page_size: int) -> None:
+    """
+    Initialize a worker process of load_users_from_binary_var_length_parallel,
+    which may have imported this module anew.
 
-    df = pd.DataFrame(users, columns=new_user_columns)
-    return df
+    :param page_size: The PAGE_SIZE of the parent process
+    """
+    global PAGE_SIZE
+    PAGE_SIZE = page_size
+
+
+def decode_page_range_var_length(filename, first_page: int, last_page: int, columns=None):
+    """
+    Decode the users of a range of pages of a binary file, see decode_users_var_length.
+    The file is memory-mapped, so that a worker process of load_users_from_binary_var_length_parallel
+    reads the pages itself instead of receiving them from the parent process.
+
+    :param filename: binary file to load
+    :param first_page: The page number of the first page to decode
+    :param last_page: The page number after the last page to decode
+    :param columns: The columns to load (see new_user_columns), defaults to all columns
+    :return: pandas dataframe with the users of the pages, in page order
+    """
+    with open(filename, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+        page_data = np.frombuffer(mapped_file, dtype=np.uint8, count=(last_page - first_page) * PAGE_SIZE, offset=first_page * PAGE_SIZE)
+        users = decode_users_var_length(page_data, columns)
+        # the mapping can only be closed when no array refers to it anymore
+        del page_data
+    return users
 
 
+@locked_operation
+def load_users_from_binary_var_length_parallel(filename, columns=None, process_count: int = None, ordered: bool = True):
+    """
+    Parallel version of load_users_from_binary_var_length: the pages are divided into ranges, which are
+    decoded by a pool of worker processes (see decode_page_range_var_length), and the results are concatenated.
+    There are several ranges per process, so that a process that finishes early takes over the remaining ranges.
+
+    :param filename: binary file to load
+    :param columns: The columns to load (see new_user_columns), defaults to all columns
+    :param process_count: The amount of worker processes, defaults to SCAN_PROCESS_COUNT
+    :param ordered: Whether to return the users in page order, like load_users_from_binary_var_length,
+        or to concatenate the page ranges in the order in which they are decoded, which starts sooner
+    :return: pandas dataframe contains all users
+    """
+    # the file must contain the pages that are only modified in the page buffer pool
+    if page_buffer_pool is not None and page_buffer_pool.db_filename == filename:
+        page_buffer_pool.flush()
+
+    process_count = SCAN_PROCESS_COUNT if process_count is None else process_count
+    page_count: int = os.path.getsize(filename) // PAGE_SIZE
+    if page_count == 0:
+        return decode_users_var_length(np.zeros(0, dtype=np.uint8), columns)
+    pages_per_range: int = -(-page_count // (4 * process_count))
+    page_ranges = [(first_page, min(page_count, first_page + pages_per_range)) for first_page in range(0, page_count, pages_per_range)]
+
+    with ProcessPoolExecutor(max_workers=process_count, initializer=init_scan_worker, initargs=(PAGE_SIZE,)) as executor:
+        futures = [executor.submit(decode_page_range_var_length, filename, first_page, last_page, columns)
+                   for first_page, last_page in page_ranges]
+        results = [future.result() for future in (futures if ordered else as_completed(futures))]
+    return pd.concat(results, ignore_index=True)
+
+
+def scan_pages_var_length(filename):
+    """
+    Read the pages of a database file sequentially, in chunks of SCAN_READ_SIZE bytes.
+    The same buffer is reused for every chunk, so the memory use does not depend on the file size.
+
+    :param filename: binary file to scan
+    :return: generator of (page number of the first page, uint8 numpy array with the bytes of whole pages)
+        pairs, the array is only valid until the next chunk is read
+    """
+    # the file must contain the pages that are only modified in the page buffer pool
+    with database_lock:
+        if page_buffer_pool is not None and page_buffer_pool.db_filename == filename:
+            page_buffer_pool.flush()
+
+    buffer = bytearray(max(1, SCAN_READ_SIZE // PAGE_SIZE) * PAGE_SIZE)
+    page_number: int = 0
+    with open(filename, "rb") as f:
+        while True:
+            read_size: int = f.readinto(buffer)
+            read_size -= read_size % PAGE_SIZE
+            if read_size == 0:
+                break
+            yield page_number, np.frombuffer(buffer, dtype=np.uint8, count=read_size)
+            page_number += read_size // PAGE_SIZE
+
+
+def scan_user_batches_var_length(filename, batch_size: int = 10000, columns=None):
+    """
+    Stream the users of a database file as dataframes of *batch_size* users (the last one may be smaller),
+    without loading the whole file. The memory use is bounded by SCAN_READ_SIZE and *batch_size*.
+
+    :param filename: binary file to scan
+    :param batch_size: The amount of users per dataframe
+    :param columns: The columns to load (see new_user_columns), defaults to all columns
+    :return: generator of pandas dataframes
+    """
+    assert batch_size > 0, "A batch must contain at least one user"
+
+    # decoded users that do not fill a batch yet
+    pending = []
+    pending_count: int = 0
+    for page_number, page_data in scan_pages_var_length(filename):
+        users = decode_users_var_length(page_data, columns)
+        if len(users) == 0:
+            continue
+        pending.append(users)
+        pending_count += len(users)
+        if pending_count < batch_size:
+            continue
+
+        users = pd.concat(pending, ignore_index=True) if len(pending) > 1 else users
+        full_batches_end: int = len(users) - len(users) % batch_size
+        for start in range(0, full_batches_end, batch_size):
+            yield users.iloc[start: start + batch_size].reset_index(drop=True)
+        pending = [users.iloc[full_batches_end:]] if full_batches_end < len(users) else []
+        pending_count = len(users) - full_batches_end
+
+    if pending_count > 0:
+        yield pd.concat(pending, ignore_index=True)
+
+
+def scan_users_var_length(filename, columns=None):
+    """
+    Stream the users of a database file one by one, without loading the whole file.
+
+    :param filename: binary file to scan
+    :param columns: The columns to load (see new_user_columns), defaults to all columns
+    :return: generator of users, every user is a list with the values of *columns* (see decode_user_var_length)
+    """
+    columns = new_user_columns if columns is None else list(columns)
+    for page_number, page_data in scan_pages_var_length(filename):
+        users = decode_users_var_length(page_data, columns)
+        for user in zip(*(users[column].tolist() for column in columns)):
+            yield list(user)
+
+
+@locked_operation
+def scan_users_where_var_length(filename, predicates, columns=None):
+    """
+    Load the users that match all *predicates*, reading only the pages whose zone map
+    (see page_zone_maps) shows that they may contain matching users.
+    e.g. scan_users_where_var_length(filename, [('birthdate_ts', '>=', start), ('birthdate_ts', '<', end)])
+
+    :param filename: binary file to scan, must be the database file the page_zone_maps belong to
+    :param predicates: (column, operator, value) tuples, with an operator in ZoneMaps.OPERATORS.
+        Predicates on columns without a zone map are allowed, but do not skip pages.
+    :param columns: The columns to load (see new_user_columns), defaults to all columns
+    :return: pandas dataframe with the matching users
+    """
+    columns = new_user_columns if columns is None else list(columns)
+    decoded_columns = columns + [column for column, op, value in predicates if column not in columns]
+
+    # the file must contain the pages that are only modified in the page buffer pool
+    if page_buffer_pool is not None and page_buffer_pool.db_filename == filename:
+        page_buffer_pool.flush()
+
+    page_numbers = page_zone_maps.find_pages(predicates)
+    pages_per_read: int = max(1, SCAN_READ_SIZE // PAGE_SIZE)
+    # read runs of consecutive pages at once
+    run_starts = np.flatnonzero(np.diff(page_numbers, prepend=-2) != 1)
+    run_ends = np.append(run_starts[1:], len(page_numbers))
+
+    matches = []
+    with open(filename, "rb") as f:
+        for run_start, run_end in zip(run_starts.tolist(), run_ends.tolist()):
+            first_page: int = int(page_numbers[run_start])
+            for read_start in range(first_page, first_page + run_end - run_start, pages_per_read):
+                read_pages: int = min(pages_per_read, first_page + run_end - run_start - read_start)
+                f.seek(read_start * PAGE_SIZE)
+                users = decode_users_var_length(np.frombuffer(f.read(read_pages * PAGE_SIZE), dtype=np.uint8), decoded_columns)
+                matching = np.ones(len(users), dtype=bool)
+                for column, op, value in predicates:
+                    matching &= ZoneMaps.OPERATORS[op](users[column], value).to_numpy()
+                matches.append(users.loc[matching, columns])
+
+    if not matches:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(matches, ignore_index=True)
+
+
+@locked_operation
 def read_var_length_user(db_filename: str, user_id: int):
     """
     Perform a random read for the user uniquely identified by the *user_id*.
     we first find the right page, then offset and get the user.
+    The page is taken from the page buffer pool, so it is only read from the file if it is not in memory.
 
     :param db_filename: The file name of the database file
     :param user_id: The user id of the tuple to retrieve.
     :param user_index: bplustree index
     :return: The user data
     """
+    assert user_index is not None, "There is no user index, save or open the database file first"
     tuple_location: bytes = bytes()
     found: Union[BucketValue, None] = user_index.get(user_id)
     if found is not None:
@@ -477,60 +2084,165 @@ def read_var_length_user(db_filename: str, user_id: int):
 
     if tuple_location is None or len(tuple_location) == 0:
         return None
-    page, offset_ptr = int.from_bytes(tuple_location[0:8], 'little'), int.from_bytes(tuple_location[8:16], 'little')
-    with open(db_filename, "rb") as f:
-        f.seek(page * PAGE_SIZE + offset_ptr)
-        user_size = 0
+    page_number, offset_ptr = int.from_bytes(tuple_location[0:8], 'little'), int.from_bytes(tuple_location[8:16], 'little')
 
-        offset_in_page = f.read(TUPLE_CTR_SIZE)
-        offset_in_page_int = int.from_bytes(offset_in_page, 'little')
-        page_base_address: int = page * PAGE_SIZE
+    pool: PageBufferPool = get_page_buffer_pool(db_filename)
+    page: Page = pool.pin(page_number)
+    try:
+        return decode_user_var_length(page.get_tuple(offset_ptr))
+    finally:
+        pool.unpin(page_number)
 
-        if offset_ptr == TUPLE_CTR_SIZE:
-            user_size = PAGE_SIZE - offset_in_page_int
-        else:
-            prev_offset_ptr: int = offset_ptr - OFFSET_SIZE
 
-            f.seek(page_base_address + prev_offset_ptr)
-            prev_offset_ptr = int.from_bytes(f.read(OFFSET_SIZE), 'little')
-            user_size = prev_offset_ptr - offset_in_page_int
+@locked_operation
+def read_var_length_users(db_filename: str, user_ids):
+    """
+    Perform a batch of random reads for the users uniquely identified by the *user_ids*.
+    The tuple locations are looked up in one batched index call, then sorted by page
+    and slot so that every page is pinned only once, in file order.
+
+    :param db_filename: The file name of the database file
+    :param user_ids: The user ids of the tuples to retrieve
+    :return: The user data for each user id, in the order of *user_ids*, None if the user does not exist
+    """
+    assert user_index is not None, "There is no user index, save or open the database file first"
+    from typing import List, Tuple
+
+    user_ids = list(user_ids)
+    users: List[Union[list, None]] = [None] * len(user_ids)
+
+    # (page number, slot address, position in user_ids)
+    locations: List[Tuple[int, int, int]] = []
+    for position, found in enumerate(user_index.get_many(user_ids)):
+        if found is not None:
+            tuple_location: bytes = found.value
+            locations.append((int.from_bytes(tuple_location[0:8], 'little'), int.from_bytes(tuple_location[8:16], 'little'), position))
+    locations.sort()
+
+    pool: PageBufferPool = get_page_buffer_pool(db_filename)
+    page: Union[Page, None] = None
+    pinned_page_number: int = -1
+    for page_number, slot_address, position in locations:
+        if page_number != pinned_page_number:
+            if page is not None:
+                pool.unpin(pinned_page_number)
+            page = pool.pin(page_number)
+            pinned_page_number = page_number
+        users[position] = decode_user_var_length(page.get_tuple(slot_address))
+    if page is not None:
+        pool.unpin(pinned_page_number)
+
+    return users
+
+
+@locked_operation
+def read_var_length_users_concurrently(db_filename: str, user_ids, thread_count: int = None):
+    """
+    Perform a batch of random reads like read_var_length_users, but read the pages that are not in the page
+    buffer pool with os.pread calls on the pool's file descriptor from a thread pool. A thread releases the GIL
+    while it waits for its read, so up to *thread_count* reads are in flight at once instead of one after the
+    other. The read pages are not added to the page buffer pool, the pages in the pool are used as they are,
+    because they may be newer than the file.
+
+    :param db_filename: The file name of the database file
+    :param user_ids: The user ids of the tuples to retrieve
+    :param thread_count: The amount of reading threads, defaults to READ_THREAD_COUNT
+    :return: The user data for each user id, in the order of *user_ids*, None if the user does not exist
+    """
+    assert user_index is not None, "There is no user index, save or open the database file first"
+    user_ids = list(user_ids)
+    users: List[Union[list, None]] = [None] * len(user_ids)
+
+    # page number -> (slot address, position in user_ids) of the users in the page
+    page_slots: Dict[int, List[Tuple[int, int]]] = dict()
+    for position, found in enumerate(user_index.get_many(user_ids)):
+        if found is not None:
+            tuple_location: bytes = found.value
+            page_number: int = int.from_bytes(tuple_location[0:8], 'little')
+            page_slots.setdefault(page_number, []).append((int.from_bytes(tuple_location[8:16], 'little'), position))
+
+    pool: PageBufferPool = get_page_buffer_pool(db_filename)
+    read_page_numbers: List[int] = sorted(page_number for page_number in page_slots if page_number not in pool)
+    for page_number in sorted(page_number for page_number in page_slots if page_number in pool):
+        page: Page = pool.pin(page_number)
+        try:
+            for slot_address, position in page_slots[page_number]:
+                users[position] = decode_user_var_length(page.get_tuple(slot_address))
+        finally:
+            pool.unpin(page_number)
+
+    thread_pool: ThreadPoolExecutor = get_read_thread_pool(READ_THREAD_COUNT if thread_count is None else thread_count)
+    page_size: int = pool.page_size
+    page_reads = thread_pool.map(lambda page_number: read_at(pool.file, page_size, page_number * page_size), read_page_numbers)
+
+    # decode the pages in the order they were requested, while the later pages are still being read
+    read_page: Page = create_empty_page()
+    for page_number, page_bytes in zip(read_page_numbers, page_reads):
+        read_page.load_bytes(bytearray(page_bytes))
+        for slot_address, position in page_slots[page_number]:
+            users[position] = decode_user_var_length(read_page.get_tuple(slot_address))
+
+    return users
+
+
+@locked_operation
+def read_var_length_users_in_range(db_filename: str, column: str, low: int = None, high: int = None):
+    """
+    Read the users with a *column* value between *low* and *high*, using the secondary index on
+    the column instead of a scan, e.g. the users born in a period with column 'birthdate_ts'.
+
+    :param db_filename: The file name of the database file
+    :param column: A column in SECONDARY_INDEX_COLUMNS
+    :param low: The smallest value, inclusive, None for no lower bound
+    :param high: The largest value, inclusive, None for no upper bound
+    :return: The user data of the matching users, ordered by the column value
+    """
+    assert column in secondary_indexes, f"There is no secondary index on column '{column}', expected one of {list(secondary_indexes)}"
+    user_ids = [user_id for value, user_id in secondary_indexes[column].range(low, high)]
+    return read_var_length_users(db_filename, user_ids)
 
-        f.seek(page_base_address + offset_in_page_int)
-        user = f.read(user_size)
-        return decode_user_var_length(user)
+
+@locked_operation
+def read_var_length_users_by_email(db_filename: str, email: str):
+    """
+    Read the users with an email, using the email_index instead of a scan.
+
+    :param db_filename: The file name of the database file
+    :param email: The email to look up
+    :return: The user data of the users with the email, a single user if EMAIL_INDEX_UNIQUE is set
+    """
+    assert email_index is not None, "There is no email index, save or open the database file first"
+    users = read_var_length_users(db_filename, get_email_user_ids(email))
+    # the check hashes make a user with a different email very unlikely, it is skipped nonetheless
+    return [user for user in users if user is not None and user[IDX_EMAIL] == email]
 
 
 def get_page_with_enough_space(db_filename: str, user_size: int):
     """
     Get the page number of the page with enough space to store the user.
+    The page is chosen by the remaining_page_mem_index, according to PAGE_PLACEMENT_POLICY.
 
     :param db_filename: binary file
     :param user_size: size of user to add
     :return:
     """
-    from typing import List
-
     # get page with enough space
-    page_number = None
-    for idx, free_space in remaining_page_mem_index.items():
-        if free_space >= user_size + OFFSET_SIZE:
-            page_number = idx
-            break
+    page_number = remaining_page_mem_index.find_page(user_size + OFFSET_SIZE, PAGE_PLACEMENT_POLICY)
 
     # if no page has enough space, create new page
     if page_number is None:
-        page_number = len(remaining_page_mem_index)
-        page: Page = create_empty_page()
-        # write page to the end of the binary file
-        with open(db_filename, "ab") as f:
-            f.write(page.bytearray)
-        f.close()
+        # the new page is written to the end of the binary file by the page buffer pool
+        page_number = get_page_buffer_pool(db_filename).new_page()
+        assert page_number == len(remaining_page_mem_index), "The free space map is out of sync with the database file"
 
-        remaining_page_mem_index[page_number] = PAGE_SIZE
+        # the tuple counter is part of the page as well
+        remaining_page_mem_index[page_number] = PAGE_SIZE - TUPLE_CTR_SIZE
+        page_zone_maps.add_pages(1)
 
     return page_number
 
 
+@locked_operation
 def create_var_length_user(db_filename: str, user_tuple):
     """
     Create a new user tuple in the database.
@@ -539,42 +2251,46 @@ def create_var_length_user(db_filename: str, user_tuple):
     :param user_tuple: unencoded user tuple
     :return:
     """
+    assert user_index is not None, "There is no user index, save or open the database file first"
 
     # get user id
     user_id = user_tuple[0]
     # check if user already exists
     assert user_index.get(user_id) is None, "user already exists"
+    check_email_unique(db_filename, user_tuple[IDX_EMAIL], user_id)
 
     # get user
     encoded_user_tuple = encode_user_var_length(user_tuple)
     # get user size
     user_size = len(encoded_user_tuple)
+    begin_logged_operation(db_filename)
 
     # get page with enough space
     page_number = get_page_with_enough_space(db_filename, user_size)
 
     # write encoded user tuple to page
-    with open(db_filename, "r+b") as f:
-        # get page
-        page: Page = create_empty_page()
-        f.seek(page_number * PAGE_SIZE)
-        page.load_bytes(bytearray(f.read(page.page_size)))
-
+    pool: PageBufferPool = get_page_buffer_pool(db_filename)
+    page: Page = pool.pin(page_number)
+    try:
         # write user to page
-        new_offset_address: int = page.append_tuple(encoded_user_tuple)
+        new_offset_address: int = page.insert_tuple(encoded_user_tuple)
+        log_page_changes(db_filename, {page_number: page})
 
         # add page and user offset to user index
         user_index.insert_keyval(user_id, page_number.to_bytes(8, 'little') + new_offset_address.to_bytes(8, 'little'))
         # user_index[user_id] = page_number.to_bytes(8, 'little') + new_offset_address.to_bytes(8, 'little')
 
-        # write page to binary file
-        f.seek(page_number * PAGE_SIZE)
-        f.write(page.bytearray)
+        # update remaining page mem index and zone map
+        remaining_page_mem_index[page_number] = page.unused_memory_size
+        page_zone_maps.widen(page_number, get_fixed_field_values(encoded_user_tuple, ZONE_MAP_COLUMNS))
+    finally:
+        pool.unpin(page_number)
 
-        # update remaining page mem index
-        remaining_page_mem_index[page_number] -= user_size + OFFSET_SIZE
+    update_secondary_indexes(user_id, None, encoded_user_tuple)
+    add_to_email_index(user_tuple[IDX_EMAIL], user_id)
 
 
+@locked_operation
 def delete_var_length_user(db_filename: str, user_id):
     """
     Delete a user tuple from the database.
@@ -582,6 +2298,7 @@ def delete_var_length_user(db_filename: str, user_id):
     :param db_filename: The file containing the page the user is stored in
     :param user_id: The id column value for the user' db row
     """
+    assert user_index is not None, "There is no user index, save or open the database file first"
     # Perform index lookup
     # tuple_location: bytes = user_index.get(user_id)
 
@@ -594,29 +2311,36 @@ def delete_var_length_user(db_filename: str, user_id):
         return None
     page_number: int = int.from_bytes(tuple_location[0:8], 'little')
     del_user_slot_address: int = int.from_bytes(tuple_location[8:16], 'little')
+    begin_logged_operation(db_filename)
 
-    with open(db_filename, "r+b") as f:
-        # Setup page
-        page: Page = create_empty_page()
-        f.seek(page_number * PAGE_SIZE)
-        page.load_bytes(bytearray(f.read(page.page_size)))
-
+    # The modified page is written back by the page buffer pool
+    pool: PageBufferPool = get_page_buffer_pool(db_filename)
+    page: Page = pool.pin(page_number)
+    try:
+        del_user_tuple: bytearray = page.get_tuple(del_user_slot_address)
         page.remove_tuple(user_id, page_number, del_user_slot_address)
+        log_page_changes(db_filename, {page_number: page})
+    finally:
+        pool.unpin(page_number)
 
-        # Actually write page to memory
-        f.seek(page_number * PAGE_SIZE)
-        f.write(page.bytearray)
+    update_secondary_indexes(user_id, del_user_tuple, None)
+    remove_from_email_index(decode_user_var_length(del_user_tuple)[IDX_EMAIL], user_id)
 
 
+@locked_operation
 def update_var_length_user(db_filename: str, user_id, updated_user_tuple):
     """
     Update a user tuple in the database.
+    The updated tuple is written in place when it fits in the page (see Page.replace_tuple), so the
+    user keeps its slot and user_index entry. Only when the page does not have enough free space for
+    a grown tuple, the user is moved to another page.
 
     :param db_filename: binary file
     :param user_id: user id of the user to update
     :param updated_user_tuple: unencoded user tuple
     :return:
     """
+    assert user_index is not None, "There is no user index, save or open the database file first"
     # Perform index lookup
     # tuple_location: bytes = user_index.get(user_id)
 
@@ -629,71 +2353,317 @@ def update_var_length_user(db_filename: str, user_id, updated_user_tuple):
         return None
     page_number: int = int.from_bytes(tuple_location[0:8], 'little')
     update_user_slot_address: int = int.from_bytes(tuple_location[8:16], 'little')
-    final_page_number: int = -1
+    check_email_unique(db_filename, updated_user_tuple[IDX_EMAIL], user_id)
 
     encoded_updated_user_tuple = encode_user_var_length(updated_user_tuple)
     updated_user_tuple_size = len(encoded_updated_user_tuple)
-
-    with open(db_filename, "r+b") as f:
-        # Setup page
-        page: Page = create_empty_page()
-        f.seek(page_number * page.page_size)
-        page.load_bytes(bytearray(f.read(page.page_size)))
-
-        # Setup vars
-        updated_user_address: int = page.get_tuple_address(update_user_slot_address)
-        old_user_tuple_size: int = 0
-
-        # Start of slot array
-        if update_user_slot_address == TUPLE_CTR_SIZE:
-            old_user_tuple_size = PAGE_SIZE - updated_user_address
-        # Not start of slot array
+    begin_logged_operation(db_filename)
+
+    # The modified pages are written back by the page buffer pool
+    pool: PageBufferPool = get_page_buffer_pool(db_filename)
+    page: Page = pool.pin(page_number)
+    try:
+        old_user_tuple: bytearray = page.get_tuple(update_user_slot_address)
+
+        if updated_user_tuple_size - len(old_user_tuple) <= page.unused_memory_size:
+            # the updated tuple fits in the page, overwrite the old one
+            page.replace_tuple(update_user_slot_address, encoded_updated_user_tuple)
+            log_page_changes(db_filename, {page_number: page})
+            remaining_page_mem_index[page_number] = page.unused_memory_size
+            # the old tuple may have been the minimum or maximum of the page
+            if get_fixed_field_values(old_user_tuple, ZONE_MAP_COLUMNS) != get_fixed_field_values(encoded_updated_user_tuple, ZONE_MAP_COLUMNS):
+                page_zone_maps.set_page(page_number, *page.get_zone_map())
         else:
-            prev_slot_address: int = update_user_slot_address - page.slot_size
-            prev_tuple_address: int = page.get_tuple_address(prev_slot_address)
-            old_user_tuple_size = prev_tuple_address - updated_user_address
-
-        # first check if there is enough space for the updated user tuple in the page if we would replace the old one
-        if remaining_page_mem_index.get(page_number, 0) < updated_user_tuple_size - old_user_tuple_size:
-            # not enough space
-            # delete old user tuple from page
+            # not enough space, move the user to the next page with enough space
             page.remove_tuple(user_id, page_number, update_user_slot_address)
-            # Actually write page to memory
-            f.seek(page_number * PAGE_SIZE)
-            f.write(page.bytearray)
-
-            # find the next page with enough space
             other_page_number: int = get_page_with_enough_space(db_filename, updated_user_tuple_size)
-            final_page_number = other_page_number
+            other_page: Page = pool.pin(other_page_number)
+            try:
+                new_offset_address: int = other_page.insert_tuple(encoded_updated_user_tuple)
+                log_page_changes(db_filename, {page_number: page, other_page_number: other_page})
+                user_index.insert_keyval(user_id, other_page_number.to_bytes(8, 'little') + new_offset_address.to_bytes(8, 'little'))
+                remaining_page_mem_index[other_page_number] = other_page.unused_memory_size
+                page_zone_maps.widen(other_page_number, get_fixed_field_values(encoded_updated_user_tuple, ZONE_MAP_COLUMNS))
+            finally:
+                pool.unpin(other_page_number)
+    finally:
+        pool.unpin(page_number)
+
+    update_secondary_indexes(user_id, old_user_tuple, encoded_updated_user_tuple)
+    old_email: str = decode_user_var_length(old_user_tuple)[IDX_EMAIL]
+    if old_email != updated_user_tuple[IDX_EMAIL]:
+        remove_from_email_index(old_email, user_id)
+        add_to_email_index(updated_user_tuple[IDX_EMAIL], user_id)
+
+
+def get_var_length_tuple_slots(user_ids) -> Dict[int, Dict[int, int]]:
+    """
+    Look up the tuple locations of a batch of users in one batched index call, and group them by page.
 
-            # get page
-            page: Page = create_empty_page()
-            f.seek(other_page_number * PAGE_SIZE)
-            page.load_bytes(bytearray(f.read(page.page_size)))
+    :param user_ids: The user ids of the tuples, the users that do not exist are skipped
+    :return: page number -> (slot address -> user id), with the page numbers in increasing order
+    """
+    assert user_index is not None, "There is no user index, save or open the database file first"
+    page_slots: Dict[int, Dict[int, int]] = dict()
+    for user_id, found in zip(user_ids, user_index.get_many(user_ids)):
+        if found is not None:
+            tuple_location: bytes = found.value
+            page_number: int = int.from_bytes(tuple_location[0:8], 'little')
+            page_slots.setdefault(page_number, dict())[int.from_bytes(tuple_location[8:16], 'little')] = user_id
+    return dict(sorted(page_slots.items()))
 
-        else:
-            # TODO scuffed but easy: just remove tuple and re-append
-            # enough space, we can just write the user tuple to the page
-            # Remove old user tuple
-            page.remove_tuple(user_id, page_number, update_user_slot_address)
-            final_page_number = page_number
 
-        # write user to page
-        new_offset_address: int = page.append_tuple(encoded_updated_user_tuple)
+def store_var_length_tuples(db_filename: str, encoded_tuples: List[Tuple[int, bytes]]) -> List[Tuple[int, bytes]]:
+    """
+    Store new user tuples in pages with enough space (see get_page_with_enough_space). The tuples are
+    divided over the pages first, so that every page is pinned, compacted and logged only once
+    (see Page.rewrite_tuples). Updates the remaining_page_mem_index and page_zone_maps, not the user_index.
 
-        # add page and user offset to user index
-        user_index.insert_keyval(user_id, final_page_number.to_bytes(8, 'little') + new_offset_address.to_bytes(8, 'little'))
-        # user_index[user_id] = final_page_number.to_bytes(8, 'little') + new_offset_address.to_bytes(8, 'little')
+    :param db_filename: The file name of the database file
+    :param encoded_tuples: (user id, encoded user tuple) pairs
+    :return: (user id, tuple location) pairs, for the user_index
+    """
+    # choose the page of every tuple, taking its space from the free space map until the page is rewritten
+    page_tuples: Dict[int, List[Tuple[int, bytes]]] = dict()
+    for user_id, tuple_bytes in encoded_tuples:
+        page_number: int = get_page_with_enough_space(db_filename, len(tuple_bytes))
+        remaining_page_mem_index[page_number] -= len(tuple_bytes) + OFFSET_SIZE
+        page_tuples.setdefault(page_number, []).append((user_id, tuple_bytes))
+
+    pool: PageBufferPool = get_page_buffer_pool(db_filename)
+    new_locations: List[Tuple[int, bytes]] = []
+    for page_number in sorted(page_tuples):
+        tuples: List[Tuple[int, bytes]] = page_tuples[page_number]
+        page: Page = pool.pin(page_number)
+        try:
+            slot_addresses: List[int] = page.rewrite_tuples(dict(), [tuple_bytes for user_id, tuple_bytes in tuples])
+            log_page_changes(db_filename, {page_number: page})
+            remaining_page_mem_index[page_number] = page.unused_memory_size
+        finally:
+            pool.unpin(page_number)
+        for (user_id, tuple_bytes), slot_address in zip(tuples, slot_addresses):
+            page_zone_maps.widen(page_number, get_fixed_field_values(tuple_bytes, ZONE_MAP_COLUMNS))
+            new_locations.append((user_id, page_number.to_bytes(8, 'little') + slot_address.to_bytes(8, 'little')))
+    return new_locations
+
+
+@locked_operation
+def create_var_length_users(db_filename: str, user_tuples) -> None:
+    """
+    Create a batch of new user tuples in the database, see create_var_length_user.
+    The tuples are grouped by page (see store_var_length_tuples) and added to the
+    user_index with a single ExtendibleHashingIndex.insert_many call.
 
-        # update remaining page mem index
-        remaining_page_mem_index[final_page_number] -= updated_user_tuple_size + OFFSET_SIZE
+    :param db_filename: binary file
+    :param user_tuples: unencoded user tuples, with unique user ids
+    """
+    assert user_index is not None, "There is no user index, save or open the database file first"
+    user_tuples = list(user_tuples)
+    user_ids: List[int] = [user_tuple[IDX_ID] for user_tuple in user_tuples]
+    assert len(set(user_ids)) == len(user_ids), "user ids must be unique"
+    assert all(found is None for found in user_index.get_many(user_ids)), "user already exists"
+    if EMAIL_INDEX_UNIQUE:
+        emails: List[str] = [user_tuple[IDX_EMAIL] for user_tuple in user_tuples]
+        assert len(set(emails)) == len(emails), "emails must be unique"
+    for user_tuple in user_tuples:
+        check_email_unique(db_filename, user_tuple[IDX_EMAIL], user_tuple[IDX_ID])
+
+    encoded_user_tuples: List[bytes] = [encode_user_var_length(user_tuple) for user_tuple in user_tuples]
+    begin_logged_operation(db_filename)
+    user_index.insert_many(store_var_length_tuples(db_filename, list(zip(user_ids, encoded_user_tuples))))
+
+    for user_id, user_tuple, encoded_user_tuple in zip(user_ids, user_tuples, encoded_user_tuples):
+        update_secondary_indexes(user_id, None, encoded_user_tuple)
+        add_to_email_index(user_tuple[IDX_EMAIL], user_id)
+
+
+@locked_operation
+def delete_var_length_users(db_filename: str, user_ids) -> int:
+    """
+    Delete a batch of user tuples from the database, see delete_var_length_user.
+    Every page is pinned and compacted only once (see Page.rewrite_tuples), and the users
+    are removed from the user_index with a single ExtendibleHashingIndex.delete_many call.
 
-        # write page to binary file
-        f.seek(final_page_number * PAGE_SIZE)
-        f.write(page.bytearray)
+    :param db_filename: The file containing the pages the users are stored in
+    :param user_ids: The id column values of the users, the users that do not exist are skipped
+    :return: The amount of deleted users
+    """
+    page_slots: Dict[int, Dict[int, int]] = get_var_length_tuple_slots(list(dict.fromkeys(user_ids)))
+    if not page_slots:
+        return 0
+    begin_logged_operation(db_filename)
+
+    # (user id, tuple bytes) of every deleted user
+    deleted_tuples: List[Tuple[int, bytearray]] = []
+    pool: PageBufferPool = get_page_buffer_pool(db_filename)
+    for page_number, slots in page_slots.items():
+        page: Page = pool.pin(page_number)
+        try:
+            deleted_tuples.extend((user_id, page.get_tuple(slot_address)) for slot_address, user_id in slots.items())
+            page.rewrite_tuples({slot_address: b"" for slot_address in slots})
+            log_page_changes(db_filename, {page_number: page})
+            remaining_page_mem_index[page_number] = page.unused_memory_size
+            page_zone_maps.set_page(page_number, *page.get_zone_map())
+        finally:
+            pool.unpin(page_number)
+
+    user_index.delete_many([user_id for user_id, del_user_tuple in deleted_tuples])
+    for user_id, del_user_tuple in deleted_tuples:
+        update_secondary_indexes(user_id, del_user_tuple, None)
+        remove_from_email_index(decode_user_var_length(del_user_tuple)[IDX_EMAIL], user_id)
+    return len(deleted_tuples)
+
+
+@locked_operation
+def update_var_length_users(db_filename: str, updated_user_tuples) -> int:
+    """
+    Update a batch of user tuples in the database, see update_var_length_user.
+    Every page is pinned and compacted once for the updated tuples that fit in it (see Page.rewrite_tuples).
+    The users whose updated tuple does not fit are moved to another page one by one, like update_var_length_user
+    does, and their new locations are written to the user_index with a single ExtendibleHashingIndex.insert_many call.
+
+    :param db_filename: binary file
+    :param updated_user_tuples: (user id, unencoded user tuple) pairs, the last update of a user wins
+        and the users that do not exist are skipped
+    :return: The amount of updated users
+    """
+    updates: Dict[int, list] = dict(updated_user_tuples)
+    page_slots: Dict[int, Dict[int, int]] = get_var_length_tuple_slots(list(updates))
+    if not page_slots:
+        return 0
+    for slots in page_slots.values():
+        for user_id in slots.values():
+            check_email_unique(db_filename, updates[user_id][IDX_EMAIL], user_id)
+    begin_logged_operation(db_filename)
+
+    # (user id, old tuple bytes, new tuple bytes) of every updated user
+    updated_tuples: List[Tuple[int, bytearray, bytes]] = []
+    new_locations: List[Tuple[int, bytes]] = []
+    pool: PageBufferPool = get_page_buffer_pool(db_filename)
+    for page_number, slots in page_slots.items():
+        page: Page = pool.pin(page_number)
+        try:
+            # the updated tuples are written in place while the page has enough free space
+            replaced_tuples: Dict[int, bytes] = dict()
+            moved_tuples: List[Tuple[int, int, bytes]] = []
+            free_bytes: int = page.unused_memory_size
+            for slot_address, user_id in slots.items():
+                old_user_tuple: bytearray = page.get_tuple(slot_address)
+                encoded_updated_user_tuple: bytes = encode_user_var_length(updates[user_id])
+                updated_tuples.append((user_id, old_user_tuple, encoded_updated_user_tuple))
+                growth: int = len(encoded_updated_user_tuple) - len(old_user_tuple)
+                if growth <= free_bytes:
+                    replaced_tuples[slot_address] = encoded_updated_user_tuple
+                    free_bytes -= growth
+                else:
+                    moved_tuples.append((slot_address, user_id, encoded_updated_user_tuple))
+            if replaced_tuples:
+                page.rewrite_tuples(replaced_tuples)
+                log_page_changes(db_filename, {page_number: page})
+                remaining_page_mem_index[page_number] = page.unused_memory_size
+
+            # a move changes two pages, which are logged together
+            for slot_address, user_id, encoded_updated_user_tuple in moved_tuples:
+                page.delete_tuple(slot_address)
+                remaining_page_mem_index[page_number] = page.unused_memory_size
+                other_page_number: int = get_page_with_enough_space(db_filename, len(encoded_updated_user_tuple))
+                other_page: Page = pool.pin(other_page_number)
+                try:
+                    new_offset_address: int = other_page.insert_tuple(encoded_updated_user_tuple)
+                    log_page_changes(db_filename, {page_number: page, other_page_number: other_page})
+                    remaining_page_mem_index[other_page_number] = other_page.unused_memory_size
+                    page_zone_maps.widen(other_page_number, get_fixed_field_values(encoded_updated_user_tuple, ZONE_MAP_COLUMNS))
+                finally:
+                    pool.unpin(other_page_number)
+                new_locations.append((user_id, other_page_number.to_bytes(8, 'little') + new_offset_address.to_bytes(8, 'little')))
+            page_zone_maps.set_page(page_number, *page.get_zone_map())
+        finally:
+            pool.unpin(page_number)
+
+    user_index.insert_many(new_locations)
+    for user_id, old_user_tuple, encoded_updated_user_tuple in updated_tuples:
+        update_secondary_indexes(user_id, old_user_tuple, encoded_updated_user_tuple)
+        old_email: str = decode_user_var_length(old_user_tuple)[IDX_EMAIL]
+        if old_email != updates[user_id][IDX_EMAIL]:
+            remove_from_email_index(old_email, user_id)
+            add_to_email_index(updates[user_id][IDX_EMAIL], user_id)
+    return len(updated_tuples)
+
+
+@locked_operation
+def vacuum_var_length_db(db_filename: str, fill_factor: float = None, max_pages: int = None) -> int:
+    """
+    Repack the users of the last pages of a database file into the free space of the earlier pages,
+    and cut the emptied pages off the end of the file. A user is only moved into a page that stays
+    within the fill factor afterwards, so that the other users of that page can still grow in place.
+    Moving stops at the first user that does not fit in an earlier page.
+
+    The vacuum is incremental: at most *max_pages* pages are emptied per call, so it can be run in
+    small steps in between other work. The moved users get a new locator, the user_index is updated
+    for all of them at once with ExtendibleHashingIndex.insert_many. The secondary_indexes and the
+    email_index refer to user ids, so they do not change. Like the CRUD functions, every move is
+    logged in the write_ahead_log, and the changes reach the database file when it is flushed
+    (see flush_var_length_db). Only the cut off pages are removed from the file right away.
 
-    print("userID ", user_id, " from page ", page_number, " to page ", final_page_number)
+    :param db_filename: The file name of the database file
+    :param fill_factor: The fraction of a page that may be filled, defaults to PAGE_FILL_FACTOR
+    :param max_pages: The maximum amount of pages to empty, None to continue while pages can be emptied
+    :return: The amount of pages that were cut off
+    """
+    assert user_index is not None, "There is no user index, save or open the database file first"
+    from typing import List, Tuple
+
+    pool: PageBufferPool = get_page_buffer_pool(db_filename)
+    # the amount of free bytes a page must keep after a user is moved into it
+    headroom: int = PAGE_SIZE - TUPLE_CTR_SIZE - get_page_fill_capacity(fill_factor)
+    # (user id, new tuple location) of every moved user
+    new_locations: List[Tuple[int, bytes]] = []
+    page_count: int = pool.page_count
+    begin_logged_operation(db_filename)
+
+    # an empty database still has one (empty) page
+    while page_count > 1 and (max_pages is None or pool.page_count - page_count < max_pages):
+        last_page_number: int = page_count - 1
+        last_page: Page = pool.pin(last_page_number)
+        try:
+            # move the users from the last slot on, so that no other tuple has to be shifted
+            while last_page.tuple_count > 0:
+                slot_address: int = last_page.get_slot_address(-1)
+                tuple_bytes: bytearray = last_page.get_tuple(slot_address)
+                target_page_number = remaining_page_mem_index.find_page(len(tuple_bytes) + OFFSET_SIZE + headroom, "first-fit")
+                if target_page_number is None or target_page_number >= last_page_number:
+                    break
+
+                target_page: Page = pool.pin(target_page_number)
+                try:
+                    new_slot_address: int = target_page.insert_tuple(tuple_bytes)
+                    last_page.delete_tuple(slot_address)
+                    log_page_changes(db_filename, {target_page_number: target_page, last_page_number: last_page})
+                    remaining_page_mem_index[target_page_number] = target_page.unused_memory_size
+                finally:
+                    pool.unpin(target_page_number)
+                page_zone_maps.widen(target_page_number, get_fixed_field_values(tuple_bytes, ZONE_MAP_COLUMNS))
+                user_id: int = get_fixed_field_values(tuple_bytes, ['id'])[0]
+                new_locations.append((user_id, target_page_number.to_bytes(8, 'little') + new_slot_address.to_bytes(8, 'little')))
+
+            is_empty: bool = last_page.tuple_count == 0
+            if not is_empty:
+                remaining_page_mem_index[last_page_number] = last_page.unused_memory_size
+                page_zone_maps.set_page(last_page_number, *last_page.get_zone_map())
+        finally:
+            pool.unpin(last_page_number)
+        if not is_empty:
+            break
+        page_count -= 1
 
+    user_index.insert_many(new_locations)
+    cut_off_pages: int = pool.page_count - page_count
+    if cut_off_pages > 0:
+        log_truncate(db_filename, page_count)
+    pool.truncate(page_count)
+    remaining_page_mem_index.truncate(page_count)
+    page_zone_maps.truncate(page_count)
+    return cut_off_pages
 
 
 def test_code():
@@ -825,6 +2795,70 @@ def test_code():
     df2 = load_users_from_binary_var_length("test.bin")
     display(df2)
 
+    print("""
+##################
+# CRASH RECOVERY #
+##################
+""", flush=True)
+
+    # a child process changes users, commits the write-ahead log and crashes before a checkpoint,
+    # reopening the database file must replay the changes
+    if hasattr(os, "fork"):
+        flush_var_length_db("test.bin")
+        updated_user = [110, 'K', 'K@m.c', '4', 'I', 'addr', 2, 3, 2, 1333566891]
+        created_user = [3000, 'L', 'L@m.c', '5', 'J', 'addr', 3, 4, 3, 1333566892]
+        pid = os.fork()
+        if pid == 0:
+            delete_var_length_user("test.bin", 2)
+            update_var_length_user("test.bin", 110, updated_user)
+            create_var_length_user("test.bin", created_user)
+            commit_var_length_db("test.bin")
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+        expected_users = [user for user in df2.values.tolist() if user[IDX_ID] not in (2, 110)] + [updated_user, created_user]
+        open_var_length_db("test.bin")
+        df2 = load_users_from_binary_var_length("test.bin")
+        assert sorted(df2.values.tolist()) == sorted(expected_users), "The recovered users differ from the committed users"
+        assert read_var_length_user("test.bin", 110) == updated_user and read_var_length_user("test.bin", 2) is None
+        print("------ RECOVERED ------")
+        display(df2)
+
+    print("""
+######################
+# CONCURRENT COMMITS #
+######################
+""", flush=True)
+
+    # threads that create users at the same time share the fsyncs of their write-ahead log commits
+    fsync = os.fsync
+    fsync_count: List[int] = [0]
+
+    def counting_fsync(fd: int) -> None:
+        fsync_count[0] += 1
+        fsync(fd)
+
+    def create_users(first_user_id: int) -> None:
+        for user_id in range(first_user_id, first_user_id + 25):
+            create_var_length_user("test.bin", [user_id, str(user_id), 'M@m.c', '6', 'K', 'addr', 4, 5, 4, 1333566893])
+
+    os.fsync = counting_fsync
+    try:
+        threads = [threading.Thread(target=create_users, args=(first_user_id,)) for first_user_id in range(20000, 20200, 25)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        os.fsync = fsync
+    created_users = read_var_length_users("test.bin", range(20000, 20200))
+    assert all(user is not None and user[IDX_ID] == user_id for user, user_id in zip(created_users, range(20000, 20200)))
+    assert sorted(get_email_user_ids('M@m.c')) == list(range(20000, 20200))
+    assert fsync_count[0] < 200, f"{fsync_count[0]} fsyncs for 200 created users, the commits were not shared"
+    print(f"------ {fsync_count[0]} FSYNCS FOR 200 CREATED USERS ------")
+
+    close_var_length_db("test.bin")
+
     # Reinstate page size
     PAGE_SIZE = OLD_PAGE_SIZE
 
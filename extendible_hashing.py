@@ -1,4 +1,10 @@
-from typing import List, Tuple, Dict, Union, Callable
+import hashlib
+import os
+from abc import ABC, abstractmethod
+import struct
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import List, Tuple, Dict, Union, Callable, Set, Iterable
 
 #
 # ENVIRONMENT VARIABLES
@@ -11,25 +17,97 @@ ENV_BUCKET_VALUE_VALUE_SIZE: int = 16
 # The default size of the Bucket list
 ENV_BUCKET_MAX_SIZE: int = 10
 
+# The bucket storage file starts with a fixed size metadata header, followed by
+# the fixed size buckets and finally the directory segment (see ExtendibleHashingIndex.write_metadata)
+BUCKETS_FILE_MAGIC: bytes = b"EHIX"
+BUCKETS_FILE_VERSION: int = 3
+# magic, version, global prefix size, key size, value size, bucket max size,
+# bucket bytes size, bucket ID counter, directory offset, directory length, free bucket IDs length
+BUCKETS_FILE_HEADER_FORMAT: str = "<4sHBBHHIIQQI"
+BUCKETS_FILE_HEADER_SIZE: int = 64
+
 
 #
 # CODE
 #
 
+def read_at(fd: int, size: int, offset: int) -> bytes:
+    """Read *size* bytes at *offset* from a file descriptor, without moving
+    a shared file position when the platform supports os.pread.
+
+    :param fd: The file descriptor to read from
+    :param size: The amount of bytes to read
+    :param offset: The offset in the file to read from
+    :return: The read bytes, shorter than *size* at the end of the file
+    """
+    if hasattr(os, "pread"):
+        return os.pread(fd, size, offset)
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, size)
+
+
+def write_at(fd: int, data: bytes, offset: int) -> None:
+    """Write *data* at *offset* to a file descriptor, without moving
+    a shared file position when the platform supports os.pwrite.
+
+    :param fd: The file descriptor to write to
+    :param data: The bytes to write
+    :param offset: The offset in the file to write to
+    """
+    if hasattr(os, "pwrite"):
+        written: int = os.pwrite(fd, data, offset)
+    else:
+        os.lseek(fd, offset, os.SEEK_SET)
+        written = os.write(fd, data)
+    assert written == len(data), f"Short write: wrote {written}B of {len(data)}B"
+
+
+# The header of a bucket on disk: local prefix size, max list size, current list size, bucket ID
+BUCKET_HEADER_STRUCT: struct.Struct = struct.Struct(">BHHI")
+# The struct format characters of the supported key sizes
+BUCKET_KEY_FORMATS: Dict[int, str] = {1: "B", 2: "H", 4: "I", 8: "Q"}
+# Cache of the (entry struct, key-only entry struct) per (key size, value size)
+BUCKET_ENTRY_STRUCTS: Dict[Tuple[int, int], Tuple[struct.Struct, struct.Struct]] = dict()
+
+
+def get_bucket_entry_structs(key_len: int, value_len: int) -> Tuple[struct.Struct, struct.Struct]:
+    """Get the structs used to (un)pack a BucketValue of the given sizes.
+    The key-only struct skips the value bytes, so that the keys of a packed
+    bucket can be decoded without copying any values.
+
+    :param key_len: The amount of bytes used to encode the keys
+    :param value_len: The amount of bytes used to encode the values
+    :return: (entry struct, key-only entry struct)
+    """
+    structs = BUCKET_ENTRY_STRUCTS.get((key_len, value_len))
+    if structs is None:
+        assert key_len in BUCKET_KEY_FORMATS, f"Unsupported key size: {key_len}B"
+        keyFormat: str = BUCKET_KEY_FORMATS[key_len]
+        structs = (struct.Struct(f">{keyFormat}{value_len}s"), struct.Struct(f">{keyFormat}{value_len}x"))
+        BUCKET_ENTRY_STRUCTS[(key_len, value_len)] = structs
+    return structs
+
+
 class BucketValue(object):
-    def __init__(self, key: str, value: bytes):
+    def __init__(self, key: int, value: bytes, key_len: int = None, value_len: int = None):
         """BucketValue constructor.
 
-        :param key: A string key that is required to be of a fixed size (see BucketValue.get_env_bucketvalue_key_size())
-        :param value: A bytes value that is required to be of a fixed size (see BucketValue.get_env_bucketvalue_value_size())
+        :param key: An integer key hash that is required to fit in *key_len* bytes
+        :param value: A bytes value that is required to be *value_len* bytes long
+        :param key_len: The amount of bytes used to encode the key, defaults to the environment's key size
+        :param value_len: The amount of bytes used to encode the value, defaults to the environment's value size
         """
-        assert isinstance(key, str), f"A {BucketValue.__name__} must have a {str.__name__} type key"
+        key_len = BucketValue.get_env_bucketvalue_key_size() if key_len is None else key_len
+        value_len = BucketValue.get_env_bucketvalue_value_size() if value_len is None else value_len
+        assert isinstance(key, int), f"A {BucketValue.__name__} must have an {int.__name__} type key"
         assert isinstance(value, bytes), f"A {BucketValue.__name__} must have a {bytes.__name__} type value"
-        assert len(key) == BucketValue.get_env_bucketvalue_key_size() * 8, f"Invalid {BucketValue.__name__} key length: got {len(key)}, expected {BucketValue.get_env_bucketvalue_key_size()}"
-        assert len(value) == BucketValue.get_env_bucketvalue_value_size(), f"Invalid {BucketValue.__name__} value length: got {len(value)}, expected {BucketValue.get_env_bucketvalue_value_size()}"
+        assert 0 <= key < (1 << (key_len * 8)), f"Invalid {BucketValue.__name__} key: {key} does not fit in {key_len} bytes"
+        assert len(value) == value_len, f"Invalid {BucketValue.__name__} value length: got {len(value)}, expected {value_len}"
 
-        self.key: str = key
+        self.key: int = key
         self.value: bytes = value
+        self.key_len: int = key_len
+        self.value_len: int = value_len
 
     def __str__(self):
         return str(self.key) + " : " + str(self.value)
@@ -39,33 +117,31 @@ class BucketValue(object):
 
     def __bytes__(self):
         """
-        Convert BucketValue to a byte string of length 20 bytes.
+        Convert BucketValue to a byte string of the key, encoded in *key_len* bytes,
+        followed by the value, 20 bytes by default.
 
-        :return: bytestring of length 20
+        :return: bytestring
         """
-        # make a bytearray of key and value
-        key_integer = eval('0b' + self.key)
-        key_bytes = key_integer.to_bytes(4, byteorder='big')
-        value_bytes = bytes(self.value)
-        return key_bytes + value_bytes
+        entry_struct, _ = get_bucket_entry_structs(self.key_len, self.value_len)
+        return entry_struct.pack(self.key, self.value)
 
     @classmethod
-    def from_bytes(cls, byte_data):
+    def from_bytes(cls, byte_data, key_len: int = None, value_len: int = None):
         """
         Reconstructs a BucketValue object from its byte representation.
 
         :param byte_data: Byte representation of the BucketValue.
+        :param key_len: The amount of bytes used to encode the key, defaults to the environment's key size
+        :param value_len: The amount of bytes used to encode the value, defaults to the environment's value size
         :return: Reconstructed BucketValue object.
         """
-        key_bytes = byte_data[:4]
-        value_bytes = byte_data[4:]
-
-        # Convert key bytes to an integer and then to a binary string
-        key_integer = int.from_bytes(key_bytes, byteorder='big')
-        key_binary_string = bin(key_integer)[2:].zfill(32)
+        key_len = BucketValue.get_env_bucketvalue_key_size() if key_len is None else key_len
+        value_len = BucketValue.get_env_bucketvalue_value_size() if value_len is None else value_len
+        entry_struct, _ = get_bucket_entry_structs(key_len, value_len)
+        key, value_bytes = entry_struct.unpack_from(byte_data)
 
         # Create and return the BucketValue object
-        return cls(key_binary_string, value_bytes)
+        return cls(key, value_bytes, key_len, value_len)
 
     def get_key(self):
         return self.key
@@ -96,19 +172,41 @@ class BucketValue(object):
 
 
 class Bucket(object):
-    def __init__(self, bucket_id: int, local_prefix_size: int = 1, max_size: int = 10, bucket_values: List[BucketValue] = None):
+    def __init__(self, bucket_id: int, local_prefix_size: int = 1, max_size: int = None, bucket_values: List[BucketValue] = None,
+                 key_len: int = None, value_len: int = None):
         """Bucket constructor.
 
         :param bucket_id: The (unique) ID of the bucket
         :param local_prefix_size: The local prefix length/size of the bucket
-        :param max_size: The maximum amount of elements allowed in the BucketValue list
+        :param max_size: The maximum amount of elements allowed in the BucketValue list,
+            defaults to Bucket.get_env_bucket_max_size()
         :param bucket_values: (optional) a list of initial BucketValues
+        :param key_len: The amount of bytes used to encode the keys, defaults to the environment's key size
+        :param value_len: The amount of bytes used to encode the values, defaults to the environment's value size
         """
         self.bucketID = bucket_id
         self.localPrefixSize: int = local_prefix_size
 
-        self.maxSize: int = max_size
-        self.list: List[BucketValue] = [] if bucket_values is None else bucket_values
+        self.maxSize: int = Bucket.get_env_bucket_max_size() if max_size is None else max_size
+        self.keyLen: int = BucketValue.get_env_bucketvalue_key_size() if key_len is None else key_len
+        self.valueLen: int = BucketValue.get_env_bucketvalue_value_size() if value_len is None else value_len
+
+        # The BucketValues, None for an entry that was not decoded from rawEntries yet
+        self.values: List[Union[BucketValue, None]] = [] if bucket_values is None else bucket_values
+        # The packed entries the bucket was read from, see Bucket.from_bytes
+        self.rawEntries: Union[memoryview, None] = None
+        # mapping from key to the position of its BucketValue in the list
+        self.keyPositions: Dict[int, int] = {bucket_value.key: position for position, bucket_value in enumerate(self.values)}
+
+    @property
+    def list(self) -> List[BucketValue]:
+        """The list of BucketValues. Decodes every entry that was not decoded yet."""
+        if self.rawEntries is not None:
+            for position, item in enumerate(self.values):
+                if item is None:
+                    self.values[position] = self.decode_entry(position)
+            self.rawEntries = None
+        return self.values
 
     def __str__(self):
         result = f"<ID {self.bucketID}, local {self.localPrefixSize}, maxSize {self.maxSize}, curSize {len(self.list)}> [\n"
@@ -121,22 +219,40 @@ class Bucket(object):
         return self.__str__()
 
     def __len__(self):
-        return len(self.list)
+        return len(self.values)
 
     def __eq__(self, other):
         return self.list == other.list
 
     def __bytes__(self):
-        # make a bytearray of localPrefixSize, maxSize, currentSize, bucketID, and then the bucketValues.
-        # in total this is: 1+1+1+4+10*20 = 207 bytes for one bucket
-        local_prefix_size_bytes = self.localPrefixSize.to_bytes(1, byteorder='big')  # never a value > 32
-        max_size_bytes = self.maxSize.to_bytes(1, byteorder='big')  # never a value > 255
-        cur_size_bytes = len(self.list).to_bytes(1, byteorder='big')  # never a value > 255
-        bucket_id_bytes = self.bucketID.to_bytes(4, byteorder='big')  # max 2^32 buckets
-        bucket_values_bytes: bytes = bytes()
-        for bucket_value in self.list:
-            bucket_values_bytes += bytes(bucket_value)
-        return local_prefix_size_bytes + max_size_bytes + cur_size_bytes + bucket_id_bytes + bucket_values_bytes
+        buffer: bytearray = bytearray(self.get_bytes_size())
+        self.pack_into(buffer, 0)
+        return bytes(buffer)
+
+    def get_bytes_size(self) -> int:
+        """Determine the current size of the Bucket when it is converted to bytes."""
+        return BUCKET_HEADER_STRUCT.size + len(self.values) * (self.keyLen + self.valueLen)
+
+    def pack_into(self, buffer: bytearray, offset: int) -> None:
+        """Write the bytes of the Bucket into a preallocated buffer.
+        The layout is localPrefixSize, maxSize, currentSize, bucketID, and then the bucketValues.
+        In total this is: 1+2+2+4+10*20 = 209 bytes for a full bucket of 10 items.
+        Entries that were never decoded are copied from the bytes they were read from.
+
+        :param buffer: The buffer to write into, large enough to hold Bucket.get_bytes_size() bytes at *offset*
+        :param offset: The offset in the buffer to write the Bucket at
+        """
+        BUCKET_HEADER_STRUCT.pack_into(buffer, offset, self.localPrefixSize, self.maxSize, len(self.values), self.bucketID)
+        entry_struct, _ = get_bucket_entry_structs(self.keyLen, self.valueLen)
+        entry_len: int = entry_struct.size
+
+        position_offset: int = offset + BUCKET_HEADER_STRUCT.size
+        for position, bucket_value in enumerate(self.values):
+            if bucket_value is None:
+                buffer[position_offset:position_offset + entry_len] = self.rawEntries[position * entry_len:(position + 1) * entry_len]
+            else:
+                entry_struct.pack_into(buffer, position_offset, bucket_value.key, bucket_value.value)
+            position_offset += entry_len
 
     @staticmethod
     def get_env_bucket_max_size() -> int:
@@ -146,10 +262,12 @@ class Bucket(object):
         return ENV_BUCKET_MAX_SIZE
 
     @staticmethod
-    def get_env_bucket_bytes_max_size() -> int:
+    def get_env_bucket_bytes_max_size(key_len: int = None, value_len: int = None) -> int:
         """Determine the maximal size of the Bucket when
         it is converted to bytes.
 
+        :param key_len: The amount of bytes used to encode the keys, defaults to the environment's key size
+        :param value_len: The amount of bytes used to encode the values, defaults to the environment's value size
         :return: The max bytes size
         """
         # The calculation incorporates the nr of bytes needed
@@ -158,14 +276,17 @@ class Bucket(object):
         #   max_list_size +
         #   current_list_size +
         #   bucket ID +
-        #   env_max_list_size * env_bucketvalue_size
+        #   env_max_list_size * bucketvalue_size
         env_max_list_size = Bucket.get_env_bucket_max_size()
-        env_bucketvalue_size = BucketValue.get_env_bucketvalue_size()
-        return 1 + 1 + 1 + 4 + env_max_list_size * env_bucketvalue_size
+        key_len = BucketValue.get_env_bucketvalue_key_size() if key_len is None else key_len
+        value_len = BucketValue.get_env_bucketvalue_value_size() if value_len is None else value_len
+        return BUCKET_HEADER_STRUCT.size + env_max_list_size * (key_len + value_len)
 
     @classmethod
     def from_bytes(cls, byte_data: bytes, key_len: int, value_len: int):
         """Create a Bucket object from bytes.
+        Only the keys are decoded, a BucketValue is only created when its
+        entry is needed (see Bucket.search), the other entries stay packed.
 
         :param cls: (Implicit) Bucket class
         :param bytes_data: The bytes to parse
@@ -173,26 +294,38 @@ class Bucket(object):
         :param value_len: The amount of bytes used to encode the BucketValue values
         :return: The created bucket object
         """
-        list_start_byte: int = 1 + 1 + 1 + 4        # The start byte nr of the bucket value list
-        bucketvalue_len: int = key_len + value_len
-
-        local_prefix_size = int.from_bytes(byte_data[0:1], byteorder='big')
-        max_size = int.from_bytes(byte_data[1:2], byteorder='big')
-        cur_size = int.from_bytes(byte_data[2:3], byteorder='big')
-        bucket_id = int.from_bytes(byte_data[3:list_start_byte], byteorder='big')
+        view: memoryview = memoryview(byte_data)
+        local_prefix_size, max_size, cur_size, bucket_id = BUCKET_HEADER_STRUCT.unpack_from(view, 0)
+        _, key_struct = get_bucket_entry_structs(key_len, value_len)
 
+        # Create and return the Bucket object
+        bucket: Bucket = cls(bucket_id, local_prefix_size, max_size, key_len=key_len, value_len=value_len)
+        bucket.rawEntries = view[BUCKET_HEADER_STRUCT.size:BUCKET_HEADER_STRUCT.size + cur_size * key_struct.size]
+        bucket.values = [None] * cur_size
+        bucket.keyPositions = {key: position for position, (key,) in enumerate(key_struct.iter_unpack(bucket.rawEntries))}
+        return bucket
 
-        bucket_values = []
-        for i in range(list_start_byte, list_start_byte + cur_size * bucketvalue_len, bucketvalue_len):
-            key_bytes: bytes = byte_data[i:i + 4]
-            value_bytes: bytes = byte_data[i + 4:i + bucketvalue_len]
+    def decode_entry(self, position: int) -> BucketValue:
+        """Decode the packed entry at the given position of the list.
 
-            key = bin(int.from_bytes(key_bytes, byteorder='big'))[2:].zfill(32)
+        :param position: The position of the entry
+        :return: The decoded BucketValue
+        """
+        entry_struct, _ = get_bucket_entry_structs(self.keyLen, self.valueLen)
+        key, value = entry_struct.unpack_from(self.rawEntries, position * entry_struct.size)
+        return BucketValue(key, value, self.keyLen, self.valueLen)
 
-            bucket_values.append(BucketValue(key, value_bytes))
+    def get_value_at(self, position: int) -> BucketValue:
+        """Get the BucketValue at the given position of the list, decoding it if needed.
 
-        # Create and return the Bucket object
-        return cls(bucket_id, local_prefix_size, max_size, bucket_values)
+        :param position: The position of the entry
+        :return: The BucketValue
+        """
+        bucket_value: Union[BucketValue, None] = self.values[position]
+        if bucket_value is None:
+            bucket_value = self.decode_entry(position)
+            self.values[position] = bucket_value
+        return bucket_value
 
     def get_local_prefix_size(self) -> int:
         return self.localPrefixSize
@@ -215,13 +348,14 @@ class Bucket(object):
         :param value: value to insert
         :return: True if the value was inserted, False otherwise
         """
-        found = self.search(value.key)
-        if found is not None:
-            found.value = value.value
+        position = self.keyPositions.get(value.key)
+        if position is not None:
+            self.get_value_at(position).value = value.value
             return True
 
-        if len(self.list) < self.maxSize:
-            self.list.append(value)
+        if len(self.values) < self.maxSize:
+            self.keyPositions[value.key] = len(self.values)
+            self.values.append(value)
             return True
         return False
 
@@ -231,11 +365,18 @@ class Bucket(object):
         :param key: hashed key
         :return: True if the item was found and deleted, False otherwise
         """
-        for item in self.list:
-            if item.get_key() == key:
-                self.list.remove(item)
-                return True
-        return False
+        position = self.keyPositions.pop(key, None)
+        if position is None:
+            return False
+
+        # Move the last item into the freed position, the order of the list is irrelevant.
+        # It is decoded first, because packed entries must stay at their original position.
+        last_item: BucketValue = self.get_value_at(len(self.values) - 1)
+        self.values.pop()
+        if position < len(self.values):
+            self.values[position] = last_item
+            self.keyPositions[last_item.key] = position
+        return True
 
     def search(self, key) -> Union[BucketValue, None]:
         """
@@ -243,10 +384,8 @@ class Bucket(object):
         :param key: hashed key
         :return: item of type 'BucketValue' in the bucket with the given key, None if not found
         """
-        for item in self.list:
-            if item.get_key() == key:
-                return item
-        return None
+        position = self.keyPositions.get(key)
+        return None if position is None else self.get_value_at(position)
 
 
 def hash_function_str(key: int) -> str:
@@ -271,6 +410,69 @@ def get_hash_prefix(keyHash: str, prefixSize: int) -> str:
     return keyHash[: prefixSize]
 
 
+def hash_function_int(key: int) -> int:
+    """Hashes a key and returns the hash value as an integer.
+    Bit i of the result corresponds to character i of hash_function_str(key),
+    so the prefix of length n of the string hash is the n lowest bits of this hash.
+
+    :return: The hash as an int of at most 32 bits
+    """
+    return key & 0xFFFFFFFF
+
+
+def hash_function_string_key(key: Union[str, bytes]) -> int:
+    """Hashes a string key and returns the hash value as an integer, for an
+    index with 8B keys. Unlike the builtin hash(), the hash is the same in
+    every process, so it can be stored in a bucket storage file.
+    Different strings may have the same hash, so the values found for a
+    string key must be checked against the key by the caller.
+
+    :return: The hash as an int of at most 64 bits
+    """
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+
+def get_hash_prefix_int(keyHash: int, prefixSize: int) -> int:
+    """Determine the key hash prefix of an integer key hash, being
+    its *prefixSize* lowest bits.
+
+    :param keyHash: The hash value to extract the prefix from
+    :param prefixSize: The amount of bits in the prefix
+    :return: The prefix of the hash value, usable as a directory index.
+    """
+    return keyHash & ((1 << prefixSize) - 1)
+
+
+def get_prefix_str(prefix: int, prefixSize: int) -> str:
+    """Convert an integer prefix to its binary string form, in the
+    same bit order as the hash_function_str hashes. Used for printing.
+
+    :param prefix: The integer prefix
+    :param prefixSize: The amount of bits in the prefix
+    :return: The prefix as a string of '0' and '1' characters
+    """
+    return format(prefix, f'0{prefixSize}b')[::-1] if prefixSize > 0 else ''
+
+
+# BYTE_BIT_REVERSAL[b] is the byte b with its bits in reversed order, usable with bytes.translate
+BYTE_BIT_REVERSAL: bytes = bytes(int(format(b, '08b')[::-1], 2) for b in range(256))
+
+
+def reverse_bits(value: int, bitCount: int) -> int:
+    """Reverse the order of the *bitCount* lowest bits of an integer.
+    Sorting key hashes by their reversed bits groups all hashes with
+    the same prefix together.
+
+    :param value: The integer to reverse, smaller than 2 ** bitCount
+    :param bitCount: The amount of bits to reverse, a multiple of 8
+    :return: The reversed integer
+    """
+    # reverse the bits of every byte, and the order of the bytes
+    return int.from_bytes(value.to_bytes(bitCount // 8, 'little').translate(BYTE_BIT_REVERSAL), 'big')
+
+
 class BucketWrapper:
     """A class that wraps a Bucket, so that a Bucket object cab
     be evicted from memory or loaded into memory in one operation.
@@ -283,36 +485,438 @@ class BucketWrapper:
         self.contents: Union[Bucket, int] = initial_content
 
 
-class ExtendibleHashingIndex(object):
-    def __init__(self):
+class ReplacementPolicy(ABC):
+    """The interface of a BucketBufferPool replacement policy. A policy only
+    tracks bucket IDs; the buffer pool owns the actual Bucket objects.
+    """
+    def __init__(self, capacity: int):
+        """ReplacementPolicy constructor.
 
-        self.globalHashPrefixSize: int = 1
+        :param capacity: The maximum amount of buckets the buffer pool keeps in memory
+        """
+        self.capacity: int = capacity
 
-        self.bucketsFixedSize: int = Bucket.get_env_bucket_bytes_max_size()
-        self.bucketsMaxInMemory: int = 6
-        self.bucketsDataFileName: str = "buckets_data.dat"
-        self.bucketsIDCounter: int = 0
+    @abstractmethod
+    def admit(self, bucketID: int) -> None:
+        """Start tracking a bucket that was just loaded into memory."""
+
+    @abstractmethod
+    def access(self, bucketID: int) -> None:
+        """Record an access of a bucket that is in memory."""
+
+    @abstractmethod
+    def remove(self, bucketID: int) -> None:
+        """Stop tracking a bucket that was evicted from memory or discarded."""
+
+    @abstractmethod
+    def victim(self) -> int:
+        """Select the bucket to evict next. Does not remove it from the policy.
+
+        :return: The bucket ID of the victim
+        """
+
+
+class LRUReplacementPolicy(ReplacementPolicy):
+    """Evict the least recently used bucket."""
+    def __init__(self, capacity: int):
+        super().__init__(capacity)
+        self.order: OrderedDict = OrderedDict()
+
+    def admit(self, bucketID: int) -> None:
+        self.order[bucketID] = None
+
+    def access(self, bucketID: int) -> None:
+        self.order.move_to_end(bucketID)
+
+    def remove(self, bucketID: int) -> None:
+        del self.order[bucketID]
+
+    def victim(self) -> int:
+        return next(iter(self.order))
+
+
+class ClockReplacementPolicy(ReplacementPolicy):
+    """Approximate LRU with a clock hand sweeping over reference bits."""
+    def __init__(self, capacity: int):
+        super().__init__(capacity)
+        # The clock frames, None marks a free frame
+        self.frames: List[Union[int, None]] = []
+        self.frameOf: Dict[int, int] = dict()
+        self.referenced: List[bool] = []
+        self.freeFrames: List[int] = []
+        self.hand: int = 0
+
+    def admit(self, bucketID: int) -> None:
+        if self.freeFrames:
+            frame: int = self.freeFrames.pop()
+            self.frames[frame] = bucketID
+            self.referenced[frame] = True
+        else:
+            frame = len(self.frames)
+            self.frames.append(bucketID)
+            self.referenced.append(True)
+        self.frameOf[bucketID] = frame
+
+    def access(self, bucketID: int) -> None:
+        self.referenced[self.frameOf[bucketID]] = True
+
+    def remove(self, bucketID: int) -> None:
+        frame: int = self.frameOf.pop(bucketID)
+        self.frames[frame] = None
+        self.referenced[frame] = False
+        self.freeFrames.append(frame)
+
+    def victim(self) -> int:
+        assert self.frameOf, "Cannot select a victim from an empty clock"
+        while True:
+            self.hand %= len(self.frames)
+            bucketID: Union[int, None] = self.frames[self.hand]
+            if bucketID is not None:
+                if not self.referenced[self.hand]:
+                    return bucketID
+                self.referenced[self.hand] = False
+            self.hand += 1
+
+
+class TwoQueueReplacementPolicy(ReplacementPolicy):
+    """The (simplified) 2Q policy. Newly loaded buckets enter a FIFO queue (A1in),
+    so a burst of one-time accesses cannot flush the hot buckets. Buckets that
+    are loaded again shortly after being evicted from A1in (they are remembered
+    in the A1out ghost queue) are hot and enter an LRU queue (Am).
+    """
+    def __init__(self, capacity: int, kinRatio: float = 0.25, koutRatio: float = 0.5):
+        """TwoQueueReplacementPolicy constructor.
+
+        :param capacity: The maximum amount of buckets the buffer pool keeps in memory
+        :param kinRatio: The share of the capacity reserved for the A1in queue
+        :param koutRatio: The size of the A1out ghost queue relative to the capacity
+        """
+        super().__init__(capacity)
+        self.kin: int = max(1, int(capacity * kinRatio))
+        self.kout: int = max(1, int(capacity * koutRatio))
+        self.a1in: OrderedDict = OrderedDict()
+        self.a1out: OrderedDict = OrderedDict()
+        self.am: OrderedDict = OrderedDict()
+
+    def admit(self, bucketID: int) -> None:
+        if bucketID in self.a1out:
+            del self.a1out[bucketID]
+            self.am[bucketID] = None
+        else:
+            self.a1in[bucketID] = None
+
+    def access(self, bucketID: int) -> None:
+        if bucketID in self.am:
+            self.am.move_to_end(bucketID)
+
+    def remove(self, bucketID: int) -> None:
+        if bucketID in self.am:
+            del self.am[bucketID]
+            return
+        del self.a1in[bucketID]
+        # Remember the bucket, a quick reload promotes it to the hot queue
+        self.a1out[bucketID] = None
+        if len(self.a1out) > self.kout:
+            self.a1out.popitem(last=False)
+
+    def victim(self) -> int:
+        if len(self.a1in) > self.kin or not self.am:
+            return next(iter(self.a1in))
+        return next(iter(self.am))
+
+
+# The replacement policies selectable by name
+REPLACEMENT_POLICIES: Dict[str, Callable[[int], ReplacementPolicy]] = {
+    "lru": LRUReplacementPolicy,
+    "clock": ClockReplacementPolicy,
+    "2q": TwoQueueReplacementPolicy,
+}
+
+
+class BucketBufferPool(object):
+    """Keeps a limited amount of buckets in memory. Every bucket in memory has
+    a dirty bit, only dirty buckets are written to disk when they are evicted
+    or when the pool is flushed.
+
+    A bucket is evicted by replacing the contents of its BucketWrapper with the
+    bucket ID, see BucketWrapper.
+    """
+    def __init__(self, capacity: int, policy: ReplacementPolicy, writeBucket: Callable[[Bucket], None]):
+        """BucketBufferPool constructor.
+
+        :param capacity: The maximum amount of buckets in memory
+        :param policy: The replacement policy that selects the buckets to evict
+        :param writeBucket: The function used to write a bucket to disk
+        """
+        assert capacity >= 2, "A bucket buffer pool must be able to hold at least the two halves of a split"
+        self.capacity: int = capacity
+        self.policy: ReplacementPolicy = policy
+        self.writeBucket: Callable[[Bucket], None] = writeBucket
+
+        # mapping from bucket ID to BucketWrapper, for the buckets in memory
+        self.bucketsToWrapper: Dict[int, BucketWrapper] = dict()
+        self.dirtyBucketIDs: Set[int] = set()
+
+    def __len__(self):
+        return len(self.bucketsToWrapper)
+
+    def __contains__(self, bucketID: int):
+        return bucketID in self.bucketsToWrapper
+
+    def add(self, bucketWrapper: BucketWrapper, dirty: bool) -> None:
+        """Take the bucket in the wrapper into memory, evicting another bucket if the pool is full.
+        If a bucket with the same ID is already in memory, it is replaced.
+
+        :param bucketWrapper: The wrapper containing the bucket
+        :param dirty: Whether the bucket differs from its on-disk version
+        """
+        bucket: Bucket = bucketWrapper.contents
+        assert isinstance(bucket, Bucket), f"Can only add a bucket to the buffer pool, not a '{bucket.__class__.__name__}' type"
 
-        bucket0: Bucket = Bucket(self.reserve_bucket_ID())
-        bucket1: Bucket = Bucket(self.reserve_bucket_ID())
+        if bucket.bucketID in self.bucketsToWrapper:
+            self.policy.access(bucket.bucketID)
+        else:
+            if len(self.bucketsToWrapper) >= self.capacity:
+                self.evict(self.policy.victim())
+            self.policy.admit(bucket.bucketID)
+
+        self.bucketsToWrapper[bucket.bucketID] = bucketWrapper
+        if dirty:
+            self.dirtyBucketIDs.add(bucket.bucketID)
+
+    def access(self, bucketID: int) -> None:
+        """Record an access of a bucket in memory."""
+        self.policy.access(bucketID)
+
+    def mark_dirty(self, bucketID: int) -> None:
+        """Mark a bucket in memory as modified, so that it is written to disk before it is evicted."""
+        assert bucketID in self.bucketsToWrapper, f"Cannot mark bucket {bucketID} dirty, it is not in memory"
+        self.dirtyBucketIDs.add(bucketID)
+
+    def evict(self, bucketID: int) -> None:
+        """Evict a bucket from memory, writing it to disk first if it is dirty.
+
+        :param bucketID: The ID of the bucket to evict
+        """
+        bucketWrapper: BucketWrapper = self.bucketsToWrapper.pop(bucketID)
+        self.policy.remove(bucketID)
+        if bucketID in self.dirtyBucketIDs:
+            self.dirtyBucketIDs.remove(bucketID)
+            self.writeBucket(bucketWrapper.contents)   # flush bucket before in-mem eviction
+        bucketWrapper.contents = bucketID   # Do in-mem eviction
+
+    def discard(self, bucketID: int) -> None:
+        """Drop a bucket that no longer exists from memory, without writing it to disk.
+
+        :param bucketID: The ID of the bucket to drop, it does not have to be in memory
+        """
+        if bucketID not in self.bucketsToWrapper:
+            return
+        del self.bucketsToWrapper[bucketID]
+        self.policy.remove(bucketID)
+        self.dirtyBucketIDs.discard(bucketID)
+
+    def flush(self) -> None:
+        """Write all dirty buckets to disk, in bucket ID order. The buckets stay in memory."""
+        for bucketID in sorted(self.dirtyBucketIDs):
+            self.writeBucket(self.bucketsToWrapper[bucketID].contents)
+        self.dirtyBucketIDs.clear()
+
+
+class ExtendibleHashingIndex(object):
+    def __init__(self, bucketsMaxInMemory: int = 6, replacementPolicy: Union[str, Callable[[int], ReplacementPolicy]] = "lru",
+                 bucketsDataFileName: str = "buckets_data.dat", mergeThreshold: float = 0.5,
+                 keySize: int = None, valueSize: int = None, hashFunction: Callable = hash_function_int):
+        """ExtendibleHashingIndex constructor.
+        The index keeps its bucket storage file open until ExtendibleHashingIndex.close() is called.
+        An existing bucket storage file with the same name is truncated.
+        Several indexes can be used at the same time, as long as each has its own bucket storage file.
+
+        :param bucketsMaxInMemory: The maximum amount of buckets kept in memory
+        :param replacementPolicy: The buffer pool replacement policy, either a name
+            in REPLACEMENT_POLICIES or a ReplacementPolicy subclass
+        :param bucketsDataFileName: The file to store the buckets in
+        :param mergeThreshold: A bucket is merged with its buddy bucket after a delete when their
+            combined size is at most this fraction of the max bucket size, 0 disables merging
+        :param keySize: The amount of bytes of a key hash, one of BUCKET_KEY_FORMATS, defaults to the environment's key size
+        :param valueSize: The amount of bytes of a value, defaults to the environment's value size
+        :param hashFunction: The function used to hash the keys, its hashes must fit in *keySize* bytes,
+            e.g. hash_function_int for int keys of 4B or hash_function_string_key for string keys of 8B
+        """
+        assert 0 <= mergeThreshold <= 1, "The merged bucket must fit in a single bucket"
+        self.globalHashPrefixSize: int = 1
+        self.mergeThreshold: float = mergeThreshold
+
+        self.keySize: int = BucketValue.get_env_bucketvalue_key_size() if keySize is None else keySize
+        self.valueSize: int = BucketValue.get_env_bucketvalue_value_size() if valueSize is None else valueSize
+        assert self.keySize in BUCKET_KEY_FORMATS, f"Unsupported key size: {self.keySize}B, expected one of {list(BUCKET_KEY_FORMATS)}"
+        self.hashFunction: Callable = hashFunction
+        self.bucketsFixedSize: int = Bucket.get_env_bucket_bytes_max_size(self.keySize, self.valueSize)
+        self.bucketsMaxInMemory: int = bucketsMaxInMemory
+        self.bucketsDataFileName: str = bucketsDataFileName
+        self.bucketsFile: Union[int, None] = os.open(
+            self.bucketsDataFileName, os.O_RDWR | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644
+        )
+        self.bucketsIDCounter: int = 0
+        # IDs below the counter of buckets that were merged away, reused before the counter grows
+        self.freeBucketIDs: Set[int] = set()
+        # The offset of the directory segment in the bucket storage file, None while it was not written yet
+        self.directoryOffset: Union[int, None] = None
+        self.bucketPool: BucketBufferPool = self.create_bucket_pool(replacementPolicy)
+
+        bucket0: Bucket = Bucket(self.reserve_bucket_ID(), key_len=self.keySize, value_len=self.valueSize)
+        bucket1: Bucket = Bucket(self.reserve_bucket_ID(), key_len=self.keySize, value_len=self.valueSize)
         bucketWrapper0: BucketWrapper = BucketWrapper(bucket0)
         bucketWrapper1: BucketWrapper = BucketWrapper(bucket1)
-        self.bucketPointers: Dict[str: Union[int, BucketWrapper]] = {
-            "0": bucketWrapper0,
-            "1": bucketWrapper1
-        }
-        # List of bucket IDs
-        self.bucketsInMemory: List[Bucket] = [bucket0, bucket1]
-        # mapping from bucket ID to BucketWrapper
-        self.bucketsToWrapper: Dict[int, BucketWrapper] = {
-            bucket0.bucketID: bucketWrapper0,
-            bucket1.bucketID: bucketWrapper1,
-        }
+        # The directory, indexed by the integer global prefix of a key hash
+        self.bucketPointers: List[BucketWrapper] = [
+            bucketWrapper0,
+            bucketWrapper1
+        ]
+        self.bucketPool.add(bucketWrapper0, dirty=True)
+        self.bucketPool.add(bucketWrapper1, dirty=True)
+        self.write_metadata()
+
+    @classmethod
+    def open(cls, bucketsDataFileName: str, bucketsMaxInMemory: int = 6,
+             replacementPolicy: Union[str, Callable[[int], ReplacementPolicy]] = "lru", mergeThreshold: float = 0.5,
+             hashFunction: Callable = hash_function_int) -> "ExtendibleHashingIndex":
+        """Reopen an index from an existing bucket storage file, with the directory of its last flush.
+        The file is only consistent after ExtendibleHashingIndex.flush or ExtendibleHashingIndex.sync:
+        evicted buckets are written in place in between and freed bucket IDs are reused, so after a
+        crash the file can hold a mix of flushed and newer buckets, and the index must be rebuilt.
+        Only the metadata header and the directory are read, the buckets are
+        loaded lazily when they are first needed. The key and value sizes are
+        read from the header, the hash function is not stored and must be passed again.
+
+        :param bucketsDataFileName: The bucket storage file of the index
+        :param bucketsMaxInMemory: The maximum amount of buckets kept in memory
+        :param replacementPolicy: The buffer pool replacement policy, see ExtendibleHashingIndex.__init__
+        :param mergeThreshold: The bucket merge threshold, see ExtendibleHashingIndex.__init__
+        :param hashFunction: The function the index was created with, see ExtendibleHashingIndex.__init__
+        :return: The reopened index
+        """
+        index: ExtendibleHashingIndex = cls.__new__(cls)
+        index.mergeThreshold = mergeThreshold
+        index.hashFunction = hashFunction
+        index.bucketsMaxInMemory = bucketsMaxInMemory
+        index.bucketsDataFileName = bucketsDataFileName
+        index.bucketsFile = os.open(bucketsDataFileName, os.O_RDWR | getattr(os, "O_BINARY", 0))
+        index.bucketPool = index.create_bucket_pool(replacementPolicy)
+        try:
+            index.read_metadata()
+        except Exception:
+            os.close(index.bucketsFile)
+            raise
+        return index
+
+    def create_bucket_pool(self, replacementPolicy: Union[str, Callable[[int], ReplacementPolicy]]) -> BucketBufferPool:
+        """Create the buffer pool that holds the in-memory buckets of this index.
+
+        :param replacementPolicy: The replacement policy name or class
+        :return: The empty buffer pool
+        """
+        if isinstance(replacementPolicy, str):
+            replacementPolicy = REPLACEMENT_POLICIES[replacementPolicy]
+        self.replacementPolicy: Callable[[int], ReplacementPolicy] = replacementPolicy
+        return BucketBufferPool(self.bucketsMaxInMemory, replacementPolicy(self.bucketsMaxInMemory), self.write_bucket)
+
+    def get_bucket_offset(self, bucketID: int) -> int:
+        """Determine the offset of a bucket in the bucket storage file.
+
+        :param bucketID: The ID of the bucket
+        :return: The offset in bytes
+        """
+        return BUCKETS_FILE_HEADER_SIZE + self.bucketsFixedSize * bucketID
+
+    def write_metadata(self) -> None:
+        """Write the metadata header and the directory segment to the bucket storage file.
+        The directory segment directly follows the last bucket and stores the bucket ID
+        of every directory entry as a 4B integer, followed by the free bucket IDs. A bucket
+        that is reserved afterwards never overwrites it, see ExtendibleHashingIndex.move_directory.
+        """
+        directoryOffset: int = self.get_bucket_offset(self.bucketsIDCounter)
+        bucketIDs: List[int] = [
+            wrapper.contents if isinstance(wrapper.contents, int) else wrapper.contents.bucketID
+            for wrapper in self.bucketPointers
+        ]
+        freeBucketIDs: List[int] = sorted(self.freeBucketIDs)
+        directoryBytes: bytes = struct.pack(f"<{len(bucketIDs) + len(freeBucketIDs)}I", *bucketIDs, *freeBucketIDs)
+        write_at(self.bucketsFile, directoryBytes, directoryOffset)
+        os.ftruncate(self.bucketsFile, directoryOffset + len(directoryBytes))
+
+        header: bytes = struct.pack(
+            BUCKETS_FILE_HEADER_FORMAT,
+            BUCKETS_FILE_MAGIC, BUCKETS_FILE_VERSION, self.globalHashPrefixSize,
+            self.keySize, self.valueSize,
+            Bucket.get_env_bucket_max_size(), self.bucketsFixedSize, self.bucketsIDCounter,
+            directoryOffset, len(bucketIDs), len(freeBucketIDs)
+        )
+        write_at(self.bucketsFile, header.ljust(BUCKETS_FILE_HEADER_SIZE, b"\0"), 0)
+        self.directoryOffset = directoryOffset
+
+    def move_directory(self, directoryOffset: int) -> None:
+        """Move the directory segment of the last flush further into the bucket storage file.
+        The directory is copied past its current place before the header refers to the copy, so the
+        header always refers to a complete directory segment. Used before a bucket that was reserved
+        after the last flush is written over the directory segment. This only keeps the directory intact,
+        the buckets themselves are still only consistent with it after the next flush.
+
+        :param directoryOffset: The minimal new offset of the directory segment
+        """
+        headerBytes: bytes = read_at(self.bucketsFile, struct.calcsize(BUCKETS_FILE_HEADER_FORMAT), 0)
+        header: List = list(struct.unpack(BUCKETS_FILE_HEADER_FORMAT, headerBytes))
+        # directory offset, directory length, free bucket IDs length
+        directoryBytes: bytes = read_at(self.bucketsFile, 4 * (header[-2] + header[-1]), header[-3])
+        directoryOffset = max(directoryOffset, header[-3] + len(directoryBytes))
+        write_at(self.bucketsFile, directoryBytes, directoryOffset)
+        header[-3] = directoryOffset
+        write_at(self.bucketsFile, struct.pack(BUCKETS_FILE_HEADER_FORMAT, *header), 0)
+        self.directoryOffset = directoryOffset
+
+    def read_metadata(self) -> None:
+        """Restore the key and value sizes, the global prefix size, the bucket ID counter
+        and the directory from the bucket storage file. Every directory entry refers to
+        its bucket by ID, so no bucket is loaded into memory.
+        """
+        headerBytes: bytes = read_at(self.bucketsFile, struct.calcsize(BUCKETS_FILE_HEADER_FORMAT), 0)
+        if len(headerBytes) != struct.calcsize(BUCKETS_FILE_HEADER_FORMAT) or headerBytes[:4] != BUCKETS_FILE_MAGIC:
+            raise ValueError(f"'{self.bucketsDataFileName}' is not a bucket storage file")
+
+        (_, version, globalHashPrefixSize, keySize, valueSize, bucketMaxSize,
+         bucketsFixedSize, bucketsIDCounter, directoryOffset, directoryLength, freeBucketIDsLength) = struct.unpack(BUCKETS_FILE_HEADER_FORMAT, headerBytes)
+        if version != BUCKETS_FILE_VERSION:
+            raise ValueError(f"Unsupported bucket storage file version: got {version}, expected {BUCKETS_FILE_VERSION}")
+        if keySize not in BUCKET_KEY_FORMATS:
+            raise ValueError(f"Unsupported key size in the bucket storage file: {keySize}B")
+        expected = (Bucket.get_env_bucket_max_size(), Bucket.get_env_bucket_bytes_max_size(keySize, valueSize))
+        if (bucketMaxSize, bucketsFixedSize) != expected:
+            raise ValueError(f"The bucket storage file was created with different sizes: got {(bucketMaxSize, bucketsFixedSize)}, expected {expected}")
+        assert directoryLength == 1 << globalHashPrefixSize, f"Corrupt directory segment: {directoryLength} entries for global prefix size {globalHashPrefixSize}"
+
+        directoryBytes: bytes = read_at(self.bucketsFile, 4 * (directoryLength + freeBucketIDsLength), directoryOffset)
+        bucketIDs: Tuple[int, ...] = struct.unpack_from(f"<{directoryLength}I", directoryBytes)
+        self.freeBucketIDs = set(struct.unpack_from(f"<{freeBucketIDsLength}I", directoryBytes, 4 * directoryLength))
+
+        # All prefixes of the same bucket share one wrapper
+        wrappers: Dict[int, BucketWrapper] = dict()
+        self.keySize = keySize
+        self.valueSize = valueSize
+        self.bucketsFixedSize = bucketsFixedSize
+        self.globalHashPrefixSize = globalHashPrefixSize
+        self.bucketsIDCounter = bucketsIDCounter
+        self.directoryOffset = directoryOffset
+        self.bucketPointers = []
+        for bucketID in bucketIDs:
+            if bucketID not in wrappers:
+                wrappers[bucketID] = BucketWrapper(bucketID)
+            self.bucketPointers.append(wrappers[bucketID])
 
     def __str__(self):
         reversedDict = dict()
         bucketByID = dict()
-        for k, v in self.bucketPointers.items():
+        for prefix, v in enumerate(self.bucketPointers):
+            k = get_prefix_str(prefix, self.globalHashPrefixSize)
             v = v.contents if isinstance(v.contents, Bucket) else self.read_bucket(v.contents)
             bucketByID[v.bucketID] = v
             if v.bucketID in reversedDict.keys():
@@ -327,18 +931,99 @@ class ExtendibleHashingIndex(object):
 
         return printStr
 
+    def bulk_load(self, keyValues: Iterable[Tuple[int, bytes]], hash_function: Callable=None) -> None:
+        """Replace the contents of the index by the given key-value pairs.
+        If a key occurs more than once, its last value is kept.
+
+        Instead of inserting the pairs one by one, the key hashes are partitioned by
+        prefix up front. Every partition that fits in a bucket becomes a bucket, so
+        the final global prefix size is known before anything is written, and every
+        bucket is written exactly once, sequentially.
+
+        :param keyValues: An iterable of (key, value) pairs
+        :param hash_function: The function used to hash the keys, defaults to the index's hash function
+        """
+        hash_function = self.hashFunction if hash_function is None else hash_function
+        values: Dict[int, bytes] = {hash_function(key): value for key, value in keyValues}
+        keyBits: int = self.keySize * 8
+        maxSize: int = Bucket.get_env_bucket_max_size()
+
+        # In reversed bit order, the hashes sharing a prefix form a contiguous range
+        reversedHashes: List[int] = sorted(reverse_bits(keyHash, keyBits) for keyHash in values)
+
+        # Partition the ranges until every range fits in a bucket: (prefix, local prefix size, start, end)
+        partitions: List[Tuple[int, int, int, int]] = []
+        todo: List[Tuple[int, int, int, int]] = [(0, 0, 0, len(reversedHashes))]
+        while todo:
+            prefix, prefixSize, start, end = todo.pop()
+            if end - start <= maxSize and prefixSize >= 1:
+                partitions.append((prefix, prefixSize, start, end))
+                continue
+            assert prefixSize < keyBits, "Cannot partition more key hashes than fit in a bucket with identical hashes"
+            prefix0, prefix1 = self.get_extended_prefixes(prefix, prefixSize)
+            middle: int = bisect_left(reversedHashes, reverse_bits(prefix1, keyBits), start, end)
+            todo.append((prefix1, prefixSize + 1, middle, end))
+            todo.append((prefix0, prefixSize + 1, start, middle))
+
+        # Discard the current contents
+        self.bucketPool = self.create_bucket_pool(self.replacementPolicy)
+        self.globalHashPrefixSize = max(prefixSize for _, prefixSize, _, _ in partitions)
+        self.bucketsIDCounter = 0
+        self.freeBucketIDs = set()
+        self.bucketPointers = [None] * (1 << self.globalHashPrefixSize)
+
+        # Write the buckets in ID order, in chunks
+        chunk: bytearray = bytearray()
+        chunkOffset: int = self.get_bucket_offset(0)
+        for prefix, prefixSize, start, end in partitions:
+            bucketValues: List[BucketValue] = []
+            for idx in range(start, end):
+                keyHash: int = reverse_bits(reversedHashes[idx], keyBits)
+                bucketValues.append(BucketValue(keyHash, values[keyHash], self.keySize, self.valueSize))
+            bucket: Bucket = Bucket(self.reserve_bucket_ID(), prefixSize, maxSize, bucketValues, self.keySize, self.valueSize)
+            chunk += bytes(self.bucketsFixedSize)
+            bucket.pack_into(chunk, len(chunk) - self.bucketsFixedSize)
+
+            bucketWrapper: BucketWrapper = BucketWrapper(bucket.bucketID)
+            for ptr in range(prefix, len(self.bucketPointers), 1 << prefixSize):
+                self.bucketPointers[ptr] = bucketWrapper
+
+            if len(chunk) >= (1 << 22):
+                write_at(self.bucketsFile, bytes(chunk), chunkOffset)
+                chunkOffset += len(chunk)
+                chunk = bytearray()
+        write_at(self.bucketsFile, bytes(chunk), chunkOffset)
+
+        self.write_metadata()
+
     def reserve_bucket_ID(self) -> int:
         """Reserve a bucket ID value.
-        Each subsequent call of this method increments
-        the bucket ID counter.
+        A freed bucket ID is reused if there is one, so that its
+        space in the bucket storage file is reused. Otherwise,
+        this method increments the bucket ID counter.
 
         :return: A unique bucket ID
         """
+        if self.freeBucketIDs:
+            return self.freeBucketIDs.pop()
         oldValue: int = self.bucketsIDCounter
         self.bucketsIDCounter += 1
         return oldValue
 
-    def get_bucket(self, prefix: str) -> Tuple[Union[Bucket, None], Union[BucketWrapper, None]]:
+    def release_bucket_ID(self, bucketID: int) -> None:
+        """Free the ID of a bucket that no longer exists, so that it can be reserved again.
+        Free IDs at the end of the ID range lower the bucket ID counter instead,
+        which shrinks the bucket storage file on the next flush.
+
+        :param bucketID: The bucket ID to free
+        """
+        self.bucketPool.discard(bucketID)
+        self.freeBucketIDs.add(bucketID)
+        while self.bucketsIDCounter - 1 in self.freeBucketIDs:
+            self.bucketsIDCounter -= 1
+            self.freeBucketIDs.remove(self.bucketsIDCounter)
+
+    def get_bucket(self, prefix: int) -> Tuple[Union[Bucket, None], Union[BucketWrapper, None]]:
         """Retrieve the bucket corresponding to the given prefix.
 
         :param prefix: A prefix of the full key hash to find the bucket for
@@ -347,64 +1032,71 @@ class ExtendibleHashingIndex(object):
             The corresponding BucketWrapper if it exists, else None,
         )
         """
-        bucket_wrapper: BucketWrapper = self.bucketPointers.get(prefix, None)
-        assert bucket_wrapper is not None, f"Invalid prefix was used to get a bucket, no {BucketWrapper.__class__.__name__} was found for the prefix '{prefix}'"
+        assert 0 <= prefix < len(self.bucketPointers), f"Invalid prefix was used to get a bucket, no {BucketWrapper.__name__} was found for the prefix '{prefix}'"
+        bucket_wrapper: BucketWrapper = self.bucketPointers[prefix]
         bucket: Union[int, Bucket] = bucket_wrapper.contents
         if isinstance(bucket, int):
             bucket = self.read_bucket(bucket)
             bucket_wrapper.contents = bucket
-            self.set_bucket(prefix, bucket_wrapper)
-            assert len(self.bucketsInMemory) <= self.bucketsMaxInMemory, f"Too many buckets in memory: {len(self.bucketsInMemory)} > {self.bucketsMaxInMemory}"
+            self.bucketPool.add(bucket_wrapper, dirty=False)
+            assert len(self.bucketPool) <= self.bucketsMaxInMemory, f"Too many buckets in memory: {len(self.bucketPool)} > {self.bucketsMaxInMemory}"
+        else:
+            self.bucketPool.access(bucket.bucketID)
         return bucket, bucket_wrapper
 
-    def set_bucket(self, prefix: str, bucketWrapper: BucketWrapper) -> None:
-        """Store the given bucket or bucket ID under the given prefix.
-        Evicts another bucket from memory if there is no more room in-memory.
+    def set_bucket(self, prefix: int, bucketWrapper: BucketWrapper) -> None:
+        """Store the given bucket wrapper under the given prefix.
+        The wrapped bucket must already be known to the buffer pool.
 
-        :param prefix: The prefix of the full key hash to set the bucket or bucket ID for
+        :param prefix: The prefix of the full key hash to set the bucket wrapper for
         :param bucketWrapper: The bucket wrapper to map the prefix to
         """
-        wrapperContents: Union[Bucket, int] = bucketWrapper.contents
-        bucketID: int = wrapperContents if isinstance(wrapperContents, int) else wrapperContents.bucketID
-
-        # Always overwrite wrapper, is actually redundant
-        # if BucketWrapper is not new
-
-        if isinstance(wrapperContents, Bucket):
-            self.bucketsToWrapper[bucketID] = bucketWrapper
-            self.write_bucket(wrapperContents)
-            
-            bucketNotInMem: bool = wrapperContents not in self.bucketsInMemory
-            if len(self.bucketsInMemory) >= self.bucketsMaxInMemory and bucketNotInMem:
-                evicted_bucket: Bucket = self.bucketsInMemory.pop(0)
-                evicted_bucket_wrapper: BucketWrapper = self.bucketsToWrapper[evicted_bucket.bucketID]
-                self.write_bucket(evicted_bucket)   # flush bucket before in-mem eviction
-                evicted_bucket_wrapper.contents = evicted_bucket.bucketID   # Do in-mem eviction
-
-            if bucketNotInMem:
-                self.bucketsInMemory.append(wrapperContents)
-            
-        else:
-            self.bucketsToWrapper[bucketID] = bucketWrapper
-
         self.bucketPointers[prefix] = bucketWrapper
 
-    def get_hash_from_key(self, key: int, hash_function: Callable=hash_function_str):
+    def flush(self) -> None:
+        """Write all modified in-memory buckets, the metadata header and
+        the directory to the bucket storage file.
+        """
+        self.bucketPool.flush()
+        self.write_metadata()
+
+    def sync(self) -> None:
+        """Flush the index and force the bucket storage file to disk."""
+        self.flush()
+        os.fsync(self.bucketsFile)
+
+    def close(self) -> None:
+        """Flush the index and close its bucket storage file. The index
+        can no longer be used afterwards.
+        """
+        if self.bucketsFile is None:
+            return
+        self.flush()
+        os.close(self.bucketsFile)
+        self.bucketsFile = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get_hash_from_key(self, key, hash_function: Callable=None) -> int:
         """Transform the given key into a hash.
 
         :param key: The key to hash
-        :param 
+        :param hash_function: The function used to hash the key, defaults to the index's hash function
         :return: The key hash
         """
-        return hash_function(key)
+        return self.hashFunction(key) if hash_function is None else hash_function(key)
     
-    def get_prefix_from_key_hash(self, keyHash: str) -> str:
+    def get_prefix_from_key_hash(self, keyHash: int) -> int:
         """Extract the index's global prefix from the given key hash.
 
         :param keyHash: The key hash to extract the prefix from
-        :return: The global prefix
+        :return: The global prefix, which is the directory index of the key hash
         """
-        return get_hash_prefix(keyHash=keyHash, prefixSize=self.globalHashPrefixSize)
+        return get_hash_prefix_int(keyHash=keyHash, prefixSize=self.globalHashPrefixSize)
 
     def get(self, key):
         """
@@ -414,27 +1106,87 @@ class ExtendibleHashingIndex(object):
         :return:
         """
         # first, get the bucket associated with the key
-        keyHash: str = self.get_hash_from_key(key=key)
-        prefix: str = self.get_prefix_from_key_hash(keyHash=keyHash)
+        keyHash: int = self.get_hash_from_key(key=key)
+        prefix: int = self.get_prefix_from_key_hash(keyHash=keyHash)
         bucket, _ = self.get_bucket(prefix=prefix)
         # then, get the item from the bucket
         return bucket.search(keyHash)
 
-    def insert_keyval(self, key: int, value: bytes):
+    def get_many(self, keys: Iterable) -> List[Union[BucketValue, None]]:
+        """
+        Returns the item for each of the given keys from the index. The keys are
+        grouped by bucket first, so that every bucket is loaded at most once.
+
+        :param keys: non-hashed keys
+        :return: The found item or None for every key, in the order of the keys
+        """
+        keyHashes: List[int] = [self.get_hash_from_key(key=key) for key in keys]
+        results: List[Union[BucketValue, None]] = [None] * len(keyHashes)
+
+        # group the key positions by the bucket (wrapper) that contains them: id(wrapper) -> (prefix, positions)
+        groups: Dict[int, Tuple[int, List[int]]] = dict()
+        for position, keyHash in enumerate(keyHashes):
+            prefix: int = self.get_prefix_from_key_hash(keyHash=keyHash)
+            group = groups.get(id(self.bucketPointers[prefix]))
+            if group is None:
+                groups[id(self.bucketPointers[prefix])] = (prefix, [position])
+            else:
+                group[1].append(position)
+
+        for prefix, positions in groups.values():
+            bucket, _ = self.get_bucket(prefix=prefix)
+            for position in positions:
+                results[position] = bucket.search(keyHashes[position])
+        return results
+
+    def insert_keyval(self, key, value: bytes):
         """Inserts a key-value pair into the index."""
-        keyHash: str = self.get_hash_from_key(key=key)
-        prefix: str = self.get_prefix_from_key_hash(keyHash=keyHash)
+        keyHash: int = self.get_hash_from_key(key=key)
+        prefix: int = self.get_prefix_from_key_hash(keyHash=keyHash)
         bucket, bucketWrapper = self.get_bucket(prefix=prefix)
-        bucketValue: BucketValue = BucketValue(keyHash, value)
+        bucketValue: BucketValue = BucketValue(keyHash, value, self.keySize, self.valueSize)
         success: bool = bucket.insert(bucketValue)
 
+        if success:
+            self.bucketPool.mark_dirty(bucket.bucketID)
         # Bucket is full, split it
-        if not success:
+        else:
             self.split(bucketWrapper)
 
             # insert recursively (for in the case that the destination bucket is still full)
             self.insert_keyval(key, value)
 
+    def insert_many(self, keyValues: Iterable[Tuple[object, bytes]]) -> None:
+        """Inserts key-value pairs into the index. Like ExtendibleHashingIndex.get_many, the pairs
+        are grouped by bucket first, so that every bucket is loaded at most once, unless it is split.
+
+        :param keyValues: An iterable of (non-hashed key, value) pairs
+        """
+        keyValues = list(keyValues)
+        keyHashes: List[int] = [self.get_hash_from_key(key=key) for key, _ in keyValues]
+
+        # group the pair positions by the bucket (wrapper) that contains their keys
+        groups: Dict[int, Tuple[int, List[int]]] = dict()
+        for position, keyHash in enumerate(keyHashes):
+            prefix: int = self.get_prefix_from_key_hash(keyHash=keyHash)
+            group = groups.get(id(self.bucketPointers[prefix]))
+            if group is None:
+                groups[id(self.bucketPointers[prefix])] = (prefix, [position])
+            else:
+                group[1].append(position)
+
+        # pairs that did not fit in their bucket, a bucket split changes the directory
+        overflow: List[int] = []
+        for prefix, positions in groups.values():
+            bucket, _ = self.get_bucket(prefix=prefix)
+            for idx, position in enumerate(positions):
+                if not bucket.insert(BucketValue(keyHashes[position], keyValues[position][1], self.keySize, self.valueSize)):
+                    overflow.extend(positions[idx:])
+                    break
+            self.bucketPool.mark_dirty(bucket.bucketID)
+        for position in overflow:
+            self.insert_keyval(*keyValues[position])
+
     def delete(self, key):
         """
         Deletes the first item with the given key from the index.
@@ -442,11 +1194,100 @@ class ExtendibleHashingIndex(object):
         :return:
         """
         # first, get the bucket associated with the key
-        keyHash = self.get_hash_from_key(key=key)
-        prefix: str = self.get_prefix_from_key_hash(keyHash=keyHash)
+        keyHash: int = self.get_hash_from_key(key=key)
+        prefix: int = self.get_prefix_from_key_hash(keyHash=keyHash)
         bucket, _ = self.get_bucket(prefix=prefix)
         # then, delete the item from the bucket
-        return bucket.delete(keyHash)
+        deleted: bool = bucket.delete(keyHash)
+        if deleted:
+            self.bucketPool.mark_dirty(bucket.bucketID)
+            self.merge(prefix)
+        return deleted
+
+    def delete_many(self, keys: Iterable) -> List[bool]:
+        """
+        Deletes the items with the given keys from the index. Like ExtendibleHashingIndex.get_many,
+        the keys are grouped by bucket first, so that every bucket is loaded and merged at most once.
+
+        :param keys: non-hashed keys
+        :return: Whether an item was deleted, for every key in the order of the keys
+        """
+        keyHashes: List[int] = [self.get_hash_from_key(key=key) for key in keys]
+        results: List[bool] = [False] * len(keyHashes)
+
+        # group the key positions by the bucket (wrapper) that contains them: id(wrapper) -> (prefix, positions)
+        groups: Dict[int, Tuple[int, List[int]]] = dict()
+        for position, keyHash in enumerate(keyHashes):
+            prefix: int = self.get_prefix_from_key_hash(keyHash=keyHash)
+            group = groups.get(id(self.bucketPointers[prefix]))
+            if group is None:
+                groups[id(self.bucketPointers[prefix])] = (prefix, [position])
+            else:
+                group[1].append(position)
+
+        # a key hash of every bucket that shrunk, the merges change the directory
+        shrunkKeyHashes: List[int] = []
+        for prefix, positions in groups.values():
+            bucket, _ = self.get_bucket(prefix=prefix)
+            for position in positions:
+                results[position] = bucket.delete(keyHashes[position])
+            if any(results[position] for position in positions):
+                self.bucketPool.mark_dirty(bucket.bucketID)
+                shrunkKeyHashes.append(keyHashes[positions[0]])
+        for keyHash in shrunkKeyHashes:
+            self.merge(self.get_prefix_from_key_hash(keyHash=keyHash))
+        return results
+
+    def merge(self, prefix: int) -> None:
+        """Merge the bucket of the given prefix with its buddy bucket, as long as both have the
+        same local prefix size and their combined size does not exceed the merge threshold.
+        The buddy bucket is the bucket whose local prefix only differs in the last bit.
+        Afterwards, halve the directory while no bucket needs the full global prefix size.
+
+        :param prefix: A (global) prefix of the bucket to merge
+        """
+        mergeMaxSize: int = int(Bucket.get_env_bucket_max_size() * self.mergeThreshold)
+        while True:
+            bucket, _ = self.get_bucket(prefix=prefix)
+            localPrefixSize: int = bucket.localPrefixSize
+            if localPrefixSize <= 1:
+                break
+            buddyPrefix: int = prefix ^ (1 << (localPrefixSize - 1))
+            buddy, _ = self.get_bucket(prefix=buddyPrefix)
+            if buddy.localPrefixSize != localPrefixSize or len(bucket) + len(buddy) > mergeMaxSize:
+                break
+
+            # Keep the bucket whose local prefix ends with a 0, like the split does
+            keptPrefix, freedPrefix = (prefix, buddyPrefix) if prefix < buddyPrefix else (buddyPrefix, prefix)
+            freedBucket, _ = self.get_bucket(prefix=freedPrefix)
+            freedValues: List[BucketValue] = list(freedBucket.get_bucket_values())
+            # No bucket may be loaded between fetching the kept bucket and modifying it
+            keptBucket, keptWrapper = self.get_bucket(prefix=keptPrefix)
+            for bucketValue in freedValues:
+                keptBucket.insert(bucketValue)
+            keptBucket.set_local_prefix_size(localPrefixSize - 1)
+            self.bucketPool.mark_dirty(keptBucket.bucketID)
+
+            # Re-point the prefixes of the freed bucket
+            for ptr in range(get_hash_prefix_int(freedPrefix, localPrefixSize), len(self.bucketPointers), 1 << localPrefixSize):
+                self.set_bucket(ptr, keptWrapper)
+            self.release_bucket_ID(freedBucket.bucketID)
+
+            if localPrefixSize == self.globalHashPrefixSize:
+                self.shrink_directory()
+            prefix = get_hash_prefix_int(keptPrefix, self.globalHashPrefixSize)
+
+    def shrink_directory(self) -> None:
+        """Halve the directory while every bucket's local prefix size is smaller than the
+        global prefix size, being when both halves of the directory are identical.
+        """
+        while self.globalHashPrefixSize > 1:
+            half: int = len(self.bucketPointers) // 2
+            for ptr in range(half):
+                if self.bucketPointers[ptr] is not self.bucketPointers[ptr + half]:
+                    return
+            del self.bucketPointers[half:]
+            self.globalHashPrefixSize -= 1
 
     def split(self, bucketWrapper: BucketWrapper) -> None:
         """Perfom a split on the index for a given bucket.
@@ -460,44 +1301,39 @@ class ExtendibleHashingIndex(object):
         # TODO: \/ Buckets are stored in pages in memory???? \/
         bucket: Bucket = bucketWrapper.contents
         assert isinstance(bucket, Bucket), f"Can only split a bucket, not a '{bucket.__class__.__name__}' type"
-        assert bucket in self.bucketsInMemory, "Can only split a bucket that is in memory"
+        assert bucket.bucketID in self.bucketPool, "Can only split a bucket that is in memory"
         shouldIncreaseGlobal: bool = bucket.localPrefixSize == self.globalHashPrefixSize
 
         # if the global prefix length is smaller than the prefix length after a split, then we need to
         # update the global prefix length and increase its length with 1, for each entry.
+        # Each old prefix p is extended to p and p | (1 << global), which are
+        # exactly the directory indexes p and p + len(directory).
         if shouldIncreaseGlobal:
-            newBucketPointers: Dict[str: BucketWrapper] = dict()
-            for oldPrefix, oldBucketWrapper in self.bucketPointers.items():
-                newPrefix0, newPrefix1 = self.get_extended_prefixes(oldPrefix)
-                newBucketPointers[newPrefix0] = oldBucketWrapper
-                newBucketPointers[newPrefix1] = oldBucketWrapper
-            self.bucketPointers = newBucketPointers
+            self.bucketPointers = self.bucketPointers + self.bucketPointers
 
         res0, res1 = self.split_bucket(bucket)
         newBucket0, newBucketPrefix0 = res0
         newBucket1, newBucketPrefix1 = res1
 
+        # newBucket0 reuses the ID of the split bucket, so it replaces it in the buffer pool
         bucketWrapper.contents = newBucket0
-        self.bucketsInMemory[self.bucketsInMemory.index(bucket)] = newBucket0
+        self.bucketPool.add(bucketWrapper, dirty=True)
         bucketWrapper0: BucketWrapper = bucketWrapper
         bucketWrapper1: BucketWrapper = BucketWrapper(newBucket1)
+        self.bucketPool.add(bucketWrapper1, dirty=True)
 
 
-        # because we did a split, we need to update all related pointers
-        for ptr in self.bucketPointers.keys():
-            if ptr.startswith(newBucketPrefix0):
-                self.set_bucket(ptr, bucketWrapper0)
-            elif ptr.startswith(newBucketPrefix1):
-                self.set_bucket(ptr, bucketWrapper1)
+        # because we did a split, we need to update the related pointers. Only the
+        # 2^(global - local) directory entries of the split bucket are visited: those
+        # are the entries ending with its local prefix, one every 2^local entries.
+        # The entries of newBucketPrefix0 already refer to bucketWrapper0, the
+        # wrapper of the split bucket, so only those of newBucketPrefix1 change.
+        for ptr in range(newBucketPrefix1, len(self.bucketPointers), 1 << newBucket1.localPrefixSize):
+            self.set_bucket(ptr, bucketWrapper1)
 
         self.globalHashPrefixSize += shouldIncreaseGlobal
 
-        # Immediately write buckets to maintain
-        # sequential bucket file structure
-        self.write_bucket(newBucket0)
-        self.write_bucket(newBucket1)
-
-    def split_bucket(self, bucket: Bucket) -> Tuple[Tuple[Bucket, str], Tuple[Bucket, str]]:
+    def split_bucket(self, bucket: Bucket) -> Tuple[Tuple[Bucket, int], Tuple[Bucket, int]]:
         """Create two new buckets based on an "old" bucket.
         The two new buckets contain the bucket values of
         the old bucket. The old bucket is untouched.
@@ -510,16 +1346,16 @@ class ExtendibleHashingIndex(object):
 
         bucketValues = bucket.get_bucket_values()
         randomBucketHash = bucketValues[0].get_key()
-        bucketLocalPrefix = get_hash_prefix(randomBucketHash, bucket.localPrefixSize)
+        bucketLocalPrefix = get_hash_prefix_int(randomBucketHash, bucket.localPrefixSize)
 
-        newPrefix0, newPrefix1 = self.get_extended_prefixes(bucketLocalPrefix)
+        newPrefix0, newPrefix1 = self.get_extended_prefixes(bucketLocalPrefix, bucket.localPrefixSize)
 
-        new_bucket0 = Bucket(bucket.bucketID, local_prefix_size=bucket.localPrefixSize + 1)
-        new_bucket1 = Bucket(self.reserve_bucket_ID(), local_prefix_size=bucket.localPrefixSize + 1)
+        new_bucket0 = Bucket(bucket.bucketID, local_prefix_size=bucket.localPrefixSize + 1, key_len=self.keySize, value_len=self.valueSize)
+        new_bucket1 = Bucket(self.reserve_bucket_ID(), local_prefix_size=bucket.localPrefixSize + 1, key_len=self.keySize, value_len=self.valueSize)
 
         for _, bucketValueObj in enumerate(bucketValues):
             bucketKey = bucketValueObj.get_key()
-            keyHash = bucketKey[: len(newPrefix0)]
+            keyHash = get_hash_prefix_int(bucketKey, bucket.localPrefixSize + 1)
 
             if newPrefix0 == keyHash:
                 new_bucket0.insert(bucketValueObj)
@@ -530,15 +1366,18 @@ class ExtendibleHashingIndex(object):
 
         return (new_bucket0, newPrefix0), (new_bucket1, newPrefix1)
 
-    def get_extended_prefixes(self, prefix: str) -> Tuple[str, str]:
-        """Convert the prefix into two extended prefixes of one 'bit' longer.
+    def get_extended_prefixes(self, prefix: int, prefixSize: int) -> Tuple[int, int]:
+        """Convert the prefix into two extended prefixes of one bit longer.
+        The added bit is the bit at position *prefixSize*.
 
+        :param prefix: The prefix to extend
+        :param prefixSize: The current amount of bits in the prefix
         :return: (
-            prefix | '0',
-            prefix | '1'
+            prefix | 0 << prefixSize,
+            prefix | 1 << prefixSize
         )
         """
-        return prefix + '0', prefix + '1'
+        return prefix, prefix | (1 << prefixSize)
 
     def read_bucket(self, bucketID: int) -> Bucket:
         """Read a bucket from the bucket storage file.
@@ -546,43 +1385,31 @@ class ExtendibleHashingIndex(object):
         :param bucketID: The bucket ID of the bucket to read
         :return: A Bucket object constructed from the read bytes
         """
-        try:
-            with open(self.bucketsDataFileName, "rb") as f:
-                f.seek(self.bucketsFixedSize * bucketID)
-                bucketBytes: bytes = f.read(self.bucketsFixedSize)
-                
-                return Bucket.from_bytes(
-                    bucketBytes,
-                    BucketValue.get_env_bucketvalue_key_size(),
-                    BucketValue.get_env_bucketvalue_value_size()
-                )
-
-        except FileNotFoundError as e:
-            errorMsg = f"No such bucket storage file exists. At least one bucket write MUST happen before the first bucket read."
-            errorTxt = str(e) + "\n" + errorMsg
-            raise FileNotFoundError(errorTxt) from e
+        assert self.bucketsFile is not None, "Cannot read a bucket, the index was closed"
+        bucketBytes: bytes = read_at(self.bucketsFile, self.bucketsFixedSize, self.get_bucket_offset(bucketID))
+        if len(bucketBytes) != self.bucketsFixedSize:
+            raise ValueError(f"Bucket {bucketID} is not in the bucket storage file. A bucket MUST be written before it is read.")
+
+        return Bucket.from_bytes(bucketBytes, self.keySize, self.valueSize)
 
     def write_bucket(self, bucket: Bucket) -> None:
         """Write the bytes of the bucket to the bucket storage file.
 
         :param bucket: bucket object to write
         """
-        # Ensure file exists
-        open(self.bucketsDataFileName, 'a').close()
+        assert self.bucketsFile is not None, "Cannot write a bucket, the index was closed"
+        if bucket.get_bytes_size() > self.bucketsFixedSize:
+            raise ValueError("Bucket data size exceeds the specified record size.")
 
-        with open(self.bucketsDataFileName, "rb+") as file:
-            bucket_bytes = bytes(bucket)
+        # If the bucket data is smaller than the record size, the zeroed buffer pads it
+        padded_bucket_bytes: bytearray = bytearray(self.bucketsFixedSize)
+        bucket.pack_into(padded_bucket_bytes, 0)
 
-            if len(bucket_bytes) > self.bucketsFixedSize:
-                raise ValueError("Bucket data size exceeds the specified record size.")
-
-            # If the bucket data is smaller than the record size, pad it with zeros
-            padded_bucket_bytes = bucket_bytes + bytes([0] * (self.bucketsFixedSize - len(bucket_bytes)))
-
-            assert len(padded_bucket_bytes) == self.bucketsFixedSize, f"To write bucket bytes of incorrect size: got {len(padded_bucket_bytes)}, expected {self.bucketsFixedSize}"
-
-            file.seek(self.bucketsFixedSize * bucket.bucketID)
-            file.write(padded_bucket_bytes)
+        bucketOffset: int = self.get_bucket_offset(bucket.bucketID)
+        if self.directoryOffset is not None and bucketOffset + self.bucketsFixedSize > self.directoryOffset:
+            # a bucket reserved after the last flush, keep the directory of that flush after all reserved buckets
+            self.move_directory(self.get_bucket_offset(self.bucketsIDCounter))
+        write_at(self.bucketsFile, padded_bucket_bytes, bucketOffset)
 
     def getViolations(self, exitOnViolation: bool=True) -> List[str]:
         """Collect all violations of the ExtendibleHashingIndex against
@@ -594,19 +1421,20 @@ class ExtendibleHashingIndex(object):
         :return: A list of all violations
         """
         violations = []
-        for prefix, bucketWrapper in self.bucketPointers.items():
-            # A prefix is of the correct size
-            isLenCorrect = len(prefix) == self.globalHashPrefixSize
-            if not isLenCorrect:
-                violations.append(f"bad prefix length: found {len(prefix)}, expected {self.globalHashPrefixSize}")
-                if exitOnViolation:
-                    return violations
-
+        # The directory is of the correct size
+        isLenCorrect = len(self.bucketPointers) == 1 << self.globalHashPrefixSize
+        if not isLenCorrect:
+            violations.append(f"bad directory size: found {len(self.bucketPointers)}, expected {1 << self.globalHashPrefixSize}")
+            if exitOnViolation:
+                return violations
+
+        for prefix, bucketWrapper in enumerate(self.bucketPointers):
             element: BucketValue
             bucket: Bucket = bucketWrapper.contents if isinstance(bucketWrapper.contents, Bucket) else self.read_bucket(bucketWrapper.contents)
+            localPrefix: int = get_hash_prefix_int(prefix, bucket.localPrefixSize)
             for element in bucket.list:
-                if not element.key.startswith(prefix[0:bucket.localPrefixSize]):
-                    violations.append(f"incorrect prefix: {prefix[0:bucket.localPrefixSize]} for bucket element: {element.key} with bucket localPrefixSize = {bucket.localPrefixSize}")
+                if get_hash_prefix_int(element.key, bucket.localPrefixSize) != localPrefix:
+                    violations.append(f"incorrect prefix: {get_prefix_str(localPrefix, bucket.localPrefixSize)} for bucket element: {get_prefix_str(element.key, self.keySize * 8)} with bucket localPrefixSize = {bucket.localPrefixSize}")
                     if exitOnViolation:
                         return violations
 
@@ -628,18 +1456,18 @@ if __name__ == "__main__":
         hashed_key = eh.get_hash_from_key(key=key)
         eh.insert_keyval(hashed_key, value=value)
 
-        b0_prefix: str = "0"
-        b0: Bucket = eh.bucketPointers[b0_prefix]
+        b0_prefix: int = 0
+        b0: Bucket = eh.bucketPointers[b0_prefix].contents
 
-        eh.insert_keyval(hash_function_str(2), value=bytes([22] * BucketValue.get_env_bucketvalue_value_size()))
-        eh.insert_keyval(hash_function_str(4), value=bytes([44] * BucketValue.get_env_bucketvalue_value_size()))
+        eh.insert_keyval(2, value=bytes([22] * BucketValue.get_env_bucketvalue_value_size()))
+        eh.insert_keyval(4, value=bytes([44] * BucketValue.get_env_bucketvalue_value_size()))
 
         print(b0)
         print([int.from_bytes(v, 'big') for v in b0.get_bucket_values()])
         print([v for v in b0.list[0].get_value()])
 
         eh.write_bucket(b0)
-        eh.bucketPointers[b0_prefix] = b0.bucketID
+        eh.bucketPointers[b0_prefix].contents = b0.bucketID
         eh.read_bucket(b0.bucketID)
         b, _ = eh.get_bucket(b0_prefix)
         print(b)
@@ -662,9 +1490,9 @@ if __name__ == "__main__":
 
         print(eh.isValid())
         print(eh.getViolations(False))
-        print(len(eh.bucketPointers.keys()), "  (unique #prefixes)")
-        print(len(set([(b.contents if isinstance(b.contents, Bucket) else eh.read_bucket(b.contents)).bucketID for b in eh.bucketPointers.values()])), "  (unique #buckets)")
-        print(max([(b.contents if isinstance(b.contents, Bucket) else eh.read_bucket(b.contents)).bucketID for b in eh.bucketPointers.values()]), "  (largest Bucket ID)")
-        print(sum([len((b.contents if isinstance(b.contents, Bucket) else eh.read_bucket(b.contents)).list) for _, b in eh.bucketPointers.items()]), " (total bucket items)")
-        print(len([v for v in eh.bucketPointers.values() if isinstance(v.contents, Bucket)]), "(#buckets in-mem)")
+        print(len(eh.bucketPointers), "  (unique #prefixes)")
+        print(len(set([(b.contents if isinstance(b.contents, Bucket) else eh.read_bucket(b.contents)).bucketID for b in eh.bucketPointers])), "  (unique #buckets)")
+        print(max([(b.contents if isinstance(b.contents, Bucket) else eh.read_bucket(b.contents)).bucketID for b in eh.bucketPointers]), "  (largest Bucket ID)")
+        print(sum([len((b.contents if isinstance(b.contents, Bucket) else eh.read_bucket(b.contents)).list) for b in eh.bucketPointers]), " (total bucket items)")
+        print(len([v for v in eh.bucketPointers if isinstance(v.contents, Bucket)]), "(#buckets in-mem)")
 
@@ -0,0 +1,210 @@
+import struct
+from typing import List, Dict, Set, Union, Tuple, Iterator
+
+
+class MaxSegmentTree(object):
+    """A segment tree over a growable array of non-negative integers, that finds
+    the leftmost position holding a value of at least some minimum in O(log n).
+    """
+    def __init__(self, capacity: int = 1):
+        """MaxSegmentTree constructor. All values are initially 0.
+
+        :param capacity: The initial amount of positions, grows when needed
+        """
+        self.capacity: int = 1
+        while self.capacity < capacity:
+            self.capacity *= 2
+        # tree[1] is the root, the leaves are tree[capacity:]
+        self.tree: List[int] = [0] * (2 * self.capacity)
+
+    def __getitem__(self, position: int) -> int:
+        return self.tree[self.capacity + position] if position < self.capacity else 0
+
+    def grow(self, capacity: int) -> None:
+        """Grow the tree so that it has at least *capacity* positions.
+
+        :param capacity: The required amount of positions
+        """
+        if capacity <= self.capacity:
+            return
+        leaves: List[int] = self.tree[self.capacity:]
+        while self.capacity < capacity:
+            self.capacity *= 2
+        self.tree = [0] * self.capacity + leaves + [0] * (self.capacity - len(leaves))
+        for node in range(self.capacity - 1, 0, -1):
+            self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1])
+
+    def set(self, position: int, value: int) -> None:
+        """Set the value at a position.
+
+        :param position: The position to set
+        :param value: The new value
+        """
+        self.grow(position + 1)
+        node: int = self.capacity + position
+        self.tree[node] = value
+        node //= 2
+        while node >= 1:
+            new_max: int = max(self.tree[2 * node], self.tree[2 * node + 1])
+            if self.tree[node] == new_max:
+                break
+            self.tree[node] = new_max
+            node //= 2
+
+    def find_first(self, min_value: int, start: int = 0) -> Union[int, None]:
+        """Find the leftmost position at or after *start* with a value of at least *min_value*.
+
+        :param min_value: The minimum value
+        :param start: The first position to consider
+        :return: The position, None if there is no such position
+        """
+        if start >= self.capacity or self.tree[1] < min_value:
+            return None
+
+        # Walk up from the start leaf until a subtree to the right of the
+        # path contains a large enough value, then walk down into it.
+        node: int = self.capacity + start
+        if self.tree[node] >= min_value:
+            return start
+        while True:
+            # move to the next subtree that lies completely right of the current one
+            while node % 2 == 1:
+                node //= 2
+                if node == 0:
+                    return None
+            node += 1
+            if self.tree[node] >= min_value:
+                break
+        while node < self.capacity:
+            node = 2 * node if self.tree[2 * node] >= min_value else 2 * node + 1
+        return node - self.capacity
+
+
+class FreeSpaceMap(object):
+    """Keeps track of the amount of free bytes of every page in a database file,
+    and finds a page with enough free space in O(log pages).
+
+    Two placement policies are supported:
+        "first-fit": the page with the lowest page number that has enough free space
+        "best-fit": a page with the least free space that is still enough
+
+    First-fit uses a segment tree over the pages. Best-fit groups the pages by their
+    exact amount of free bytes (their free-byte class) and uses a segment tree over
+    the classes to find the smallest non-empty class that is large enough.
+
+    The map can be used like a dict from page number to free bytes, for page numbers
+    0 up to and including len(map).
+    """
+    POLICIES: Tuple[str, str] = ("first-fit", "best-fit")
+
+    def __init__(self, policy: str = "first-fit"):
+        """FreeSpaceMap constructor.
+
+        :param policy: The default placement policy, see FreeSpaceMap.POLICIES
+        """
+        assert policy in FreeSpaceMap.POLICIES, f"Unknown placement policy '{policy}', expected one of {FreeSpaceMap.POLICIES}"
+        self.policy: str = policy
+        self.free_space: List[int] = []
+        self.pages_tree: MaxSegmentTree = MaxSegmentTree()
+        # free bytes -> pages with exactly that many free bytes
+        self.free_space_classes: Dict[int, Set[int]] = dict()
+        # free bytes -> 1 if that class contains pages, else 0
+        self.classes_tree: MaxSegmentTree = MaxSegmentTree()
+
+    def __len__(self):
+        return len(self.free_space)
+
+    def __getitem__(self, page_number: int) -> int:
+        return self.free_space[page_number]
+
+    def __setitem__(self, page_number: int, free_bytes: int) -> None:
+        assert 0 <= page_number <= len(self.free_space), f"Pages must be added in order: cannot set page {page_number} of {len(self.free_space)} pages"
+        assert free_bytes >= 0, f"A page cannot have a negative amount of free space: page {page_number}, {free_bytes}B"
+
+        if page_number == len(self.free_space):
+            self.free_space.append(free_bytes)
+        else:
+            self.remove_from_class(page_number, self.free_space[page_number])
+            self.free_space[page_number] = free_bytes
+        self.add_to_class(page_number, free_bytes)
+        self.pages_tree.set(page_number, free_bytes)
+
+    def __contains__(self, page_number: int):
+        return 0 <= page_number < len(self.free_space)
+
+    def get(self, page_number: int, default: int = None) -> int:
+        return self.free_space[page_number] if page_number in self else default
+
+    def items(self) -> Iterator[Tuple[int, int]]:
+        return enumerate(self.free_space)
+
+    def clear(self) -> None:
+        self.free_space = []
+        self.pages_tree = MaxSegmentTree()
+        self.free_space_classes = dict()
+        self.classes_tree = MaxSegmentTree()
+
+    def truncate(self, page_count: int) -> None:
+        """Remove the pages from *page_count* on, e.g. after the end of the database file was cut off.
+
+        :param page_count: The amount of pages to keep
+        """
+        while len(self.free_space) > page_count:
+            page_number: int = len(self.free_space) - 1
+            self.remove_from_class(page_number, self.free_space.pop())
+            self.pages_tree.set(page_number, 0)
+
+    def add_to_class(self, page_number: int, free_bytes: int) -> None:
+        pages: Set[int] = self.free_space_classes.setdefault(free_bytes, set())
+        pages.add(page_number)
+        if len(pages) == 1:
+            self.classes_tree.set(free_bytes, 1)
+
+    def remove_from_class(self, page_number: int, free_bytes: int) -> None:
+        pages: Set[int] = self.free_space_classes[free_bytes]
+        pages.remove(page_number)
+        if not pages:
+            del self.free_space_classes[free_bytes]
+            self.classes_tree.set(free_bytes, 0)
+
+    def find_page(self, required_bytes: int, policy: str = None) -> Union[int, None]:
+        """Find a page with at least *required_bytes* free bytes.
+
+        :param required_bytes: The amount of free bytes needed
+        :param policy: The placement policy to use, defaults to the map's policy
+        :return: The page number, None if no page has enough free space
+        """
+        policy = self.policy if policy is None else policy
+        if policy == "first-fit":
+            return self.pages_tree.find_first(required_bytes)
+        assert policy == "best-fit", f"Unknown placement policy '{policy}'"
+        free_bytes: Union[int, None] = self.classes_tree.find_first(1, required_bytes)
+        if free_bytes is None:
+            return None
+        return next(iter(self.free_space_classes[free_bytes]))
+
+    def save(self, filename: str) -> None:
+        """Write the free space of every page to a file: the page count as an 8B
+        integer, followed by the free bytes of every page as a 4B integer.
+
+        :param filename: The file to write
+        """
+        with open(filename, "wb") as f:
+            f.write(struct.pack(f"<Q{len(self.free_space)}I", len(self.free_space), *self.free_space))
+
+    @classmethod
+    def load(cls, filename: str, policy: str = "first-fit") -> "FreeSpaceMap":
+        """Read a free space map that was written with FreeSpaceMap.save.
+
+        :param filename: The file to read
+        :param policy: The default placement policy of the map
+        :return: The free space map
+        """
+        free_space_map: FreeSpaceMap = cls(policy)
+        with open(filename, "rb") as f:
+            page_count: int = struct.unpack("<Q", f.read(8))[0]
+            data: bytes = f.read(4 * page_count)
+        assert len(data) == 4 * page_count, f"Truncated free space map file '{filename}'"
+        for page_number, free_bytes in enumerate(struct.unpack(f"<{page_count}I", data)):
+            free_space_map[page_number] = free_bytes
+        return free_space_map
@@ -0,0 +1,163 @@
+import os
+import struct
+import threading
+import zlib
+from typing import List, Tuple, Union, Iterator
+
+from extendible_hashing import read_at, write_at
+
+# The log file starts with a header of WAL_FILE_HEADER_SIZE bytes: magic, version
+WAL_FILE_MAGIC: bytes = b"WALX"
+WAL_FILE_VERSION: int = 1
+WAL_FILE_HEADER_FORMAT: str = "<4sH"
+WAL_FILE_HEADER_SIZE: int = 16
+
+# Every record starts with a header: payload size, CRC32 of the LSN and the payload, LSN
+WAL_RECORD_HEADER_STRUCT: struct.Struct = struct.Struct("<IIQ")
+
+
+class WriteAheadLog(object):
+    """An append-only log file of records, to redo changes that did not reach the data files before a crash.
+
+    Every record gets a log sequence number (LSN), which increases by 1 per record. Appended records are
+    buffered in memory until they are committed: WriteAheadLog.commit writes all buffered records at once
+    and forces them to disk with a single fsync (group commit). When several threads commit at the same
+    time, one of them writes the log while the others wait for it, and the records of the waiting threads
+    that were appended in the meantime are made durable by the same fsync.
+
+    A record is protected by a checksum, so that a record that was only partly written before a crash
+    is recognised. Reading the log stops at the first such record.
+    """
+    def __init__(self, filename: str):
+        """WriteAheadLog constructor. Opens the log file, or creates it if it does not exist yet.
+        The records that are in the file already are kept, see WriteAheadLog.records.
+
+        :param filename: The file name of the log file
+        """
+        self.filename: str = filename
+        self.file: Union[int, None] = os.open(filename, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0))
+
+        header: bytes = read_at(self.file, WAL_FILE_HEADER_SIZE, 0)
+        if len(header) < WAL_FILE_HEADER_SIZE:
+            # a new log file, or one of which the creation was interrupted
+            write_at(self.file, struct.pack(WAL_FILE_HEADER_FORMAT, WAL_FILE_MAGIC, WAL_FILE_VERSION).ljust(WAL_FILE_HEADER_SIZE, b"\0"), 0)
+            os.fsync(self.file)
+        else:
+            magic, version = struct.unpack_from(WAL_FILE_HEADER_FORMAT, header)
+            assert magic == WAL_FILE_MAGIC, f"'{filename}' is not a write-ahead log file"
+            assert version == WAL_FILE_VERSION, f"Unsupported write-ahead log version {version}"
+
+        # The file offset right after the last complete record
+        self.end: int = WAL_FILE_HEADER_SIZE
+        # The LSN of the last record that was appended and of the last record that is on disk
+        self.last_lsn: int = 0
+        self.durable_lsn: int = 0
+        for lsn, payload in self.records():
+            self.end += WAL_RECORD_HEADER_STRUCT.size + len(payload)
+            self.last_lsn = self.durable_lsn = lsn
+        # a partly written record at the end is overwritten by the next record
+        os.ftruncate(self.file, self.end)
+
+        # The records that were appended but not written yet
+        self.buffer: List[bytes] = []
+        # Whether a thread is writing the log, the other committing threads wait for it
+        self.is_writing: bool = False
+        self.lock: threading.Lock = threading.Lock()
+        self.written: threading.Condition = threading.Condition(self.lock)
+
+    @property
+    def is_empty(self) -> bool:
+        """Whether no record was appended since the log was created or reset."""
+        return self.end == WAL_FILE_HEADER_SIZE and not self.buffer
+
+    @property
+    def pending_count(self) -> int:
+        """The amount of appended records that are not committed yet."""
+        return len(self.buffer)
+
+    def append(self, payload: bytes) -> int:
+        """Add a record to the log. The record is only durable after it is committed.
+
+        :param payload: The contents of the record
+        :return: The LSN of the record, to pass to WriteAheadLog.commit
+        """
+        with self.lock:
+            self.last_lsn += 1
+            checksum: int = zlib.crc32(payload, zlib.crc32(self.last_lsn.to_bytes(8, 'little')))
+            self.buffer.append(WAL_RECORD_HEADER_STRUCT.pack(len(payload), checksum, self.last_lsn) + payload)
+            return self.last_lsn
+
+    def commit(self, lsn: int = None) -> None:
+        """Make the records up to an LSN durable: write the buffered records to the log file and fsync it,
+        unless another thread is already doing so, in which case that thread's fsync is awaited first.
+
+        :param lsn: The LSN of the last record that must be durable, defaults to the last appended record
+        """
+        with self.lock:
+            lsn = self.last_lsn if lsn is None else lsn
+            while self.durable_lsn < lsn:
+                if self.is_writing:
+                    self.written.wait()
+                    continue
+
+                # write all buffered records, including those of the threads that are waiting
+                records: bytes = b"".join(self.buffer)
+                last_lsn: int = self.last_lsn
+                end: int = self.end
+                self.buffer = []
+                self.is_writing = True
+                self.lock.release()
+                try:
+                    write_at(self.file, records, end)
+                    os.fsync(self.file)
+                finally:
+                    self.lock.acquire()
+                    self.is_writing = False
+                    self.written.notify_all()
+                self.end = end + len(records)
+                self.durable_lsn = last_lsn
+
+    def records(self) -> Iterator[Tuple[int, bytes]]:
+        """Read the committed records from the log file, in LSN order, up to the first incomplete record.
+
+        :return: generator of (LSN, payload) pairs
+        """
+        offset: int = WAL_FILE_HEADER_SIZE
+        previous_lsn: Union[int, None] = None
+        while True:
+            header: bytes = read_at(self.file, WAL_RECORD_HEADER_STRUCT.size, offset)
+            if len(header) < WAL_RECORD_HEADER_STRUCT.size:
+                return
+            size, checksum, lsn = WAL_RECORD_HEADER_STRUCT.unpack(header)
+            payload: bytes = read_at(self.file, size, offset + WAL_RECORD_HEADER_STRUCT.size)
+            if len(payload) < size or zlib.crc32(payload, zlib.crc32(lsn.to_bytes(8, 'little'))) != checksum:
+                return
+            if previous_lsn is not None and lsn != previous_lsn + 1:
+                return
+            yield lsn, payload
+            previous_lsn = lsn
+            offset += WAL_RECORD_HEADER_STRUCT.size + size
+
+    def reset(self) -> None:
+        """Remove all records from the log, after a checkpoint wrote their changes to the data files.
+        The buffered records are committed first. The LSNs keep increasing.
+        """
+        self.commit()
+        with self.lock:
+            os.ftruncate(self.file, WAL_FILE_HEADER_SIZE)
+            os.fsync(self.file)
+            self.end = WAL_FILE_HEADER_SIZE
+
+    def close(self) -> None:
+        """Commit the buffered records and close the log file. The log can no longer be used afterwards."""
+        if self.file is None:
+            return
+        self.commit()
+        os.close(self.file)
+        self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
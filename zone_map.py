@@ -0,0 +1,158 @@
+import struct
+from operator import eq, ne, lt, le, gt, ge
+from typing import List, Tuple, Union, Iterable, Dict, Callable
+
+import numpy as np
+
+
+class ZoneMaps(object):
+    """Keeps the minimum and maximum value of some integer columns for every page in a
+    database file (its zone map), so that scans can skip the pages that cannot contain
+    a tuple matching a predicate.
+
+    A page without tuples has a minimum above its maximum, so that it never matches.
+
+    Predicates are (column, operator, value) tuples, with an operator in ZoneMaps.OPERATORS.
+    """
+    # The supported operators and the function that applies each of them to a column and a value
+    OPERATORS: Dict[str, Callable] = {"==": eq, "!=": ne, "<": lt, "<=": le, ">": gt, ">=": ge}
+
+    # The minimum and maximum of a page without tuples
+    EMPTY_MIN: int = np.iinfo(np.int64).max
+    EMPTY_MAX: int = np.iinfo(np.int64).min
+
+    def __init__(self, columns: List[str]):
+        """ZoneMaps constructor, without pages.
+
+        :param columns: The names of the columns to keep a zone map of
+        """
+        self.columns: List[str] = list(columns)
+        self.page_count: int = 0
+        # page number x column, the rows from page_count on are unused
+        self.mins: np.ndarray = np.full((16, len(self.columns)), ZoneMaps.EMPTY_MIN, dtype=np.int64)
+        self.maxs: np.ndarray = np.full((16, len(self.columns)), ZoneMaps.EMPTY_MAX, dtype=np.int64)
+
+    def __len__(self):
+        return self.page_count
+
+    def __getitem__(self, page_number: int) -> Tuple[np.ndarray, np.ndarray]:
+        assert 0 <= page_number < self.page_count, f"Page {page_number} does not exist, there are {self.page_count} pages"
+        return self.mins[page_number], self.maxs[page_number]
+
+    def clear(self) -> None:
+        self.page_count = 0
+        self.mins[:] = ZoneMaps.EMPTY_MIN
+        self.maxs[:] = ZoneMaps.EMPTY_MAX
+
+    def add_pages(self, page_count: int) -> None:
+        """Add empty pages at the end.
+
+        :param page_count: The amount of pages to add
+        """
+        required: int = self.page_count + page_count
+        if required > len(self.mins):
+            capacity: int = max(required, 2 * len(self.mins))
+            self.mins = np.concatenate((self.mins, np.full((capacity - len(self.mins), len(self.columns)), ZoneMaps.EMPTY_MIN, dtype=np.int64)))
+            self.maxs = np.concatenate((self.maxs, np.full((capacity - len(self.maxs), len(self.columns)), ZoneMaps.EMPTY_MAX, dtype=np.int64)))
+        self.page_count = required
+
+    def truncate(self, page_count: int) -> None:
+        """Remove the pages from *page_count* on.
+
+        :param page_count: The amount of pages to keep
+        """
+        if page_count < self.page_count:
+            self.mins[page_count:self.page_count] = ZoneMaps.EMPTY_MIN
+            self.maxs[page_count:self.page_count] = ZoneMaps.EMPTY_MAX
+            self.page_count = page_count
+
+    def set_page(self, page_number: int, mins: Iterable[int], maxs: Iterable[int]) -> None:
+        """Replace the zone map of a page, for instance after a tuple was removed from it.
+
+        :param page_number: The index of the page, at most the current amount of pages
+        :param mins: The minimum of every column, in the order of ZoneMaps.columns
+        :param maxs: The maximum of every column, in the order of ZoneMaps.columns
+        """
+        if page_number == self.page_count:
+            self.add_pages(1)
+        assert 0 <= page_number < self.page_count, f"Pages must be added in order: cannot set page {page_number} of {self.page_count} pages"
+        self.mins[page_number] = list(mins)
+        self.maxs[page_number] = list(maxs)
+
+    def widen(self, page_number: int, values: Iterable[int]) -> None:
+        """Include the values of a tuple that was added to a page in the page's zone map.
+
+        :param page_number: The index of the page
+        :param values: The value of every column, in the order of ZoneMaps.columns
+        """
+        assert 0 <= page_number < self.page_count, f"Page {page_number} does not exist, there are {self.page_count} pages"
+        values = list(values)
+        np.minimum(self.mins[page_number], values, out=self.mins[page_number])
+        np.maximum(self.maxs[page_number], values, out=self.maxs[page_number])
+
+    def find_pages(self, predicates: List[Tuple[str, str, int]]) -> np.ndarray:
+        """Find the pages that may contain tuples matching all predicates.
+        Predicates on columns without a zone map do not exclude any page.
+
+        :param predicates: (column, operator, value) tuples
+        :return: numpy array with the page numbers, in increasing order
+        """
+        mins: np.ndarray = self.mins[:self.page_count]
+        maxs: np.ndarray = self.maxs[:self.page_count]
+        candidates: np.ndarray = mins[:, 0] <= maxs[:, 0] if self.columns else np.ones(self.page_count, dtype=bool)
+
+        for column, operator, value in predicates:
+            assert operator in ZoneMaps.OPERATORS, f"Unknown operator '{operator}', expected one of {list(ZoneMaps.OPERATORS)}"
+            if column not in self.columns:
+                continue
+            column_mins: np.ndarray = mins[:, self.columns.index(column)]
+            column_maxs: np.ndarray = maxs[:, self.columns.index(column)]
+            if operator == "==":
+                candidates &= (column_mins <= value) & (value <= column_maxs)
+            elif operator == "!=":
+                candidates &= (column_mins != value) | (column_maxs != value)
+            elif operator == "<":
+                candidates &= column_mins < value
+            elif operator == "<=":
+                candidates &= column_mins <= value
+            elif operator == ">":
+                candidates &= column_maxs > value
+            else:
+                candidates &= column_maxs >= value
+
+        return np.flatnonzero(candidates)
+
+    def save(self, filename: str) -> None:
+        """Write the zone maps to a file: the page count as an 8B integer and the column
+        count as a 1B integer, followed by the minimums and then the maximums of every
+        page as 8B integers.
+
+        :param filename: The file to write
+        """
+        with open(filename, "wb") as f:
+            f.write(struct.pack("<QB", self.page_count, len(self.columns)))
+            f.write(self.mins[:self.page_count].astype("<i8").tobytes())
+            f.write(self.maxs[:self.page_count].astype("<i8").tobytes())
+
+    @classmethod
+    def load(cls, filename: str, columns: List[str]) -> Union["ZoneMaps", None]:
+        """Read zone maps that were written with ZoneMaps.save.
+
+        :param filename: The file to read
+        :param columns: The names of the columns of the zone maps
+        :return: The zone maps, None if the file contains a different amount of columns
+        """
+        zone_maps: ZoneMaps = cls(columns)
+        with open(filename, "rb") as f:
+            page_count, column_count = struct.unpack("<QB", f.read(9))
+            if column_count != len(zone_maps.columns):
+                return None
+            size: int = page_count * column_count * 8
+            mins: bytes = f.read(size)
+            maxs: bytes = f.read(size)
+        assert len(mins) == len(maxs) == size, f"Truncated zone map file '{filename}'"
+
+        zone_maps.add_pages(page_count)
+        zone_maps.mins[:page_count] = np.frombuffer(mins, dtype="<i8").reshape(page_count, column_count)
+        zone_maps.maxs[:page_count] = np.frombuffer(maxs, dtype="<i8").reshape(page_count, column_count)
+        return zone_maps